@@ -0,0 +1,445 @@
+import json
+import datetime
+from dataset_query import QueryError, clean_column_names, parse_query
+from http_responses import cache_headers, etag_matches, not_modified, ok
+from lazy_import import lazy_import
+from response_cache import ResponseCache
+from s3_datasets import (
+    read_csv_selection,
+    read_parquet_table,
+    stat_dataset,
+    to_json,
+)
+
+# imported on the first aggregation, None if not installed
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+"""
+Aggregations and Chart Series of the Datasets
+
+Charting a long series, such as the yearly herd counts of 'cheptel-2010-2021', meant downloading
+every row of the dataset and aggregating it in the browser. The aggregation endpoint
+('getS3DataAggregate.py', '/aggregate' of 'router.py') computes it next to the data, with pandas,
+and returns only the result:
+- group by: '?by=region&agg=sum,mean&values=effectif', one row per group,
+- resampling over time: '?time=date&every=month&agg=sum', one row per period (day, week from
+  Monday, month, quarter or year) holding rows, combined with 'by' for one series per group,
+- downsampling: '?x=date&y=valeur&downsample=lttb&points=500', at most 'points' points of the
+  series for display, picked by Largest-Triangle-Three-Buckets (keeps the visual shape), or
+  'downsample=minmax' (the lowest and highest point of each bucket, keeps the peaks).
+'agg' is sum, mean or count (the number of rows), several separated by commas, sum by default.
+'values' are the columns aggregated, every numeric column but years by default. The rows are
+filtered as on the dataset endpoint ('filter.region=Rabat', 'filter.annee=2015..2020').
+
+The dataset is read from its Parquet copy when there is one, only the columns the request needs
+and the row groups its filters keep. Otherwise the CSV is read, and its text values parsed as
+numbers and dates. A time column may hold dates or years ('annee'). Either way, a column may be
+named as in the CSV ('Région') or as in the Parquet copy ('region'), and the response names the
+columns as the Parquet copy does ('typed=true'), so that it does not depend on the copy read.
+
+The response has the shape of a page of the dataset endpoint:
+    {"columns": ["region", "effectif_sum"], "rows": [["Rabat-Salé-Kénitra", 1520], ...],
+     "source": "parquet"}
+with "rows_in", the number of rows of the series, for a downsampling. Its size depends on the
+number of groups, periods or points, never on the size of the dataset: aggregations are refused
+beyond MAX_GROUPS rows, downsampling beyond MAX_POINTS points.
+
+Functions:
+- parse_aggregation(params): Reads the aggregation a request asks for.
+- aggregate(df, spec): Groups and resamples a frame.
+- lttb(x, y, points), minmax(y, points): The positions of the points a downsampling keeps.
+- downsample(df, spec): Downsamples a series of a frame.
+- aggregation_response(s3_client, theme, dataset, spec): The aggregation of a dataset, as JSON.
+- handle_aggregation(s3_client, theme, dataset, params, headers): The HTTP response of the
+  aggregation endpoint, shared by the handlers.
+"""
+
+AGGREGATIONS = ["sum", "mean", "count"]
+# pandas periods, weeks from Monday to Sunday
+PERIODS = {"day": "D", "week": "W-SUN", "month": "M", "quarter": "Q", "year": "Y"}
+DOWNSAMPLING = ["lttb", "minmax"]
+DEFAULT_POINTS = 500
+MAX_POINTS = 2000
+MAX_GROUPS = 1000
+SAMPLE_SIZE = 100  # values looked at to tell dates, years and numbers apart
+aggregation_cache = ResponseCache(max_bytes=16 * 1024 * 1024)
+
+
+def _names(params, name):
+    return [value for value in params.get(name, "").split(",") if value]
+
+
+def parse_aggregation(params):
+    """
+    Reads the aggregation or the downsampling a request asks for, see the module docstring.
+
+    :param params: The query string parameters.
+    :return: A {"by", "time", "every", "agg", "values", "x", "y", "downsample", "points",
+             "filters"} dict, the filters as in 'dataset_query.parse_query'.
+    :raises QueryError: If a parameter is missing or invalid.
+    """
+
+    if pd is None:
+        raise QueryError("aggregation is not available")
+    params = params or {}
+    spec = {
+        "by": _names(params, "by"),
+        "time": params.get("time"),
+        "every": params.get("every"),
+        "agg": _names(params, "agg") or ["sum"],
+        "values": _names(params, "values"),
+        "x": params.get("x"),
+        "y": params.get("y"),
+        "downsample": params.get("downsample"),
+        "points": DEFAULT_POINTS,
+    }
+    query = parse_query(params)
+    spec["filters"] = query["filters"] if query else []
+
+    if spec["downsample"] or spec["x"] or spec["y"]:
+        if spec["downsample"] not in DOWNSAMPLING:
+            raise QueryError(f"downsample must be one of: {', '.join(DOWNSAMPLING)}")
+        if not spec["x"] or not spec["y"]:
+            raise QueryError("x and y are required to downsample")
+        if spec["by"] or spec["every"]:
+            raise QueryError("downsample does not combine with by or every")
+        try:
+            spec["points"] = int(params.get("points", DEFAULT_POINTS))
+        except ValueError:
+            raise QueryError("points must be an integer")
+        if not 3 <= spec["points"] <= MAX_POINTS:
+            raise QueryError(f"points must be between 3 and {MAX_POINTS}")
+        return spec
+
+    if not spec["by"] and not spec["every"]:
+        raise QueryError("by, every or downsample is required")
+    if spec["every"] and spec["every"] not in PERIODS:
+        raise QueryError(f"every must be one of: {', '.join(PERIODS)}")
+    if spec["every"] and not spec["time"]:
+        raise QueryError("time is required with every")
+    unknown = [name for name in spec["agg"] if name not in AGGREGATIONS]
+    if unknown:
+        raise QueryError(f"agg must be among: {', '.join(AGGREGATIONS)}")
+    return spec
+
+
+def _columns(spec):
+    # the columns to read, None for every column ('values' defaults to the numeric ones)
+    if spec["downsample"]:
+        return list(dict.fromkeys([spec["x"], spec["y"]]))
+    if not spec["values"] and spec["agg"] != ["count"]:
+        return None
+    keys = spec["by"] + ([spec["time"]] if spec["every"] else [])
+    return list(dict.fromkeys(keys + spec["values"]))
+
+
+def _numbers(series):
+    # CSV text: spaces as thousands separators and decimal commas, as in 'normalize_frame'
+    if pd.api.types.is_numeric_dtype(series):
+        return series
+    text = series.astype("string").str.replace("[\\s\u00a0]", "", regex=True)
+    return pd.to_numeric(text.str.replace(",", "."), errors="coerce")
+
+
+def _years(numbers):
+    values = numbers.dropna()
+    return (
+        len(values) > 0
+        and bool((values % 1 == 0).all())
+        and bool(values.between(1000, 9999).all())
+    )
+
+
+def _kind(series):
+    # "datetime", "date" (objects), "years", "number" or "text", told from the first values
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "datetime"
+    sample = series.dropna().head(SAMPLE_SIZE)
+    if len(sample) == 0:
+        return "text"
+    if isinstance(sample.iloc[0], datetime.date):
+        return "date"
+    numbers = _numbers(sample)
+    if numbers.notna().all():
+        return "years" if _years(numbers) else "number"
+    return "text"
+
+
+def _times(series):
+    # dates, timestamps, or years ('annee': 2010, 2011, ...)
+    kind = _kind(series)
+    if kind == "datetime":
+        return series
+    if kind == "date":
+        return pd.to_datetime(series)
+    if kind == "years":
+        years = pd.DataFrame({"year": _numbers(series), "month": 1, "day": 1})
+        return pd.to_datetime(years, errors="coerce")
+    sample = series.dropna().head(SAMPLE_SIZE).astype(str)
+    if sample.str.match(r"\d{4}-\d{2}-\d{2}").all():
+        return pd.to_datetime(series, errors="coerce", format="ISO8601")
+    return pd.to_datetime(series, errors="coerce", dayfirst=True)
+
+
+def _axis(series):
+    # the x axis of a chart: numbers as they are, dates and years as timestamps
+    if _kind(series) == "number":
+        return _numbers(series)
+    return _times(series)
+
+
+def _json_rows(frame):
+    # NaN and NaT become null, timestamps ISO dates (with the time of day if any)
+    rows = []
+    for column in frame.columns:
+        series = frame[column]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            dates = (series.dropna() == series.dropna().dt.normalize()).all()
+            series = series.dt.strftime("%Y-%m-%d" if dates else "%Y-%m-%dT%H:%M:%S")
+        series = series.astype(object)
+        rows.append(series.where(series.notna(), None).tolist())
+    return [list(row) for row in zip(*rows)]
+
+
+def aggregate(df, spec):
+    """
+    Groups the rows of a frame by columns and/or time periods, and aggregates them.
+
+    :param df: The frame, read with the columns of the request.
+    :param spec: A dict returned by 'parse_aggregation'.
+    :return: A (columns, rows) tuple, one row per group, sorted by group.
+    :raises QueryError: If the result has more than MAX_GROUPS rows.
+    """
+
+    keys = list(spec["by"])
+    if spec["every"]:
+        # the start of the period of each row, grouped on like any column (no sort of the frame)
+        periods = _times(df[spec["time"]]).dt.to_period(PERIODS[spec["every"]])
+        keys.append(periods.dt.start_time.rename(spec["time"]))
+    excluded = set(spec["by"]) | {spec["time"]}
+    values = spec["values"] or [
+        column
+        for column in df.columns
+        # years ('annee') are no values to add up
+        if column not in excluded and _kind(df[column]) == "number"
+    ]
+    df = df.assign(**{column: _numbers(df[column]) for column in values})
+
+    groups = df.groupby(keys, sort=True, dropna=False)
+    results = []
+    for name in spec["agg"]:
+        if name == "count":
+            results.append(groups.size().rename("count"))
+        else:
+            result = groups[values].agg(name)
+            results.append(result.add_suffix(f"_{name}"))
+    frame = pd.concat(results, axis=1).reset_index()
+    if len(frame) > MAX_GROUPS:
+        raise QueryError(
+            f"{len(frame)} groups, at most {MAX_GROUPS}: filter the rows, "
+            "group by fewer columns or resample over longer periods"
+        )
+    return list(frame.columns), _json_rows(frame)
+
+
+def lttb(x, y, points):
+    """
+    Largest-Triangle-Three-Buckets: splits a series in 'points - 2' buckets and keeps, in each,
+    the point forming the largest triangle with the point kept in the previous bucket and the
+    mean of the next bucket, plus the first and last points.
+
+    :param x: The x values, a float array sorted in increasing order.
+    :param y: The y values, a float array of the same length.
+    :param points: The number of points to keep, at least 3.
+    :return: The positions of the points kept, increasing.
+    """
+
+    count = len(x)
+    if count <= points:
+        return np.arange(count)
+    edges = np.linspace(1, count - 1, points - 1).astype(int)
+    kept = np.empty(points, dtype=int)
+    kept[0], kept[-1] = 0, count - 1
+    previous = 0
+    for bucket in range(points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        after_end = edges[bucket + 2] if bucket + 2 < len(edges) else count
+        next_x, next_y = x[end:after_end].mean(), y[end:after_end].mean()
+        # twice the areas of the triangles (previous point, candidate, mean of the next bucket)
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(areas.argmax())
+        kept[bucket + 1] = previous
+    return kept
+
+
+def minmax(y, points):
+    """
+    Min/max bucketing: splits a series in 'points / 2' buckets and keeps the lowest and the
+    highest point of each.
+
+    :param y: The y values, a float array.
+    :param points: The number of points to keep, at most.
+    :return: The positions of the points kept, increasing.
+    """
+
+    count = len(y)
+    if count <= points:
+        return np.arange(count)
+    buckets = pd.Series(y).groupby(np.arange(count) * (points // 2) // count)
+    return np.unique(
+        np.concatenate(
+            [groups.to_numpy() for groups in (buckets.idxmin(), buckets.idxmax())]
+        )
+    )
+
+
+def downsample(df, spec):
+    """
+    Downsamples the series of two columns of a frame.
+
+    :param df: The frame, read with the x and y columns.
+    :param spec: A dict returned by 'parse_aggregation'.
+    :return: A (columns, rows, rows_in) tuple, rows_in the number of points of the series.
+    """
+
+    x_name, y_name = spec["x"], spec["y"]
+    frame = pd.DataFrame(
+        {x_name: _axis(df[x_name]), y_name: _numbers(df[y_name])}
+    ).dropna()
+    frame = frame.sort_values(x_name, kind="stable").reset_index(drop=True)
+
+    x_values = frame[x_name]
+    if pd.api.types.is_datetime64_any_dtype(x_values):
+        x_values = x_values.astype("int64")
+    x_values = x_values.to_numpy(dtype=float)
+    y_values = frame[y_name].to_numpy(dtype=float)
+    if spec["downsample"] == "lttb":
+        kept = lttb(x_values, y_values, spec["points"])
+    else:
+        kept = minmax(y_values, spec["points"])
+    return [x_name, y_name], _json_rows(frame.iloc[kept]), len(frame)
+
+
+def _resolve(spec, names):
+    # the request with its columns named as in the Parquet copy, whichever name it used
+    typed = clean_column_names(names)
+    lookup = dict(zip(typed, typed))
+    lookup.update(zip(names, typed))
+    unknown = []
+
+    def resolve(name):
+        if not name:
+            return name
+        found = lookup.get(name, lookup.get(clean_column_names([name])[0]))
+        if found is None:
+            unknown.append(name)
+        return found
+
+    resolved = dict(
+        spec,
+        by=[resolve(name) for name in spec["by"]],
+        time=resolve(spec["time"]),
+        values=[resolve(name) for name in spec["values"]],
+        x=resolve(spec["x"]),
+        y=resolve(spec["y"]),
+        filters=[(resolve(name), op, operand) for name, op, operand in spec["filters"]],
+    )
+    if unknown:
+        raise QueryError(f"unknown column: {', '.join(unknown)}")
+    if resolved["downsample"] and resolved["x"] == resolved["y"]:
+        raise QueryError("x and y must be different columns")
+    return resolved
+
+
+def _read_frame(s3_client, theme, dataset, meta, spec):
+    # the frame and the request, with the column names of the Parquet copy
+    resolved, typed_names = {}, {}
+
+    def query(names):
+        resolved.update(_resolve(spec, names))
+        typed_names.update(zip(names, clean_column_names(names)))
+        source_names = {typed: name for name, typed in typed_names.items()}
+        columns = _columns(resolved)
+        return {
+            "columns": columns and [source_names[name] for name in columns],
+            "filters": [
+                (source_names[name], op, operand)
+                for name, op, operand in resolved["filters"]
+            ],
+        }
+
+    if meta["source"] == "parquet":
+        table = read_parquet_table(s3_client, theme, dataset, query)
+        # dates as a datetime column, not 'datetime.date' objects
+        df = table.to_pandas(date_as_object=False)
+    else:
+
+        def frame(columns, rows):
+            return pd.DataFrame(list(rows), columns=columns)
+
+        df = read_csv_selection(s3_client, theme, dataset, query, frame)
+    return df.rename(columns=typed_names), resolved
+
+
+def aggregation_response(s3_client, theme, dataset, spec):
+    """
+    Aggregates or downsamples a dataset, through the warm-container cache.
+
+    :param s3_client: A boto3 S3 client.
+    :param theme: The theme of the dataset.
+    :param dataset: The name of the dataset, without extension.
+    :param spec: A dict returned by 'parse_aggregation'.
+    :return: A (response, hit) tuple, response being the 'stat_dataset' dict of the object read
+             with the JSON "body".
+    :raises s3_client.exceptions.NoSuchKey: If the dataset does not exist.
+    :raises QueryError: If the request does not fit the dataset.
+    """
+
+    def stat():
+        return stat_dataset(s3_client, theme, dataset, typed=True)
+
+    def load(meta):
+        df, resolved = _read_frame(s3_client, theme, dataset, meta, spec)
+        result = {"source": meta["source"]}
+        if resolved["downsample"]:
+            columns, rows, result["rows_in"] = downsample(df, resolved)
+        else:
+            columns, rows = aggregate(df, resolved)
+        body = to_json(dict(columns=columns, rows=rows, **result))
+        return dict(meta, body=body), len(body)
+
+    key = (theme, dataset, json.dumps(spec, sort_keys=True))
+    return aggregation_cache.get_or_load(key, stat, load)
+
+
+def handle_aggregation(s3_client, theme, dataset, params, headers):
+    """
+    Answers a request of the aggregation endpoint, whichever handler or route received it.
+
+    :param s3_client: A boto3 S3 client.
+    :param theme: The theme of the dataset.
+    :param dataset: The name of the dataset, without extension.
+    :param params: The query string parameters, see 'parse_aggregation'.
+    :param headers: The request headers, names lower-cased ('http_responses.request_headers').
+    :return: A Lambda proxy integration response: 200 or 304.
+    :raises s3_client.exceptions.NoSuchKey: If the dataset does not exist.
+    :raises QueryError: If a parameter is invalid, answered with a 400.
+    """
+
+    spec = parse_aggregation(params)
+
+    # computed next to the data, a few KB whatever the size of the dataset
+    response, hit = aggregation_response(s3_client, theme, dataset, spec)
+    response_headers = {
+        "Content-Type": "application/json",
+        "X-Data-Source": response["source"],
+        "X-Cache": "Hit" if hit else "Miss",
+        **cache_headers(response["etag"], response["last_modified"]),
+    }
+    if etag_matches(headers.get("if-none-match"), response["etag"]):
+        return not_modified(response_headers)
+    return ok(response["body"], response_headers, headers.get("accept-encoding"))
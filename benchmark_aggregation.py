@@ -0,0 +1,67 @@
+import time
+import argparse
+import pyarrow as pa
+from aggregation import aggregate, downsample, parse_aggregation
+from benchmark_formats import make_frame
+from s3_datasets import to_json
+
+"""
+Aggregation Benchmark for 'aggregation.py'
+
+Times the aggregations and downsamplings of the aggregation endpoint on synthetic datasets of
+growing size, as read from their Parquet copy, and compares the size of their responses with the
+whole dataset as JSON, what a chart used to download:
+- group by a column, with sum, mean and count,
+- resampling by month,
+- downsampling of the series to 500 points, LTTB and min/max.
+
+Usage:
+    python benchmark_aggregation.py
+    python benchmark_aggregation.py --rows 100000 1000000 --repeat 5
+"""
+
+REQUESTS = {
+    "group by": {"by": "region", "agg": "sum,mean,count", "values": "valeur"},
+    "monthly": {"time": "date", "every": "month", "agg": "mean", "values": "valeur"},
+    "lttb 500": {"x": "date", "y": "valeur", "downsample": "lttb", "points": "500"},
+    "minmax 500": {"x": "date", "y": "valeur", "downsample": "minmax", "points": "500"},
+}
+
+
+def run(df, spec):
+    if spec["downsample"]:
+        columns, rows, _ = downsample(df, spec)
+    else:
+        columns, rows = aggregate(df, spec)
+    return to_json({"columns": columns, "rows": rows})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregation benchmark")
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[100000, 1000000], help="dataset sizes"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement")
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'request':<11} {'ms':>8} {'KiB':>8} {'whole KiB':>10}")
+    for rows in args.rows:
+        frame = make_frame(rows)
+        whole = len(to_json([list(frame.columns)] + frame.values.tolist())) / 1024
+        # as read from the Parquet copy by the endpoint
+        df = pa.Table.from_pandas(frame).to_pandas(date_as_object=False)
+        for name, params in REQUESTS.items():
+            spec = parse_aggregation(params)
+            seconds = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                body = run(df, spec)
+                seconds.append(time.perf_counter() - start)
+            print(
+                f"{rows:>8} {name:<11} {min(seconds) * 1000:>8.1f} "
+                f"{len(body) / 1024:>8.1f} {whole:>10.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import os
+import time
+import argparse
+import tempfile
+import boto3
+from moto import mock_aws
+from benchmark_formats import make_frame
+from catalog import catalog_cache, write_catalogs
+from csv_index import write_index
+from dataset_batch import BATCH_WORKERS
+from s3_datasets import BUCKET_NAME, response_cache
+
+"""
+Batch Endpoint Benchmark
+
+Compares the load time of a dashboard showing every dataset of a theme, fetched:
+- one request per dataset, one after the other,
+- one request per dataset, over 6 connections at a time (what a browser opens to a host),
+- in one batch request ('getS3DataBatch.py').
+The bucket is mocked with 'moto', with '--datasets' synthetic datasets and their index and
+compressed copy, and every S3 call is delayed by '--s3-latency' ms, as from a Lambda function in
+the region of the bucket. Each request adds the round trip of the client to API Gateway, '--rtt'
+ms. The handler times are measured on cold caches; the load times are computed from them.
+
+Usage:
+    python benchmark_batch.py
+    python benchmark_batch.py --datasets 40 --rtt 150 --s3-latency 30
+"""
+
+THEME = "agriculture"
+CONNECTIONS = 6
+
+
+def prepare(directory, datasets, rows):
+    """
+    Writes the datasets of a theme, their companion files and the catalogs.
+
+    :return: The names of the datasets.
+    """
+
+    csv_dir = os.path.join(directory, "csv_data")
+    os.makedirs(os.path.join(csv_dir, THEME))
+    names, conversions = [], {}
+    for i in range(datasets):
+        names.append(f"dataset-{i}")
+        csv_path = os.path.join(csv_dir, THEME, f"{names[-1]}.csv")
+        make_frame(rows, seed=i).to_csv(csv_path, index=False)
+        write_index(csv_path, compress=True)
+        conversions[f"{THEME}/{names[-1]}.xlsx"] = {"outputs": [csv_path]}
+    write_catalogs(csv_dir, conversions, {})
+    return names
+
+
+def upload(s3_client, directory):
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            key = os.path.relpath(path, directory).replace(os.sep, "/")
+            extra = {"ContentEncoding": "gzip"} if key.endswith(".csv.gz") else {}
+            s3_client.upload_file(path, BUCKET_NAME, key, ExtraArgs=extra)
+
+
+def cold(handler, event):
+    response_cache.clear()
+    catalog_cache.clear()
+    start = time.perf_counter()
+    response = handler(event, None)
+    assert response["statusCode"] == 200, response
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch endpoint benchmark")
+    parser.add_argument(
+        "--datasets", type=int, default=20, help="datasets of the theme"
+    )
+    parser.add_argument("--rows", type=int, default=5000, help="rows per dataset")
+    parser.add_argument("--limit", type=int, default=100, help="rows per dataset shown")
+    parser.add_argument("--rtt", type=float, default=100, help="client round trip, ms")
+    parser.add_argument("--s3-latency", type=float, default=20, help="per S3 call, ms")
+    args = parser.parse_args()
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+    with tempfile.TemporaryDirectory() as directory, mock_aws():
+        names = prepare(directory, args.datasets, args.rows)
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(Bucket=BUCKET_NAME)
+        upload(s3_client, directory)
+
+        import getS3Data
+        import getS3DataBatch
+
+        delay = args.s3_latency / 1000
+        for client in (getS3Data.s3_client, getS3DataBatch.s3_client):
+            client.meta.events.register(
+                "before-call.s3", lambda **kwargs: time.sleep(delay)
+            )
+
+        paging = {"offset": "0", "limit": str(args.limit)}
+        singles = [
+            cold(
+                getS3Data.lambda_handler,
+                {"queryStringParameters": dict(paging, theme=THEME, dataset=name)},
+            )
+            for name in names
+        ]
+        batch = cold(
+            getS3DataBatch.lambda_handler,
+            {"queryStringParameters": dict(paging, theme=THEME)},
+        )
+
+    requests = [args.rtt + single for single in singles]
+    waves = [
+        max(requests[i : i + CONNECTIONS]) for i in range(0, len(requests), CONNECTIONS)
+    ]
+    print(
+        f"{args.datasets} datasets of {args.rows} rows, {args.limit} rows each, "
+        f"rtt {args.rtt:.0f} ms, S3 latency {args.s3_latency:.0f} ms"
+    )
+    print(f"{'fetch':<28} {'requests':>8} {'load ms':>9}")
+    print(f"{'one by one':<28} {len(requests):>8} {sum(requests):>9.0f}")
+    print(f"{f'{CONNECTIONS} connections':<28} {len(requests):>8} {sum(waves):>9.0f}")
+    print(f"{'batch':<28} {1:>8} {args.rtt + batch:>9.0f}")
+    print(
+        f"handler: {sum(singles) / len(singles):.0f} ms per dataset, "
+        f"{batch:.0f} ms for the batch ({BATCH_WORKERS} threads)"
+    )
+
+
+if __name__ == "__main__":
+    main()
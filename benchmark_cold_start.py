@@ -0,0 +1,219 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import importlib
+import statistics
+import subprocess
+
+"""
+Cold Start Benchmark for the Lambda Handlers
+
+A cold start runs the module of the handler (imports, S3 client) then its first invocation, which
+also fills the caches of the container. This script measures both, each in fresh Python processes,
+for the separate handlers and for the router ('router.py'):
+- import: the time to import the module of the handler, and the same with 'pyarrow' imported
+  eagerly, as the modules shared by the handlers did before 'lazy_import.py',
+- first/warm: the first invocation of each route and a second one, against a bucket mocked with
+  'moto' holding a synthetic dataset with all its companion files (index, compressed copy,
+  Parquet copy, profile, catalogs, search index).
+
+Every separate function pays its own import; the router pays it once for every route, and only
+the typed reads import 'pyarrow'. Times are medians of '--runs' processes. S3 is mocked, so the
+invocation times leave out the network and measure the CPU work of the handlers.
+
+Usage:
+    python benchmark_cold_start.py
+    python benchmark_cold_start.py --runs 9 --rows 20000
+"""
+
+THEME = "economie"
+NAME = "pib"
+HANDLERS = {
+    "getS3Data": ["dataset", "page", "typed"],
+    "getS3DataTheme": ["themes"],
+    "getS3DataStats": ["stats"],
+    "getS3DataSearch": ["search"],
+    "router": ["themes", "stats", "search", "dataset", "page", "typed"],
+}
+EAGER = ["pyarrow", "pyarrow.compute", "pyarrow.parquet"]
+
+
+def route_events():
+    dataset = {"theme": THEME, "dataset": NAME}
+    return {
+        "dataset": {"path": "/data", "queryStringParameters": dataset},
+        "page": {
+            "path": "/data",
+            "queryStringParameters": dict(dataset, offset="5000", limit="100"),
+        },
+        "typed": {
+            "path": "/data",
+            "queryStringParameters": dict(dataset, typed="true", limit="100"),
+        },
+        "themes": {"path": "/themes", "queryStringParameters": {"theme": THEME}},
+        "catalog": {"path": "/catalog", "queryStringParameters": None},
+        "stats": {"path": "/stats", "queryStringParameters": dataset},
+        "search": {"path": "/search", "queryStringParameters": {"q": "pib"}},
+    }
+
+
+def prepare(directory, rows):
+    """
+    Writes a dataset and its companion files as 'data_processor.py' does, in the layout of the
+    bucket.
+    """
+
+    from benchmark_formats import make_frame
+    from catalog import write_catalogs
+    from csv_index import write_index
+    from data_processor import normalize_frame
+    from dataset_profile import write_profile
+    from search_index import write_search_index
+
+    csv_dir = os.path.join(directory, "csv_data")
+    parquet_dir = os.path.join(directory, "parquet_data")
+    os.makedirs(os.path.join(csv_dir, THEME))
+    os.makedirs(os.path.join(parquet_dir, THEME))
+    csv_path = os.path.join(csv_dir, THEME, f"{NAME}.csv")
+    parquet_path = os.path.join(parquet_dir, THEME, f"{NAME}.parquet")
+
+    frame = make_frame(rows)
+    frame.to_csv(csv_path, index=False)
+    write_index(csv_path, compress=True)
+    typed = normalize_frame(frame)
+    typed.to_parquet(parquet_path, compression="zstd")
+    write_profile(csv_path, frame, typed)
+    write_catalogs(
+        csv_dir, {f"{THEME}/{NAME}.xlsx": {"outputs": [csv_path, parquet_path]}}, {}
+    )
+    write_search_index(csv_dir)
+
+
+def bucket_files(directory):
+    """
+    :return: The list of the (path, S3 key) of the files written by 'prepare'.
+    """
+
+    return [
+        (path, os.path.relpath(path, directory).replace(os.sep, "/"))
+        for root, _, names in os.walk(directory)
+        for path in (os.path.join(root, name) for name in names)
+    ]
+
+
+def _child_import(module, eager):
+    start = time.perf_counter()
+    for name in EAGER if eager else []:
+        importlib.import_module(name)
+    importlib.import_module(module)
+    return {"import": (time.perf_counter() - start) * 1000}
+
+
+def _child_invoke(module, directory):
+    import boto3
+    from moto import mock_aws
+
+    with mock_aws():
+        s3 = boto3.client("s3")
+        s3.create_bucket(Bucket="data-morocco")
+        for path, key in bucket_files(directory):
+            extra = {"ContentEncoding": "gzip"} if key.endswith(".csv.gz") else {}
+            s3.upload_file(path, "data-morocco", key, ExtraArgs=extra)
+
+        handler = importlib.import_module(module).lambda_handler
+        events = route_events()
+        times = {}
+        for route in HANDLERS[module]:
+            calls = []
+            for _ in range(2):
+                start = time.perf_counter()
+                response = handler(events[route], None)
+                calls.append((time.perf_counter() - start) * 1000)
+                assert response["statusCode"] == 200, (route, response)
+            times[route] = calls
+        return times
+
+
+def run_child(*arguments):
+    output = subprocess.run(
+        [sys.executable, __file__, "--child", *arguments],
+        check=True,
+        capture_output=True,
+        text=True,
+        env=dict(
+            os.environ,
+            AWS_DEFAULT_REGION=os.environ.get("AWS_DEFAULT_REGION", "us-east-1"),
+        ),
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start benchmark")
+    parser.add_argument("--runs", type=int, default=5, help="processes per measurement")
+    parser.add_argument("--rows", type=int, default=10000, help="rows of the dataset")
+    parser.add_argument("--child", nargs="+", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        kind, module, *rest = args.child
+        if kind == "import":
+            result = _child_import(module, rest == ["eager"])
+        else:
+            result = _child_invoke(module, rest[0])
+        print(json.dumps(result))
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        prepare(directory, args.rows)
+
+        imports, eager_imports = {}, {}
+        print(f"{'handler':<16} {'import ms':>10} {'eager pyarrow':>14}")
+        for module in HANDLERS:
+            imports[module] = statistics.median(
+                run_child("import", module)["import"] for _ in range(args.runs)
+            )
+            eager_imports[module] = statistics.median(
+                run_child("import", module, "eager")["import"] for _ in range(args.runs)
+            )
+            print(
+                f"{module:<16} {imports[module]:>10.1f} {eager_imports[module]:>14.1f}"
+            )
+
+        firsts = {}
+        print()
+        print(f"{'handler':<16} {'route':<8} {'first ms':>9} {'warm ms':>8}")
+        for module in HANDLERS:
+            runs = [run_child("invoke", module, directory) for _ in range(args.runs)]
+            for route in HANDLERS[module]:
+                first = statistics.median(run[route][0] for run in runs)
+                warm = statistics.median(run[route][1] for run in runs)
+                firsts[module, route] = first
+                print(f"{module:<16} {route:<8} {first:>9.1f} {warm:>8.1f}")
+
+        # the cold starts of every route: one per separate function, one for the router
+        separate = [module for module in HANDLERS if module != "router"]
+        calls = sum(
+            firsts[module, route] for module in separate for route in HANDLERS[module]
+        )
+        print()
+        print("cold starts to serve every route once:")
+        print(
+            f"  separate functions, eager pyarrow: "
+            f"{sum(eager_imports[module] for module in separate) + calls:.0f} ms"
+        )
+        print(
+            f"  separate functions, lazy pyarrow:  "
+            f"{sum(imports[module] for module in separate) + calls:.0f} ms"
+        )
+        print(
+            f"  router:                            "
+            f"{imports['router'] + sum(firsts['router', route] for route in HANDLERS['router']):.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import io
+import os
+import csv
+import gzip
+import json
+import time
+import argparse
+import tempfile
+from benchmark_formats import make_frame
+from csv_compression import gzip_path, member_range
+from csv_index import locate, write_index
+from http_responses import ok
+from s3_datasets import _csv_rows, to_json
+
+"""
+Compressed Storage Benchmark for the Dataset Endpoints
+
+Writes a synthetic dataset as 'data_processor.py' does, the CSV and its block compressed copy
+('csv_compression.py'), and compares what a handler transfers from S3 and spends, reading the CSV
+or the copy:
+- whole: the whole dataset as the legacy JSON list of rows,
+- csv+gzip: the whole CSV to a client accepting gzip, compressed by the handler from the CSV,
+  passed through as stored from the copy,
+- page: a page of 100 rows in the middle of the dataset, with a ranged request,
+- filter: the rows of one region, parsed as the object streams.
+
+The transfer time is the number of bytes over the S3 to Lambda bandwidth ('--bandwidth', in MB/s),
+the CPU time is measured, and the Lambda duration is their sum.
+
+Usage:
+    python benchmark_compression.py
+    python benchmark_compression.py --rows 10000 100000 --bandwidth 50
+"""
+
+
+def _whole(read):
+    def run():
+        data = read()
+        return to_json(list(csv.reader(data.decode("utf-8").split("\n"))))
+
+    return run
+
+
+def _filter(stream):
+    def run():
+        rows = _csv_rows(stream())
+        header = next(rows)
+        region = header.index("region")
+        return [row for row in rows if row[region] == "Souss"]
+
+    return run
+
+
+def scenarios(csv_path, index):
+    """
+    :return: A {(scenario, storage): (bytes transferred, function)} dict, the function doing the
+             CPU work of the handler on the bytes.
+    """
+
+    with open(csv_path, "rb") as file:
+        raw = file.read()
+    with open(gzip_path(csv_path), "rb") as file:
+        compressed = file.read()
+
+    offset = index["rows"] // 2
+    start, end, skip = locate(index, offset, 100)
+    members = index["gzip"]["members"]
+    first, last, trim = member_range(members, index["gzip"]["size"], start, end)
+
+    def raw_page():
+        rows = _csv_rows(io.BytesIO(raw[start : end + 1]))
+        return list(rows)[skip : skip + 100]
+
+    def compressed_page():
+        data = gzip.decompress(compressed[first : last + 1])[trim:][: end - start + 1]
+        return list(_csv_rows(io.BytesIO(data)))[skip : skip + 100]
+
+    return {
+        ("whole", "csv"): (len(raw), _whole(lambda: raw)),
+        ("whole", "gzip"): (
+            len(compressed),
+            _whole(lambda: gzip.decompress(compressed)),
+        ),
+        ("csv+gzip", "csv"): (
+            len(raw),
+            lambda: ok(raw.decode("utf-8"), {}, "gzip"),
+        ),
+        ("csv+gzip", "gzip"): (
+            len(compressed),
+            lambda: ok(compressed, {"Content-Encoding": "gzip"}, "gzip"),
+        ),
+        ("page", "csv"): (end - start + 1, raw_page),
+        ("page", "gzip"): (last - first + 1, compressed_page),
+        ("filter", "csv"): (len(raw), _filter(lambda: io.BytesIO(raw))),
+        ("filter", "gzip"): (
+            len(compressed),
+            _filter(lambda: gzip.GzipFile(fileobj=io.BytesIO(compressed))),
+        ),
+    }
+
+
+def measure(run, repeat):
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - start)
+    return min(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compressed storage benchmark")
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[10000, 100000], help="dataset sizes"
+    )
+    parser.add_argument(
+        "--bandwidth", type=float, default=80.0, help="S3 to Lambda MB/s"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in args.rows:
+            csv_path = os.path.join(directory, f"dataset-{rows}.csv")
+            make_frame(rows).to_csv(csv_path, index=False)
+            with open(write_index(csv_path, compress=True)) as file:
+                index = json.load(file)
+
+            size = os.path.getsize(csv_path)
+            compressed = os.path.getsize(gzip_path(csv_path))
+            with open(csv_path, "rb") as file:
+                whole = len(gzip.compress(file.read(), compresslevel=9))
+            print(
+                f"{rows} rows: CSV {size / 2**20:.2f} MiB, block gzip "
+                f"{compressed / 2**20:.2f} MiB ({size / compressed:.1f}x), single gzip "
+                f"stream {whole / 2**20:.2f} MiB"
+            )
+            print(
+                f"{'scenario':<10} {'storage':<8} {'KiB read':>10} {'transfer ms':>12} "
+                f"{'cpu ms':>8} {'duration ms':>12}"
+            )
+            for (scenario, storage), (transferred, run) in scenarios(
+                csv_path, index
+            ).items():
+                transfer = transferred / (args.bandwidth * 1e6) * 1000
+                cpu = measure(run, args.repeat) * 1000
+                print(
+                    f"{scenario:<10} {storage:<8} {transferred / 1024:>10.1f} "
+                    f"{transfer:>12.1f} {cpu:>8.1f} {transfer + cpu:>12.1f}"
+                )
+            print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import os
+import time
+import threading
+import argparse
+import tempfile
+import multiprocessing
+import numpy as np
+import pandas as pd
+from data_processor import python_calamine, read_workbook
+
+"""
+Excel Engine Benchmark for 'data_processor.py'
+
+Parses synthetic workbooks of increasing size with every Excel engine available and reports the
+parse time and the peak memory of each engine. The workbooks mimic the government files: a few
+thousand to tens of thousands of rows mixing integers, floats, text and dates, over two sheets.
+
+Each parse runs in a fresh process, so the memory of one engine does not leak into the next
+measurement. The memory reported is the peak growth of the resident set during the parse, sampled
+from '/proc/self/statm' (Linux only): it includes what the Rust and C readers allocate, which
+'tracemalloc' would not see.
+
+Usage:
+    python benchmark_excel_engines.py
+    python benchmark_excel_engines.py --rows 1000 10000 100000 --repeat 3
+
+Note:
+- "calamine" is only measured when 'python-calamine' is installed.
+- Only '.xlsx' workbooks are generated: pandas can no longer write '.xls'.
+"""
+
+ENGINES = ["openpyxl", "calamine"]
+
+
+def make_workbook(path, rows, seed=0):
+    """
+    Writes a two-sheet workbook of mixed columns.
+
+    :param path: The path of the '.xlsx' file.
+    :param rows: The number of rows of the first sheet. The second one has a tenth of them.
+    :return: None.
+    """
+
+    rng = np.random.default_rng(seed)
+    regions = np.array(
+        ["Casablanca-Settat", "Rabat-Salé-Kénitra", "Fès-Meknès", "Souss"]
+    )
+
+    def frame(n):
+        return pd.DataFrame(
+            {
+                "annee": rng.integers(2000, 2024, n),
+                "region": regions[rng.integers(0, len(regions), n)],
+                "province": [f"province-{i % 75}" for i in range(n)],
+                "valeur": rng.random(n) * 1e6,
+                "taux": rng.random(n),
+                "effectif": rng.integers(0, 100000, n),
+                "date": pd.Timestamp("2010-01-01")
+                + pd.to_timedelta(rng.integers(0, 5000, n), unit="D"),
+                "commentaire": [f"observation numéro {i}" for i in range(n)],
+            }
+        )
+
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        frame(rows).to_excel(writer, sheet_name="donnees", index=False)
+        frame(max(rows // 10, 1)).to_excel(writer, sheet_name="annexe", index=False)
+
+
+def _rss():
+    with open("/proc/self/statm") as file:
+        return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _parse(path, engine, queue):
+    before = _rss()
+    peak = [before]
+    parsing = threading.Event()
+    parsing.set()
+
+    def sample():
+        while parsing.is_set():
+            peak[0] = max(peak[0], _rss())
+            time.sleep(0.005)
+
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    start = time.perf_counter()
+    sheets, _ = read_workbook(path, engine)
+    elapsed = time.perf_counter() - start
+    parsing.clear()
+    sampler.join()
+
+    rows = sum(len(df) for df in sheets.values())
+    peak[0] = max(peak[0], _rss())
+    queue.put((elapsed, (peak[0] - before) / 2**20, rows))
+
+
+def measure(path, engine):
+    """
+    Parses a workbook with an engine in a fresh process.
+
+    :return: A (seconds, peak memory growth in MiB, rows read) tuple.
+    """
+
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_parse, args=(path, engine, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Excel engine benchmark")
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[1000, 10000, 50000], help="sheet sizes"
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="parses per measurement")
+    args = parser.parse_args()
+
+    engines = [e for e in ENGINES if e != "calamine" or python_calamine is not None]
+    print(f"{'rows':>8} {'engine':<10} {'seconds':>9} {'peak MiB':>9} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            path = os.path.join(tmp, f"synthetic-{rows}.xlsx")
+            make_workbook(path, rows)
+            timings = {}
+            for engine in engines:
+                runs = [measure(path, engine) for _ in range(args.repeat)]
+                seconds = min(run[0] for run in runs)
+                memory = max(run[1] for run in runs)
+                timings[engine] = seconds
+                speedup = timings[engines[0]] / seconds
+                print(
+                    f"{rows:>8} {engine:<10} {seconds:>9.3f} {memory:>9.1f} {speedup:>7.1f}x"
+                )
+
+
+if __name__ == "__main__":
+    main()
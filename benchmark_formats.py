@@ -0,0 +1,150 @@
+import io
+import csv
+import gzip
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from dataset_formats import rows_to_table, to_arrow, to_csv, to_ndjson
+from s3_datasets import _csv_rows, _json_default, _table_rows, to_json
+
+"""
+Response Format Benchmark for the Dataset Endpoints
+
+Serializes a synthetic dataset in every response format of the dataset endpoints and reports the
+time it takes and the size of the payload, as sent and gzip compressed. The dataset mimics the
+government files: years, regions, provinces, amounts, rates and dates.
+
+Each measurement starts from the bytes of the object, as downloaded from S3, and ends with the
+response body, so the parsing is counted:
+- CSV source ('typed' off): the legacy JSON list of lists, the CSV passthrough, NDJSON and Arrow,
+- Parquet source ('typed=true'): JSON, NDJSON and Arrow.
+
+Usage:
+    python benchmark_formats.py
+    python benchmark_formats.py --rows 10000 100000 --repeat 3
+"""
+
+
+def make_frame(rows, seed=0):
+    """
+    :param rows: The number of rows.
+    :return: A DataFrame of mixed columns.
+    """
+
+    rng = np.random.default_rng(seed)
+    regions = np.array(
+        ["Casablanca-Settat", "Rabat-Salé-Kénitra", "Fès-Meknès", "Souss"]
+    )
+    return pd.DataFrame(
+        {
+            "annee": rng.integers(2000, 2024, rows),
+            "region": regions[rng.integers(0, len(regions), rows)],
+            "province": [f"province-{i % 75}" for i in range(rows)],
+            "valeur": np.round(rng.random(rows) * 1e6, 2),
+            "taux": np.round(rng.random(rows), 4),
+            "date": (
+                pd.Timestamp("2010-01-01")
+                + pd.to_timedelta(rng.integers(0, 5000, rows), unit="D")
+            ).date,
+        }
+    )
+
+
+def _csv_reader(data):
+    return _csv_rows(io.BytesIO(data))
+
+
+def csv_serializers(data):
+    def legacy_json():
+        return to_json(list(csv.reader(data.decode("utf-8").split("\n"))))
+
+    def ndjson():
+        rows = _csv_reader(data)
+        return "".join(to_ndjson(next(rows), rows))
+
+    def arrow():
+        rows = _csv_reader(data)
+        return to_arrow(rows_to_table(next(rows), rows))
+
+    return {
+        "json": legacy_json,
+        "csv": lambda: data.decode("utf-8"),
+        "ndjson": ndjson,
+        "arrow": arrow,
+    }
+
+
+def parquet_serializers(data):
+    def table():
+        return pq.read_table(io.BytesIO(data))
+
+    def typed_json():
+        decoded = table()
+        return to_json([decoded.column_names] + _table_rows(decoded))
+
+    def ndjson():
+        decoded = table()
+        return "".join(
+            to_ndjson(decoded.column_names, _table_rows(decoded), _json_default)
+        )
+
+    def csv_text():
+        decoded = table()
+        return to_csv(decoded.column_names, _table_rows(decoded))
+
+    return {
+        "json": typed_json,
+        "csv": csv_text,
+        "ndjson": ndjson,
+        "arrow": lambda: to_arrow(table()),
+    }
+
+
+def measure(serialize, repeat):
+    """
+    :return: A (seconds, payload bytes, gzip bytes) tuple, the time being the best of 'repeat'.
+    """
+
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = serialize()
+        seconds.append(time.perf_counter() - start)
+    payload = body if isinstance(body, bytes) else body.encode("utf-8")
+    return min(seconds), len(payload), len(gzip.compress(payload, compresslevel=6))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Response format benchmark")
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[10000, 100000], help="dataset sizes"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement")
+    args = parser.parse_args()
+
+    print(
+        f"{'rows':>8} {'source':<8} {'format':<7} {'seconds':>9} {'MiB':>8} {'gzip MiB':>9}"
+    )
+    for rows in args.rows:
+        frame = make_frame(rows)
+        csv_data = frame.to_csv(index=False).encode("utf-8")
+        parquet = io.BytesIO()
+        frame.to_parquet(parquet, compression="zstd")
+
+        sources = [
+            ("csv", csv_serializers(csv_data)),
+            ("parquet", parquet_serializers(parquet.getvalue())),
+        ]
+        for source, serializers in sources:
+            for name, serialize in serializers.items():
+                seconds, size, compressed = measure(serialize, args.repeat)
+                print(
+                    f"{rows:>8} {source:<8} {name:<7} {seconds:>9.3f} "
+                    f"{size / 2**20:>8.2f} {compressed / 2**20:>9.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
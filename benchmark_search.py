@@ -0,0 +1,144 @@
+import gzip
+import json
+import time
+import random
+import argparse
+import statistics
+from search_index import SearchIndex, build_search_index
+
+"""
+Search Benchmark for 'search_index.py'
+
+Builds the search index of a synthetic catalog, 100k datasets by default, and reports the build
+time, the size of the '_search.json.gz' artifact, the time a cold container takes to load it, and
+the latency of queries of every kind: one word, several words, a prefix being typed, Arabic text,
+a tag filter.
+
+The catalog mimics the one of data.gov.ma: French and Arabic titles drawn from a vocabulary of
+public statistics, a few tags per dataset, and column headers.
+
+Usage:
+    python benchmark_search.py
+    python benchmark_search.py --datasets 10000 100000 --queries 500
+"""
+
+WORDS = [
+    *[
+        "population",
+        "recensement",
+        "économie",
+        "éducation",
+        "santé",
+        "emploi",
+        "chômage",
+    ],
+    *["budget", "dépenses", "recettes", "agriculture", "pêche", "tourisme", "énergie"],
+    *["transport", "routes", "ports", "aéroports", "eau", "électricité", "logement"],
+    *[
+        "région",
+        "province",
+        "commune",
+        "établissements",
+        "élèves",
+        "hôpitaux",
+        "médecins",
+    ],
+    *[
+        "naissances",
+        "décès",
+        "mariages",
+        "importations",
+        "exportations",
+        "prix",
+        "indice",
+    ],
+    *["السكان", "الإحصاءات", "التعليم", "الصحة", "الفلاحة", "الميزانية", "الجهة"],
+]
+THEMES = ["economie", "education", "sante", "agriculture", "transport", "finances"]
+COLUMNS = ["annee", "region", "province", "valeur", "taux", "effectif", "commune"]
+
+
+def make_catalog(count, seed=0):
+    """
+    :param count: The number of datasets.
+    :return: A list of catalog entries with their "Theme" and "ColumnNames".
+    """
+
+    rng = random.Random(seed)
+    # a long tail of rare words, as in real titles (place names, years, ...)
+    rare = [f"{rng.choice(WORDS)[:4]}{i}" for i in range(count // 5)]
+    entries = []
+    for i in range(count):
+        title = " ".join(
+            rng.sample(WORDS, 3) + [rng.choice(rare), str(rng.randint(1990, 2023))]
+        )
+        entries.append(
+            {
+                "Theme": rng.choice(THEMES),
+                "Name": f"dataset-{i}",
+                "Title": title,
+                "Tags": rng.sample(WORDS, rng.randint(1, 4)),
+                "ColumnNames": rng.sample(COLUMNS, rng.randint(2, 6)),
+            }
+        )
+    return entries
+
+
+def _queries(rng, count):
+    kinds = {
+        "one word": lambda: {"query": rng.choice(WORDS)},
+        "two words": lambda: {"query": " ".join(rng.sample(WORDS, 2))},
+        "prefix": lambda: {"query": f"{rng.choice(WORDS)} {rng.choice(WORDS)[:3]}"},
+        "arabic": lambda: {"query": rng.choice(WORDS[-7:]).replace("إ", "ا")},
+        "tag": lambda: {"tag": rng.choice(WORDS)},
+        "word + theme": lambda: {
+            "query": rng.choice(WORDS),
+            "theme": rng.choice(THEMES),
+        },
+    }
+    return {kind: [make() for _ in range(count)] for kind, make in kinds.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search index benchmark")
+    parser.add_argument(
+        "--datasets", type=int, nargs="+", default=[100000], help="catalog sizes"
+    )
+    parser.add_argument("--queries", type=int, default=200, help="queries per kind")
+    args = parser.parse_args()
+
+    for count in args.datasets:
+        entries = make_catalog(count)
+
+        start = time.perf_counter()
+        index = build_search_index(entries)
+        data = json.dumps(index, separators=(",", ":"), ensure_ascii=False)
+        artifact = gzip.compress(data.encode("utf-8"))
+        build_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        search_index = SearchIndex.loads(artifact)
+        load_seconds = time.perf_counter() - start
+
+        print(
+            f"{count} datasets: build {build_seconds:.2f}s, "
+            f"artifact {len(artifact) / 2**20:.1f} MiB, load {load_seconds:.2f}s, "
+            f"{len(index['postings'])} tokens"
+        )
+        print(f"{'query':<14} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+        for kind, queries in _queries(random.Random(1), args.queries).items():
+            timings = []
+            for query in queries:
+                start = time.perf_counter()
+                search_index.search(**query)
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            p95 = timings[int(len(timings) * 0.95) - 1]
+            print(
+                f"{kind:<14} {statistics.median(timings):>8.2f} {p95:>8.2f} "
+                f"{timings[-1]:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+import os
+import json
+import hashlib
+import datetime
+from csv_compression import GZIP_SUFFIX, gzip_path
+from csv_index import build_index, index_path
+from http_responses import cache_headers, etag_matches, not_modified, ok
+from lazy_import import lazy_import
+from response_cache import ResponseCache
+from s3_datasets import BUCKET_NAME, CSV_PREFIX, head_object
+
+# only used to build the catalogs, not by the handlers serving them
+data_uploader = lazy_import("data_uploader")
+
+"""
+Catalog of the Datasets
+
+The theme endpoint used to list the bucket on every request: one 'list_objects_v2' call, cut off
+after 1000 keys, returning the name, size and date of each CSV. This module precomputes, after the
+conversion, a compact index of the datasets, uploaded with them:
+- 'csv_data/<theme>/_catalog.json': the datasets of a theme,
+- 'csv_data/_catalog.json': every dataset, with its "Theme".
+
+Each dataset is described by:
+    {
+        "Name": "population-2014",        # the CSV name, as in the dataset endpoints
+        "LastModified": "2024-01-31T10:00:00Z",
+        "Size": 123456,                   # bytes of the CSV
+        "ETag": "\"9a0364b9e99bb480dd25e1f0284c8555\"",
+        "Rows": 1520, "Columns": 12,      # from the row offset index of the CSV
+        "Typed": true,                    # has a Parquet copy ('typed=true')
+        "Title": "...", "Tags": [...], "PageUrl": "...", "SourceUrl": "...",
+    }
+"Name", "LastModified" and "Size" are those the endpoint returned before. The title, tags and
+URLs were scraped by the harvest and come from its manifest ('manifest.py'). "ETag" is the one S3
+gives the compressed copy of the CSV, '<name>.csv.gz', once uploaded by 'data_uploader.py' (in
+parts above its MULTIPART_THRESHOLD): the object the dataset endpoint serves, and the ETag of its
+responses without 'typed=true'. A CSV without compressed copy has no "ETag", the uploader writes
+its own.
+
+The catalog endpoint serves these files with a single 'get_object', kept in memory by warm
+containers and revalidated with a 'head_object' of the catalog (see 'response_cache.py'). Without
+a catalog, it falls back to listing the bucket, with every page of the listing.
+
+Functions:
+- catalog_path(csv_dir, theme), catalog_key(theme): Where a catalog is written and served from.
+- build_catalogs(csv_dir, conversions, manifest_entries): The catalog entries of every theme.
+- write_catalogs(csv_dir, conversions, manifest_entries): Builds and writes the catalogs.
+- list_datasets(s3_client, theme): Lists the CSV of the bucket, the fallback.
+- catalog_response(s3_client, theme): The catalog of a theme, or of every theme, as JSON.
+- handle_catalog(s3_client, theme, headers): The HTTP response of the catalog endpoint, shared by
+  the handlers.
+"""
+
+CATALOG_FILENAME = "_catalog.json"
+catalog_cache = ResponseCache(max_bytes=16 * 1024 * 1024)
+
+
+def catalog_path(csv_dir, theme=None):
+    """
+    :return: The path of the catalog of a theme, or of the global catalog without theme.
+    """
+
+    if theme is None:
+        return os.path.join(csv_dir, CATALOG_FILENAME)
+    return os.path.join(csv_dir, theme, CATALOG_FILENAME)
+
+
+def catalog_key(theme=None):
+    """
+    :return: The S3 key of the catalog of a theme, or of the global catalog without theme.
+    """
+
+    if theme is None:
+        return f"{CSV_PREFIX}/{CATALOG_FILENAME}"
+    return f"{CSV_PREFIX}/{theme}/{CATALOG_FILENAME}"
+
+
+def _iso(timestamp):
+    moment = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path) as file:
+        return json.load(file)
+
+
+def _catalog_entry(csv_path, typed, metadata, source_url):
+    stat = os.stat(csv_path)
+    entry = {
+        "Name": os.path.basename(csv_path)[: -len(".csv")],
+        "LastModified": _iso(stat.st_mtime),
+        "Size": stat.st_size,
+    }
+    # the object served, a third to a quarter of the CSV to hash
+    if os.path.exists(gzip_path(csv_path)):
+        entry["ETag"] = data_uploader.s3_etag(gzip_path(csv_path))
+
+    index = _read_json(index_path(csv_path), None) or build_index(csv_path)
+    entry["Rows"] = index["rows"]
+    entry["Columns"] = len(index["columns"])
+    entry["Typed"] = typed
+    entry["Title"] = metadata.get("title")
+    entry["Tags"] = metadata.get("tags", [])
+    entry["PageUrl"] = metadata.get("page_url")
+    entry["SourceUrl"] = source_url
+    return entry
+
+
+def build_catalogs(csv_dir, conversions, manifest_entries):
+    """
+    Describes every CSV of the conversions.
+
+    :param csv_dir: The directory of the CSV files, one folder per theme.
+    :param conversions: The conversions record of 'data_processor.py', {'<theme>/<file>':
+                        {"outputs": [...], ...}}.
+    :param manifest_entries: The entries of the harvest manifest, keyed the same way.
+    :return: A {theme: [entries]} dict, entries sorted by name.
+    """
+
+    catalogs = {}
+    for key, conversion in sorted(conversions.items()):
+        theme = key.split("/", 1)[0]
+        outputs = conversion.get("outputs") or []
+        manifest_entry = manifest_entries.get(key, {})
+        for path in outputs:
+            # the conversions may come from another CSV directory
+            csv_path = os.path.join(csv_dir, theme, os.path.basename(path))
+            if not path.endswith(".csv") or not os.path.exists(csv_path):
+                continue
+            typed = any(output.endswith(".parquet") for output in outputs)
+            catalogs.setdefault(theme, []).append(
+                _catalog_entry(
+                    csv_path,
+                    typed,
+                    manifest_entry.get("metadata") or {},
+                    manifest_entry.get("url"),
+                )
+            )
+
+    for entries in catalogs.values():
+        entries.sort(key=lambda entry: entry["Name"])
+    return catalogs
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(data, file, separators=(",", ":"), ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def write_catalogs(csv_dir, conversions, manifest_entries):
+    """
+    Builds the catalogs and writes them in the CSV directory, one per theme and a global one.
+
+    :return: The list of the paths written.
+    """
+
+    catalogs = build_catalogs(csv_dir, conversions, manifest_entries)
+    paths = []
+    for theme, entries in catalogs.items():
+        paths.append(catalog_path(csv_dir, theme))
+        _write_json(paths[-1], entries)
+
+    every = [
+        dict(entry, Theme=theme)
+        for theme, entries in sorted(catalogs.items())
+        for entry in entries
+    ]
+    paths.append(catalog_path(csv_dir))
+    _write_json(paths[-1], every)
+    return paths
+
+
+def list_datasets(s3_client, theme=None):
+    """
+    Lists the CSV files of the bucket, when there is no catalog. The ETag is that of the
+    '.csv.gz' copy when there is one, the object served. A dataset uploaded compressed only is
+    listed with its '.csv.gz' object.
+
+    :param theme: The theme to list, every theme if None.
+    :return: A list of {"Name", "LastModified", "Size", "ETag"} dicts, with the "Theme" without
+             theme.
+    """
+
+    prefix = f"{CSV_PREFIX}/" if theme is None else f"{CSV_PREFIX}/{theme}/"
+    datasets = {}
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=BUCKET_NAME, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            key = obj["Key"]
+            csv_path = key[: -len(GZIP_SUFFIX)] if key.endswith(GZIP_SUFFIX) else key
+            # skip the sidecar files (row offset indexes, catalogs, ...)
+            if not csv_path.endswith(".csv"):
+                continue
+            if key != csv_path and csv_path in datasets:
+                # the compressed copy, only listed when the CSV was not uploaded
+                datasets[csv_path]["ETag"] = obj["ETag"]
+                continue
+            last_modified = obj["LastModified"].astimezone(datetime.timezone.utc)
+            dataset = {
+                "Name": csv_path.rsplit("/", 1)[-1][: -len(".csv")],
+                "LastModified": last_modified.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "Size": obj["Size"],
+                "ETag": obj["ETag"],
+            }
+            if theme is None:
+                dataset["Theme"] = key.split("/")[1]
+            datasets[csv_path] = dataset
+    return [datasets[csv_path] for csv_path in sorted(datasets)]
+
+
+def _listing_response(s3_client, theme):
+    datasets = list_datasets(s3_client, theme)
+    # the listing has no S3 object of its own: its ETag is a digest of the ETags it lists
+    digest = hashlib.md5()
+    for dataset in datasets:
+        digest.update(f"{dataset['Name']}:{dataset['ETag']};".encode("utf-8"))
+    newest = max((dataset["LastModified"] for dataset in datasets), default=None)
+    return {
+        "body": json.dumps(datasets),
+        "etag": f'"{digest.hexdigest()}"',
+        "last_modified": (
+            datetime.datetime.strptime(newest, "%Y-%m-%dT%H:%M:%SZ").replace(
+                tzinfo=datetime.timezone.utc
+            )
+            if newest
+            else None
+        ),
+        "source": "listing",
+    }
+
+
+def catalog_response(s3_client, theme=None):
+    """
+    Reads the catalog of a theme, or the global catalog, through the warm-container cache.
+    Falls back to listing the bucket when the catalog was not uploaded.
+
+    :param s3_client: A boto3 S3 client.
+    :param theme: The theme, or None for every theme.
+    :return: A (response, hit) tuple, response being a {"body", "etag", "last_modified",
+             "source"} dict, source "catalog" or "listing".
+    """
+
+    key = catalog_key(theme)
+
+    def stat():
+        response = head_object(s3_client, key)
+        if response is None:
+            return {"etag": None}
+        return {"etag": response["ETag"], "last_modified": response["LastModified"]}
+
+    def load(meta):
+        if meta["etag"] is None:
+            # not cached: a listing cannot be revalidated without listing again
+            return _listing_response(s3_client, theme), float("inf")
+        data = s3_client.get_object(Bucket=BUCKET_NAME, Key=key)["Body"].read()
+        body = data.decode("utf-8")
+        response = dict(meta, body=body, source="catalog")
+        return response, len(data)
+
+    return catalog_cache.get_or_load((theme,), stat, load)
+
+
+def handle_catalog(s3_client, theme, headers):
+    """
+    Answers a request of the catalog endpoint, whichever handler or route received it.
+
+    :param s3_client: A boto3 S3 client.
+    :param theme: The theme of the catalog, None for every theme.
+    :param headers: The request headers, names lower-cased ('http_responses.request_headers').
+    :return: A Lambda proxy integration response: 200 or 304.
+    """
+
+    # one get_object of the precomputed catalog, kept in memory by warm containers
+    response, hit = catalog_response(s3_client, theme)
+    response_headers = {
+        "Content-Type": "application/json",
+        "X-Data-Source": response["source"],
+        "X-Cache": "Hit" if hit else "Miss",
+        **cache_headers(response["etag"], response["last_modified"]),
+    }
+    if etag_matches(headers.get("if-none-match"), response["etag"]):
+        return not_modified(response_headers)
+    return ok(response["body"], response_headers, headers.get("accept-encoding"))
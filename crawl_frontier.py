@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import sqlite3
+
+"""
+Persistent Crawl Frontier
+
+A harvest of 'data.gov.ma' takes hours. Keeping its progress only in memory means a crash or a
+kill throws all of it away. The frontier stores every unit of work of the crawl in a SQLite file,
+so that a harvest can be resumed where it stopped:
+- "theme_page": a page of a theme listing,
+- "dataset_page": a dataset page found on a theme page,
+- "download": a dataset file to download.
+
+Each item is "pending", "running", "done" or "failed", and carries a JSON payload (what is needed to
+process it) and, once done, a JSON result. Items are unique per (kind, url, theme), so adding an
+item twice is harmless.
+
+Several worker processes can share the same frontier: 'claim' hands each pending item to exactly
+one of them inside an immediate transaction, and the database runs in WAL mode so readers do not
+block the writer.
+
+Classes:
+- Frontier: The SQLite-backed store of work items.
+"""
+
+FRONTIER_PATH = os.path.join("data", "frontier.sqlite3")
+KINDS = ["download", "dataset_page", "theme_page"]  # claimed in this order
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    url TEXT NOT NULL,
+    theme TEXT NOT NULL,
+    payload TEXT,
+    result TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    worker TEXT,
+    updated_at REAL,
+    UNIQUE (kind, url, theme)
+);
+CREATE INDEX IF NOT EXISTS items_status ON items (status, kind);
+"""
+
+
+class Frontier:
+    def __init__(self, path=FRONTIER_PATH):
+        self.path = path
+        folder_path = os.path.dirname(path)
+        if folder_path and not os.path.exists(folder_path):
+            os.makedirs(folder_path)
+
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def add(self, kind, url, theme, payload=None):
+        """
+        Adds a pending item, unless the same (kind, url, theme) is already known.
+
+        :return: True if the item was added.
+        """
+
+        cursor = self.db.execute(
+            "INSERT OR IGNORE INTO items (kind, url, theme, payload, updated_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (kind, url, theme, json.dumps(payload), time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def claim(self, worker):
+        """
+        Atomically takes the next pending item for a worker and marks it as running.
+
+        :param worker: A name identifying the worker, kept for debugging.
+        :return: The item as a dict (with its payload decoded), or None if nothing is pending.
+        """
+
+        order = " ".join(f"WHEN '{kind}' THEN {i}" for i, kind in enumerate(KINDS))
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.db.execute(
+                f"SELECT * FROM items WHERE status = 'pending' "
+                f"ORDER BY CASE kind {order} END, id LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                self.db.execute(
+                    "UPDATE items SET status = 'running', worker = ?, "
+                    "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (worker, time.time(), row["id"]),
+                )
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+
+        if row is None:
+            return None
+        item = dict(row)
+        item["payload"] = json.loads(item["payload"]) if item["payload"] else None
+        return item
+
+    def done(self, item_id, result=None):
+        self.db.execute(
+            "UPDATE items SET status = 'done', result = ?, error = NULL, updated_at = ? "
+            "WHERE id = ?",
+            (json.dumps(result), time.time(), item_id),
+        )
+
+    def fail(self, item_id, error):
+        self.db.execute(
+            "UPDATE items SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+            (str(error), time.time(), item_id),
+        )
+
+    def reset_running(self):
+        """
+        Puts back to pending the items left running by workers that died.
+
+        :return: The number of items reset.
+        """
+
+        return self.db.execute(
+            "UPDATE items SET status = 'pending', worker = NULL WHERE status = 'running'"
+        ).rowcount
+
+    def requeue(self, worker, max_attempts):
+        """
+        Puts back to pending the items left running by a worker that died, unless they were
+        already handed out 'max_attempts' times: those are marked failed, in case they are what
+        kills the workers.
+
+        :param worker: The name of the worker.
+        :param max_attempts: The number of attempts after which an item is failed.
+        :return: A (number of items put back to pending, number of items failed) tuple.
+        """
+
+        failed = self.db.execute(
+            "UPDATE items SET status = 'failed', error = 'worker died', updated_at = ? "
+            "WHERE status = 'running' AND worker = ? AND attempts >= ?",
+            (time.time(), worker, max_attempts),
+        ).rowcount
+        pending = self.db.execute(
+            "UPDATE items SET status = 'pending', worker = NULL, updated_at = ? "
+            "WHERE status = 'running' AND worker = ?",
+            (time.time(), worker),
+        ).rowcount
+        return pending, failed
+
+    def retry_failed(self):
+        """
+        Puts back to pending every failed item, with its attempts counted from zero again, so that
+        'requeue' does not fail it at once the next time its worker dies.
+
+        :return: The number of items reset.
+        """
+
+        return self.db.execute(
+            "UPDATE items SET status = 'pending', error = NULL, attempts = 0, "
+            "updated_at = ? WHERE status = 'failed'",
+            (time.time(),),
+        ).rowcount
+
+    def counts(self):
+        """
+        :return: A dict of {status: number of items}.
+        """
+
+        rows = self.db.execute("SELECT status, COUNT(*) FROM items GROUP BY status")
+        return {status: count for status, count in rows}
+
+    def items(self, kind, status="done"):
+        """
+        Iterates over the items of a kind, with payload and result decoded.
+
+        :param kind: The kind of the items.
+        :param status: Only yield the items with this status. None yields them all.
+        """
+
+        query = "SELECT * FROM items WHERE kind = ?"
+        params = [kind]
+        if status is not None:
+            query += " AND status = ?"
+            params.append(status)
+        rows = self.db.execute(query + " ORDER BY id", params)
+        for row in rows.fetchall():
+            item = dict(row)
+            for field in ["payload", "result"]:
+                item[field] = json.loads(item[field]) if item[field] else None
+            yield item
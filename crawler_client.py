@@ -0,0 +1,306 @@
+import time
+import random
+import asyncio
+import logging
+import argparse
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from lazy_import import lazy_import
+
+aiohttp = lazy_import("aiohttp")
+
+"""
+Shared HTTP Client for the Scrapers
+
+Bare 'requests.get' calls open a new TCP/TLS connection every time and give up on the first
+error. This module wraps a single 'requests.Session' that every request of the crawler goes
+through, and adds:
+- keep-alive connection pooling, so consecutive requests to 'data.gov.ma' reuse connections,
+- retries with exponential backoff (and jitter) on connection errors, timeouts and transient
+  status codes (429 and 5xx), honouring 'Retry-After' when the server sends it,
+- a token-bucket rate limiter, so throughput can be pushed up to a known request rate without
+  getting throttled.
+
+The asyncio crawler ('data_get_async.py') goes through the same retries, backoff and rate limit
+with 'AsyncCrawlerClient', which wraps an 'aiohttp.ClientSession' instead.
+
+Classes:
+- TokenBucket: A thread-safe token bucket. acquire() blocks until a token is available, reserve()
+  takes one and returns how long to wait for it, for callers that must not block.
+- CrawlerClient: The session wrapper. get(url, **kwargs) behaves like 'requests.get';
+  stats() returns the request, retry, failure, throttling and connection reuse counters.
+- AsyncCrawlerClient: The same for an 'aiohttp.ClientSession'. 'await get(url, **kwargs)'
+  returns the 'aiohttp.ClientResponse'.
+
+Functions:
+- retry_delay(attempt, backoff, retry_after): The wait before a retry.
+- parse_rate(value): The '--rate' argument type of the crawlers, 0 turns the limit off.
+"""
+
+RATE = 5.0  # requests per second
+BURST = 10
+RETRIES = 4
+BACKOFF = 0.5  # seconds, doubled on every retry
+MAX_BACKOFF = 30.0
+POOL_SIZE = 16
+TIMEOUT = 30  # seconds
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def retry_delay(attempt, backoff=BACKOFF, retry_after=None):
+    """
+    :param attempt: The number of the attempt that failed, from 0.
+    :param backoff: The delay before the first retry, doubled on every retry.
+    :param retry_after: The 'Retry-After' header of the response, if any.
+    :return: The number of seconds to wait before the next attempt.
+    """
+
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), MAX_BACKOFF)
+    delay = min(backoff * 2**attempt, MAX_BACKOFF)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def parse_rate(value):
+    """
+    :param value: The '--rate' command line argument.
+    :return: The rate as a float, 0 for no rate limit.
+    :raises argparse.ArgumentTypeError: If the rate is negative.
+    """
+
+    rate = float(value)
+    if rate < 0:
+        raise argparse.ArgumentTypeError("the rate must be positive, or 0 for no limit")
+    return rate
+
+
+class TokenBucket:
+    def __init__(self, rate=RATE, burst=BURST):
+        if rate <= 0:
+            raise ValueError("the rate of a token bucket must be positive")
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Takes a token, sleeping until one is available.
+
+        :return: The number of seconds spent waiting.
+        """
+
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def reserve(self):
+        """
+        Takes a token now, possibly ahead of time: the tokens go negative until they refill.
+
+        :return: The number of seconds to wait before using the token.
+        """
+
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= 1
+            return max(-self.tokens / self.rate, 0.0)
+
+
+class CrawlerClient:
+    def __init__(
+        self,
+        rate=RATE,
+        burst=BURST,
+        retries=RETRIES,
+        backoff=BACKOFF,
+        pool_size=POOL_SIZE,
+        timeout=TIMEOUT,
+    ):
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.burst = burst
+        self.bucket = TokenBucket(rate, burst) if rate else None
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.counters = {
+            "requests": 0,
+            "retries": 0,
+            "failures": 0,
+            "throttled_seconds": 0.0,
+        }
+        self.lock = threading.Lock()
+
+    def set_rate(self, rate):
+        """
+        :param rate: The new request rate. 0 or None turns the rate limit off.
+        """
+
+        self.bucket = TokenBucket(rate, self.burst) if rate else None
+
+    def _count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def _delay(self, attempt, response=None):
+        retry_after = (
+            response.headers.get("Retry-After") if response is not None else None
+        )
+        return retry_delay(attempt, self.backoff, retry_after)
+
+    def get(self, url, **kwargs):
+        """
+        GETs a URL through the pooled session, with rate limiting and retries.
+
+        :param url: The URL to fetch.
+        :param kwargs: Passed on to 'requests.Session.get' (headers, stream, ...).
+        :return: The 'requests.Response'. After the last retry, the response is returned even
+                 if its status is still a transient error.
+        :raises requests.RequestException: If the last attempt failed at the connection level.
+        """
+
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(self.retries + 1):
+            if self.bucket:
+                self._count("throttled_seconds", self.bucket.acquire())
+            self._count("requests")
+
+            try:
+                response = self.session.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.retries:
+                    self._count("failures")
+                    raise
+                delay = self._delay(attempt)
+                logging.warning(f"retry {attempt + 1} in {delay:.1f}s: {url}: {e!r}")
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                if attempt == self.retries:
+                    self._count("failures")
+                    return response
+                delay = self._delay(attempt, response)
+                logging.warning(
+                    f"retry {attempt + 1} in {delay:.1f}s: {url}: {response.status_code}"
+                )
+                response.close()
+
+            self._count("retries")
+            time.sleep(delay)
+
+    def stats(self):
+        """
+        :return: A dict with the request counters and the number of connections opened and
+                 reused by the pool.
+        """
+
+        opened = served = 0
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                opened += pool.num_connections
+                served += pool.num_requests
+
+        with self.lock:
+            stats = dict(self.counters)
+        stats["connections_opened"] = opened
+        stats["connections_reused"] = max(served - opened, 0)
+        return stats
+
+
+class AsyncCrawlerClient:
+    def __init__(
+        self,
+        session,
+        rate=RATE,
+        burst=BURST,
+        retries=RETRIES,
+        backoff=BACKOFF,
+    ):
+        self.session = session
+        self.retries = retries
+        self.backoff = backoff
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        # only touched from the event loop, no lock needed
+        self.counters = {
+            "requests": 0,
+            "retries": 0,
+            "failures": 0,
+            "throttled_seconds": 0.0,
+        }
+
+    async def get(self, url, **kwargs):
+        """
+        GETs a URL through the aiohttp session, with rate limiting and retries.
+
+        :param url: The URL to fetch.
+        :param kwargs: Passed on to 'aiohttp.ClientSession.get' (headers, ...).
+        :return: The 'aiohttp.ClientResponse', to be used as 'async with await client.get(url)'.
+                 After the last retry, the response is returned even if its status is still a
+                 transient error.
+        :raises aiohttp.ClientError: If the last attempt failed at the connection level.
+        """
+
+        for attempt in range(self.retries + 1):
+            if self.bucket:
+                wait = self.bucket.reserve()
+                self.counters["throttled_seconds"] += wait
+                await asyncio.sleep(wait)
+            self.counters["requests"] += 1
+
+            try:
+                response = await self.session.get(url, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt == self.retries:
+                    self.counters["failures"] += 1
+                    raise
+                delay = retry_delay(attempt, self.backoff)
+                logging.warning(f"retry {attempt + 1} in {delay:.1f}s: {url}: {e!r}")
+            else:
+                if response.status not in RETRY_STATUSES:
+                    return response
+                if attempt == self.retries:
+                    self.counters["failures"] += 1
+                    return response
+                delay = retry_delay(
+                    attempt, self.backoff, response.headers.get("Retry-After")
+                )
+                logging.warning(
+                    f"retry {attempt + 1} in {delay:.1f}s: {url}: {response.status}"
+                )
+                response.release()
+
+            self.counters["retries"] += 1
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        """
+        :return: A dict with the request counters.
+        """
+
+        return dict(self.counters)
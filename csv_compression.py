@@ -0,0 +1,86 @@
+import os
+import gzip
+import bisect
+
+"""
+Compressed Storage of the CSV Datasets
+
+The CSV files compress 3 to 4 times, and the handlers used to download them raw. 'data_processor.py'
+now writes, next to every CSV, '<dataset>.csv.gz', uploaded with 'Content-Encoding: gzip'
+('data_uploader.py'), which the handlers read instead of the CSV:
+- whole datasets and filtered reads decompress the object as it streams from S3,
+- a whole CSV asked for by a client accepting gzip is sent compressed as it is stored,
+- pages are read with a ranged request, as with the CSV.
+
+Ranged requests work because the file is not one gzip stream but a series of gzip members, one
+per block of rows of the row offset index ('csv_index.py'), the first one holding the header. A
+series of members is a valid gzip file, decompressed as a whole by any gzip reader, and any run of
+members is one too. The index records where each member starts, in the CSV and in the gzip file:
+    "gzip": {"size": 1234567, "members": [[0, 0], [41517, 6120], ...]}
+so the bytes of a page of the CSV map to a run of members, fetched and decompressed alone. Blocks
+of 1000 rows compress within 5% of the whole file as one stream.
+
+The members have no timestamp nor file name: the same CSV always gives the same file, and the
+same ETag.
+
+Functions:
+- gzip_path(csv_path): The path (or S3 key) of the compressed copy of a CSV.
+- write_block_gzip(csv_path, boundaries): Writes the compressed copy of a CSV.
+- member_range(members, size, start, end): The members holding a byte range of the CSV.
+"""
+
+GZIP_SUFFIX = ".gz"
+GZIP_LEVEL = 9  # compressed once, read many times
+
+
+def gzip_path(csv_path):
+    """
+    :param csv_path: The path or S3 key of a CSV file, '<name>.csv'.
+    :return: '<name>.csv.gz'.
+    """
+
+    return csv_path + GZIP_SUFFIX
+
+
+def write_block_gzip(csv_path, boundaries):
+    """
+    Compresses a CSV file as one gzip member per block.
+
+    :param csv_path: The path of the CSV file.
+    :param boundaries: The increasing byte offsets of the CSV where a member starts, the first
+                       one 0.
+    :return: The "gzip" entry of the index, {"size", "members"}.
+    """
+
+    path = gzip_path(csv_path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    members = []
+    size = os.path.getsize(csv_path)
+    ends = list(boundaries[1:]) + [size]
+    with open(csv_path, "rb") as source, open(tmp_path, "wb") as target:
+        for start, end in zip(boundaries, ends):
+            members.append([start, target.tell()])
+            block = source.read(end - start)
+            target.write(gzip.compress(block, compresslevel=GZIP_LEVEL, mtime=0))
+        compressed_size = target.tell()
+    os.replace(tmp_path, path)
+    return {"size": compressed_size, "members": members}
+
+
+def member_range(members, size, start, end):
+    """
+    Finds the members of a compressed copy holding a byte range of its CSV.
+
+    :param members: The "members" of the "gzip" entry of the index.
+    :param size: The size of the compressed copy.
+    :param start: The first byte of the CSV.
+    :param end: The last byte of the CSV, inclusive.
+    :return: A (first byte, last byte, bytes to skip) tuple: the byte range of the compressed
+             copy, inclusive, and the number of decompressed bytes before 'start'.
+    """
+
+    starts = [member[0] for member in members]
+    first = bisect.bisect_right(starts, start) - 1
+    after = bisect.bisect_right(starts, end)  # the first member past the range
+    last_byte = members[after][1] - 1 if after < len(members) else size - 1
+    return members[first][1], last_byte, start - members[first][0]
@@ -0,0 +1,138 @@
+import os
+import csv
+import json
+from csv_compression import write_block_gzip
+
+"""
+Row Offset Index for the CSV Datasets
+
+Paging through a CSV streamed from S3 still means downloading and parsing every row before the
+requested page. This module builds a small sidecar index of a CSV, written next to it by
+'data_processor.py' as '<dataset>.idx.json':
+    {
+        "version": 1,
+        "every": 1000,
+        "columns": ["annee", "region", ...],
+        "rows": 123456,
+        "size": 9876543,
+        "offsets": [31, 41517, 83012, ...],
+        "gzip": {"size": 1234567, "members": [[0, 0], [41517, 6120], ...]}
+    }
+'offsets[i]' is the byte offset in the CSV of data row 'i * every' (the header is not a data row,
+blank lines are not rows). With it, the handlers fetch a page with a single ranged 'get_object'
+covering only the rows of the page, whatever its depth. 'size' is the size of the CSV the index was
+built from: an index that does not match the object is ignored. "gzip" describes the compressed
+copy of the CSV, '<dataset>.csv.gz', compressed block by block at these offsets so that pages can
+be fetched from it the same way (see 'csv_compression.py').
+
+Rows are delimited by scanning the raw bytes and counting quotes, so values holding line breaks
+are handled the way the csv module reads them.
+
+Functions:
+- index_path(csv_path): The path (or S3 key) of the index of a CSV.
+- build_index(csv_path, every): Scans a CSV and returns its index.
+- write_index(csv_path, every, compress): Builds the index of a CSV and writes it next to it,
+  with the compressed copy of the CSV.
+- locate(index, offset, limit): The byte range and the rows to skip to read a page.
+"""
+
+INDEX_SUFFIX = ".idx.json"
+INDEX_VERSION = 1
+ROWS_PER_OFFSET = 1000
+
+
+def index_path(csv_path):
+    """
+    :param csv_path: The path or S3 key of a CSV file, '<name>.csv'.
+    :return: '<name>.idx.json'.
+    """
+
+    base = csv_path[: -len(".csv")] if csv_path.endswith(".csv") else csv_path
+    return base + INDEX_SUFFIX
+
+
+def build_index(csv_path, every=ROWS_PER_OFFSET):
+    """
+    Scans a CSV file and records the byte offset of every 'every'-th data row.
+
+    :param csv_path: The path of the CSV file, UTF-8 encoded.
+    :param every: The number of rows between two recorded offsets.
+    :return: The index dict, see the module docstring.
+    """
+
+    columns = None
+    rows = 0
+    offsets = []
+    position = record_start = 0
+    record = []
+    quotes = 0
+
+    with open(csv_path, "rb") as file:
+        for line in file:
+            position += len(line)
+            record.append(line)
+            quotes += line.count(b'"')
+            if quotes % 2:
+                continue  # the line break is inside a quoted value
+
+            data = b"".join(record)
+            if data.strip(b"\r\n"):
+                if columns is None:
+                    columns = next(csv.reader([data.decode("utf-8")]))
+                else:
+                    if rows % every == 0:
+                        offsets.append(record_start)
+                    rows += 1
+            record, quotes = [], 0
+            record_start = position
+
+    return {
+        "version": INDEX_VERSION,
+        "every": every,
+        "columns": columns or [],
+        "rows": rows,
+        "size": position,
+        "offsets": offsets,
+    }
+
+
+def write_index(csv_path, every=ROWS_PER_OFFSET, compress=False):
+    """
+    Builds the index of a CSV file and writes it next to it.
+
+    :param compress: Also write the compressed copy of the CSV, '<name>.csv.gz', one gzip member
+                     per block of 'every' rows.
+    :return: The path of the index.
+    """
+
+    index = build_index(csv_path, every)
+    if compress:
+        # the first member holds the header with the first block
+        index["gzip"] = write_block_gzip(csv_path, [0] + index["offsets"][1:])
+
+    path = index_path(csv_path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(index, file, separators=(",", ":"))
+    os.replace(tmp_path, path)
+    return path
+
+
+def locate(index, offset, limit):
+    """
+    Finds the bytes of the CSV holding a page of rows.
+
+    :param index: An index dict.
+    :param offset: The first row of the page.
+    :param limit: The number of rows of the page.
+    :return: A (first byte, last byte, rows to skip) tuple. The last byte is inclusive, as in an
+             HTTP Range header. None if the page is past the last row.
+    """
+
+    if offset >= index["rows"]:
+        return None
+    every, offsets = index["every"], index["offsets"]
+    start = offsets[offset // every]
+    end_entry = (offset + limit - 1) // every + 1  # first recorded row after the page
+    end = offsets[end_entry] - 1 if end_entry < len(offsets) else index["size"] - 1
+    return start, end, offset % every
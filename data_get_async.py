@@ -0,0 +1,323 @@
+import asyncio
+import os
+import logging
+import argparse
+import hashlib
+import aiohttp
+
+import data_get_requests
+from crawler_client import RATE, AsyncCrawlerClient, parse_rate
+from data_get_requests import (
+    Dataset,
+    dataset_file_path,
+    dataset_metadata,
+    http_cache,
+    log_report,
+    manifest_key,
+    parse_dataset_items,
+    parse_dataset_page,
+    parse_themes,
+)
+from manifest import Manifest
+
+"""
+Asyncio Crawl Mode for Downloading Datasets
+
+This script is the concurrent counterpart of 'data_get_requests.py'. It crawls the same pages of
+'data.gov.ma', builds the same 'Theme' and 'Dataset' objects and writes the same 'data/<theme>/'
+layout, but keeps many requests in flight at once instead of waiting on each of them in turn.
+
+Themes are crawled concurrently. Within a theme, listing pages are walked in order (the end of the
+pagination is only known once an empty page comes back) while every dataset of a page is resolved
+and downloaded concurrently. The HTML parsing is shared with 'data_get_requests.py'.
+
+Concurrency is bounded twice:
+- a global limit on the number of open connections (MAX_CONCURRENCY),
+- a per-host limit, so a single host is never hit by more than MAX_PER_HOST connections.
+Every request goes through an 'AsyncCrawlerClient' ('crawler_client.py'): the retries, backoff and
+request rate of the sequential crawler apply here too.
+
+Functions:
+- fetch(client, url): GETs a page through the shared HTTP cache, returns its status and content.
+- get_themes(client): Scrapes the group page and returns the list of themes.
+- get_dataset(client, link): Resolves a dataset item of a theme page into a 'Dataset'.
+- local_download(client, dataset, theme_name, manifest): Streams a dataset into its theme
+  directory through a '.part' file renamed once complete, skipping it when the manifest shows
+  it is unchanged.
+- get_datasets(client, theme, data_dir, manifest, failed): Scrapes and downloads every dataset
+  of a theme.
+- crawl(max_concurrency, max_per_host, data_dir, manifest, rate, failed): Runs the whole harvest
+  and returns the themes, collecting what failed.
+- main(): Command line entry point.
+
+Usage:
+    python data_get_async.py --max-concurrency 32 --max-per-host 8 --rate 20
+
+Note:
+- This script requires 'aiohttp' on top of the requirements of 'data_get_requests.py'.
+- Logging goes to the same 'data_get_requests.log' file as the sequential crawler.
+- Downloads are recorded in the same '<data dir>/manifest.json' as the sequential crawler.
+"""
+
+MAX_CONCURRENCY = 32
+MAX_PER_HOST = 8
+CHUNK_SIZE = 64 * 1024
+
+
+async def fetch(client, url):
+    """
+    GETs a page through the shared on-disk HTTP cache and logs its status code.
+
+    :param client: An 'AsyncCrawlerClient'.
+    :param url: The URL to fetch.
+    :return: A (status code, content bytes) tuple.
+    """
+
+    cached = http_cache.get(url)
+    if cached is not None:
+        return cached
+
+    async with await client.get(url) as page:
+        content = await page.read()
+        _status = page.status
+
+    if _status != 200:
+        logging.debug(f"\n\nERROR")
+        logging.debug(f"link: {url}")
+        logging.debug(f"status code: {_status}\n\n")
+    else:
+        logging.debug(f"status code: {_status}")
+        http_cache.set(url, content, _status)
+    return _status, content
+
+
+async def get_themes(client):
+    """
+    Scrapes the main page to get all available themes and their URLs.
+
+    :param client: An 'AsyncCrawlerClient'.
+    :return: A list of 'Theme' objects, each representing a different theme.
+    """
+
+    logging.debug(f"get_themes")
+    _, content = await fetch(client, f"{data_get_requests.BASE_URL}/data/fr/group")
+    return parse_themes(content)
+
+
+async def get_dataset(client, link):
+    """
+    Resolves a dataset item of a theme page into a 'Dataset' object.
+
+    :param client: An 'AsyncCrawlerClient'.
+    :param link: The dataset link found on the theme page.
+    :return: A 'Dataset' object.
+    """
+
+    base_url = data_get_requests.BASE_URL
+    _, content = await fetch(client, f"{base_url}/{link}")
+    page_info = parse_dataset_page(content)
+    if not page_info["name"] or not page_info["download_link"]:
+        raise ValueError(f"no downloadable resource on {base_url}/{link}")
+    return Dataset(
+        name=page_info["name"],
+        url=f"{base_url}/data/fr/dataset/{page_info['name']}",
+        download_link=page_info["download_link"],
+        tags=page_info["tags"],
+        resources=page_info["resources"],
+    )
+
+
+async def local_download(client, dataset, theme_name, data_dir="data", manifest=None):
+    """
+    Downloads a dataset and saves it to a specified theme directory.
+
+    :param client: An 'AsyncCrawlerClient'.
+    :param dataset: A 'Dataset' object containing dataset details.
+    :param theme_name: A string representing the name of the theme.
+    :param data_dir: The root folder of the downloaded data.
+    :param manifest: An optional 'Manifest'. When given, the request is conditional and the
+                     download is recorded in it.
+    :return: "added", "changed" or "unchanged" with a manifest, None otherwise or when the
+             response is an error. The function saves the downloaded file locally.
+    """
+
+    logging.debug(f"local_download. dataset: {dataset}, theme_name: {theme_name}")
+
+    file_path = dataset_file_path(dataset, theme_name, data_dir)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    key = manifest_key(dataset, theme_name)
+
+    headers = manifest.conditional_headers(key, file_path) if manifest else {}
+    async with await client.get(
+        dataset.download_link, headers=headers, allow_redirects=True
+    ) as r:
+        if manifest and r.status == 304:
+            logging.debug(f"not modified: {key}")
+            manifest.record_not_modified(key, dataset_metadata(dataset))
+            return "unchanged"
+        if r.status != 200:
+            # an error page is not the dataset, the file in place is kept as it is
+            logging.debug(f"\n\nERROR")
+            logging.debug(f"link: {dataset.download_link}")
+            logging.debug(f"status code: {r.status}\n\n")
+            return None
+
+        digest = hashlib.sha256()
+        size = 0
+        part_path = f"{file_path}.part"
+        with open(part_path, "wb") as file:
+            async for chunk in r.content.iter_chunked(CHUNK_SIZE):
+                file.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+        os.replace(part_path, file_path)
+        response_headers = r.headers
+
+    if manifest:
+        status = manifest.record(
+            key,
+            dataset.download_link,
+            response_headers,
+            digest.hexdigest(),
+            size,
+            dataset_metadata(dataset),
+        )
+        logging.debug(f"{status}: {key}")
+        return status
+
+
+async def get_datasets(client, theme, data_dir="data", manifest=None, failed=None):
+    """
+    Scrapes and processes all datasets under a given theme.
+
+    :param client: An 'AsyncCrawlerClient'.
+    :param theme: A 'Theme' object representing the theme to scrape.
+    :param data_dir: The root folder of the downloaded data.
+    :param manifest: An optional 'Manifest' passed on to 'local_download'. The entries of the
+                     datasets that could not be downloaded are kept in it.
+    :param failed: An optional list, the URLs of the pages and downloads that failed are
+                   appended to it.
+    :return: None. The function updates the 'Theme' object with datasets.
+    """
+
+    logging.debug(f"get_datasets: {theme.name}")
+    failed = [] if failed is None else failed
+
+    async def process(link):
+        dataset = await get_dataset(client, link)
+        status = await local_download(client, dataset, theme.name, data_dir, manifest)
+        if manifest and status is None:
+            # a file that could not be downloaded this time is not gone upstream
+            manifest.keep(manifest_key(dataset, theme.name))
+            failed.append(dataset.download_link)
+        logging.info("=" * 50)
+        logging.info(dataset)
+        return dataset
+
+    current_page = 1
+    base_url = f"{data_get_requests.BASE_URL}/{theme.url}"
+    while True:
+        logging.debug(f"current_page: {current_page}")
+        _status, content = await fetch(client, f"{base_url}?page={current_page}")
+        if _status != 200:
+            failed.append(f"{base_url}?page={current_page}")
+            break
+
+        dataset_links = parse_dataset_items(content)
+        if not dataset_links:
+            break
+
+        # gather keeps the page order, so theme.datasets matches the sequential crawler
+        results = await asyncio.gather(
+            *(process(link) for link in dataset_links), return_exceptions=True
+        )
+        for link, result in zip(dataset_links, results):
+            if isinstance(result, Exception):
+                logging.error(f"failed dataset {link}: {result!r}")
+                failed.append(link)
+                continue
+            theme.add_dataset(result)
+
+        current_page += 1
+
+
+async def crawl(
+    max_concurrency=MAX_CONCURRENCY,
+    max_per_host=MAX_PER_HOST,
+    data_dir="data",
+    manifest=None,
+    rate=RATE,
+    failed=None,
+):
+    """
+    Runs the whole harvest concurrently.
+
+    :param max_concurrency: The maximum number of connections open at once.
+    :param max_per_host: The maximum number of connections open at once to a single host.
+    :param data_dir: The root folder of the downloaded data.
+    :param manifest: An optional 'Manifest' recording the downloads.
+    :param rate: The maximum number of requests per second, None or 0 for no limit.
+    :param failed: An optional list, the URLs of the pages and downloads that failed are
+                   appended to it.
+    :return: A list of 'Theme' objects filled with their datasets.
+    """
+
+    connector = aiohttp.TCPConnector(limit=max_concurrency, limit_per_host=max_per_host)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        client = AsyncCrawlerClient(session, rate=rate)
+        themes = await get_themes(client)
+        await asyncio.gather(
+            *(
+                get_datasets(client, theme, data_dir, manifest, failed)
+                for theme in themes
+            )
+        )
+    logging.info(f"http client: {client.stats()}")
+    return themes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent data.gov.ma harvest")
+    parser.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENCY)
+    parser.add_argument("--max-per-host", type=int, default=MAX_PER_HOST)
+    parser.add_argument(
+        "--rate",
+        type=parse_rate,
+        default=RATE,
+        help="requests per second, 0 for no limit",
+    )
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the page cache")
+    args = parser.parse_args()
+    http_cache.enabled = not args.no_cache
+
+    manifest = Manifest(os.path.join(args.data_dir, "manifest.json"))
+    failed = []
+    themes = asyncio.run(
+        crawl(
+            args.max_concurrency,
+            args.max_per_host,
+            args.data_dir,
+            manifest,
+            args.rate,
+            failed,
+        )
+    )
+    complete = not failed
+
+    logging.info("\n\n\n")
+    logging.info(
+        "===== LOADING COMPLETE =====" if complete else "===== LOADING PARTIAL ====="
+    )
+    for theme in themes:
+        logging.info(theme)
+    if not complete:
+        logging.info(f"{len(failed)} failed: {failed}")
+        print(f"{len(failed)} pages or downloads failed, rerun to retry them")
+
+    # removals are only known once every dataset of the harvest was seen
+    log_report(manifest.save(drop_removed=complete))
+
+
+if __name__ == "__main__":
+    main()
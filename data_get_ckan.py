@@ -0,0 +1,219 @@
+import re
+import logging
+import argparse
+import requests
+
+import data_get_requests
+from crawler_client import RATE, parse_rate
+from data_get_requests import (
+    Dataset,
+    Theme,
+    client,
+    local_download,
+    log_report,
+    manifest_key,
+)
+from manifest import Manifest
+
+"""
+CKAN API Harvester for 'data.gov.ma'
+
+'data.gov.ma' is a CKAN portal: the '/data/fr/dataset/...' pages and the 'resource-url-analytics'
+links scraped by 'data_get_requests.py' and 'data_get_selenium.py' are rendered from CKAN
+metadata. This script reads that metadata straight from the CKAN action API instead:
+- 'group_list' returns every theme in one call,
+- 'package_search' returns datasets with their tags and resources, ROWS at a time.
+
+A full listing of the portal therefore takes a handful of JSON calls instead of several HTML pages
+per dataset. The results fill the same 'Theme' and 'Dataset' objects, and the download stage is the
+one of 'data_get_requests.py' ('local_download', manifest included), so the 'data/<theme>/' layout
+does not change.
+
+Functions:
+- api_call(action, params): Calls a CKAN action and returns its result.
+- get_themes(): Returns the list of themes, from 'group_list'.
+- package_to_dataset(package): Builds a 'Dataset' from a CKAN package.
+- get_datasets(themes): Fills the themes with their datasets, from 'package_search'.
+- main(): Lists everything, then downloads every dataset.
+
+Usage:
+    python data_get_ckan.py
+    python data_get_ckan.py --list-only
+
+Note:
+- Requests go through the shared client of 'data_get_requests.py' (pooling, retries, rate limit).
+- Logging goes to the same 'data_get_requests.log' file as the HTML crawler.
+"""
+
+API_PATH = "data/api/3/action"
+ROWS = 1000  # CKAN caps 'rows' at 1000 by default (ckan.search.rows_max)
+SHA256_PATTERN = re.compile(r"^(sha256:)?([0-9a-fA-F]{64})$")
+
+
+def api_call(action, params=None):
+    """
+    Calls an action of the CKAN API.
+
+    :param action: The name of the action, e.g. 'package_search'.
+    :param params: A dict of query parameters.
+    :return: The 'result' member of the response.
+    :raises RuntimeError: If the API answers with an error.
+    """
+
+    url = f"{data_get_requests.BASE_URL}/{API_PATH}/{action}"
+    logging.debug(f"api_call: {action} {params}")
+    r = client.get(url, params=params)
+    try:
+        body = r.json()
+    except ValueError:
+        body = {}
+    if r.status_code != 200 or not body.get("success"):
+        raise RuntimeError(f"{action} failed with {r.status_code}: {body.get('error')}")
+    return body["result"]
+
+
+def get_themes():
+    """
+    Gets all available themes from the CKAN groups.
+
+    :return: A list of 'Theme' objects, each representing a different theme.
+    """
+
+    logging.debug(f"get_themes")
+    theme_objects = []
+    for group in api_call("group_list", {"all_fields": "true"}):
+        theme = Theme(group.get("display_name") or group.get("title") or group["name"])
+        theme.change_url(f"data/fr/group/{group['name']}")
+        theme_objects.append(theme)
+    return theme_objects
+
+
+def _sha256(resource):
+    match = SHA256_PATTERN.match(resource.get("hash") or "")
+    return match.group(2).lower() if match else None
+
+
+def package_to_dataset(package):
+    """
+    Builds a 'Dataset' from a CKAN package.
+
+    :param package: A package dict, as returned by 'package_search'.
+    :return: A 'Dataset' object, or None if the package has no resource to download.
+    """
+
+    base_url = data_get_requests.BASE_URL
+    resources = [
+        {
+            "name": resource.get("name"),
+            "url": f"/data/fr/dataset/{package['name']}/resource/{resource['id']}",
+            "format": (resource.get("format") or "").lower() or None,
+            "download_link": resource.get("url"),
+            "size": resource.get("size"),
+            "sha256": _sha256(resource),
+            "created": resource.get("created"),
+            "last_modified": resource.get("last_modified") or resource.get("created"),
+        }
+        for resource in package.get("resources", [])
+        if resource.get("url")
+    ]
+    if not resources:
+        return None
+
+    return Dataset(
+        name=package["name"],
+        url=f"{base_url}/data/fr/dataset/{package['name']}",
+        download_link=resources[0]["download_link"],
+        tags=[
+            tag.get("display_name") or tag["name"] for tag in package.get("tags", [])
+        ],
+        resources=resources,
+    )
+
+
+def get_datasets(themes):
+    """
+    Pages through 'package_search' and files every dataset under its themes.
+
+    :param themes: The list of 'Theme' objects returned by 'get_themes'.
+    :return: None. The function updates the 'Theme' objects with datasets.
+    """
+
+    by_group = {theme.url.rsplit("/", 1)[-1]: theme for theme in themes}
+    start = 0
+    while True:
+        result = api_call(
+            "package_search",
+            {"rows": ROWS, "start": start, "sort": "name asc"},
+        )
+        packages = result["results"]
+        for package in packages:
+            dataset = package_to_dataset(package)
+            if dataset is None:
+                logging.error(f"no downloadable resource in {package['name']}")
+                continue
+            for group in package.get("groups", []):
+                if group["name"] in by_group:
+                    by_group[group["name"]].add_dataset(dataset)
+
+        start += len(packages)
+        logging.debug(f"package_search: {start}/{result['count']}")
+        if not packages or start >= result["count"]:
+            break
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="data.gov.ma harvest, CKAN API backend"
+    )
+    parser.add_argument(
+        "--list-only", action="store_true", help="list themes and datasets, no download"
+    )
+    parser.add_argument(
+        "--rate",
+        type=parse_rate,
+        default=RATE,
+        help="requests per second, 0 for no limit",
+    )
+    args = parser.parse_args()
+    client.set_rate(args.rate)
+
+    themes = get_themes()
+    get_datasets(themes)
+    failed = []
+
+    if not args.list_only:
+        manifest = Manifest()
+        for theme in themes:
+            logging.info("*" * 80)
+            logging.info(f"\n-----\t\tTheme: {theme.name}\t\t-----\n")
+            logging.info("*" * 80)
+            for dataset in theme.datasets:
+                try:
+                    status = local_download(
+                        dataset, theme.name, manifest, dataset.resources[0]["sha256"]
+                    )
+                except (requests.RequestException, ValueError) as e:
+                    logging.error(f"download failed for {dataset.name}: {e!r}")
+                    status = None
+                if status is None:
+                    # a file that could not be downloaded this time is not gone upstream
+                    manifest.keep(manifest_key(dataset, theme.name))
+                    failed.append(dataset.download_link)
+                logging.info("=" * 50)
+                logging.info(dataset)
+        # removals are only known once every dataset of the harvest was downloaded
+        log_report(manifest.save(drop_removed=not failed))
+
+    logging.info("\n\n\n")
+    if failed:
+        logging.info("===== LOADING PARTIAL =====")
+        print(f"{len(failed)} downloads failed, rerun to retry them")
+    else:
+        logging.info("===== LOADING COMPLETE =====")
+    for theme in themes:
+        logging.info(theme)
+    logging.info(f"http client: {client.stats()}")
+
+
+if __name__ == "__main__":
+    main()
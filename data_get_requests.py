@@ -1,7 +1,17 @@
 import requests
 from bs4 import BeautifulSoup
 import os
+import time
 import logging
+import json
+import multiprocessing
+import multiprocessing.connection
+import argparse
+import hashlib
+from http_cache import HttpCache
+from crawler_client import RATE, CrawlerClient, parse_rate
+from manifest import MANIFEST_PATH, Manifest
+from crawl_frontier import FRONTIER_PATH, Frontier
 
 """
 Web Scraping Script for Downloading Datasets
@@ -15,17 +25,41 @@ Classes:
 - Theme: Represents a thematic category with a collection of datasets.
 
 Functions:
+- parse_themes(content), parse_dataset_items(content), parse_dataset_page(content): Pure HTML
+  parsers shared with the asyncio crawler in 'data_get_async.py'. 'parse_dataset_page' extracts
+  the name, tags, download link and resources of a dataset page in one pass.
+- fetch(url): GETs a page through the on-disk HTTP cache ('http_cache.py').
+- get_dataset_page(url): Fetches and parses a dataset page once. Returns None for pages that
+  cannot be fetched or lack a resource, so the crawl skips them instead of crashing.
+- dataset_file_path(dataset, theme_name): Builds the 'data/<theme>/<name>.<ext>' path of a dataset.
 - get_dataset_name(link): Extracts the dataset name from a given link.
 - get_dataset_tag(link): Retrieves tags for a dataset by scraping its webpage.
 - get_download_link(link): Extracts the download link of a dataset from its webpage.
-- local_download(dataset, theme_name): Downloads the dataset and saves it in the corresponding theme directory.
-- get_datasets(theme): Scrapes all datasets under a given theme and processes each dataset.
+- stream_download(url, file_path): Streams a file to disk in chunks, resuming partial downloads.
+- local_download(dataset, theme_name, manifest): Downloads the dataset and saves it in the corresponding theme directory.
+  With a manifest ('manifest.py'), unchanged files are skipped through conditional requests.
+- dataset_metadata(dataset): The title, page URL and tags of a dataset, kept in the manifest.
 - get_themes(): Scrapes the main page to get all available themes and their URLs.
+- seed_frontier(frontier), process_item(item, frontier, manifest), run_worker(worker),
+  run_workers(count), merge_downloads(frontier, manifest): The checkpointed crawl driven by
+  'crawl_frontier.py'. Every theme page, dataset page and download goes through it.
 - main(): The main function that orchestrates the scraping and downloading process.
 
 Usage:
 - Run this script with Python in an environment where 'requests' and 'BeautifulSoup' are installed.
 - The script creates a log file ('data_get_requests.log') to log the process and errors.
+- Every request goes through one pooled, rate-limited session with retries ('crawler_client.py').
+  Its counters (requests, retries, connection reuse, ...) are logged at the end of the run.
+- Pages are cached in '.http_cache/' for a day. Pass '--no-cache' to always hit the site.
+- Downloads are streamed to '<file>.part' and renamed once complete, so memory stays flat whatever
+  the file size. A '.part' left by a dropped connection is resumed with an HTTP Range request.
+- 'main()' keeps the state of the harvest in 'data/frontier.sqlite3' ('crawl_frontier.py'): theme
+  pages, dataset pages and downloads are pending, done or failed. After a crash, '--resume'
+  continues where it stopped and '--retry-failed' also retries what failed. '--workers N' runs N
+  processes on the same frontier. The items of a worker that dies are put back to pending and
+  the worker is restarted, up to MAX_ATTEMPTS times per item.
+- Downloads are recorded in 'data/manifest.json'. Each run only rewrites the files that changed
+  upstream and logs what was added, changed or removed.
 
 Note:
 - This script uses the 'requests' library for HTTP requests and 'BeautifulSoup' from 'bs4' for HTML parsing.
@@ -40,20 +74,38 @@ Example:
 Ensure that the required Python packages are installed and the environment is properly set up.
 """
 
+BASE_URL = "https://data.gov.ma"
+# safety net on the pagination of a theme, far above the real page counts
+MAX_PAGES = 500
+# seconds a worker waits on the items of another worker that hangs. The items of a worker that
+# dies are put back to pending as soon as it exits, see 'run_workers'
+WORKER_IDLE_TIMEOUT = 600
+# times an item is handed to a worker that dies before it is marked failed
+MAX_ATTEMPTS = 3
+# a dropped connection loses the chunk being read, so a resumed download only gets further if
+# the connection lasts more than a chunk
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_ATTEMPTS = 3
+
 logging.basicConfig(
     level=logging.DEBUG,
     filename="data_get_requests.log",
-    filemode="w",
+    # spawned workers import this module again, they must not truncate the log of the run
+    filemode="w" if multiprocessing.parent_process() is None else "a",
     format="%(asctime)s - %(levelname)s - %(message)s",
 )
 
+http_cache = HttpCache()
+client = CrawlerClient()
+
 
 class Dataset:
-    def __init__(self, name, url, download_link, tags=[]):
+    def __init__(self, name, url, download_link, tags=[], resources=None):
         self.name = name
         self.url = url
         self.download_link = download_link
         self.tags = tags
+        self.resources = resources or []
 
     def __str__(self):
         return f"Dataset: {self.name},\nURL: {self.url},\nDownload Link: {self.download_link}\nTags: {', '.join(self.tags)}"
@@ -78,6 +130,105 @@ class Theme:
         return f"Theme: {self.name},\nDatasets: {[dataset.name for dataset in self.datasets]}\nDatasets Count: {len(self.datasets)}\nTheme url: {self.url}"
 
 
+def parse_themes(content):
+    """
+    Parses the group page and builds the list of themes.
+
+    :param content: The HTML content of the 'data/fr/group' page.
+    :return: A list of 'Theme' objects, each with its name and url set.
+    """
+
+    soup = BeautifulSoup(content, "html.parser")
+
+    theme_objects = []
+    for h2 in soup.find_all("h2", class_="media-heading"):
+        text = h2.get_text().strip()
+        theme_objects.append(Theme(text))
+
+    theme_cnt = 0
+    for a in soup.find_all("a", class_="media-view"):
+        link = a["href"]
+        theme_objects[theme_cnt].change_url(link)
+        theme_cnt += 1
+
+    return theme_objects
+
+
+def parse_dataset_items(content):
+    """
+    Parses a paginated theme page and extracts the link of each dataset item.
+
+    :param content: The HTML content of a theme page.
+    :return: A list of dataset page links. Empty when the page lists no datasets.
+    """
+
+    soup = BeautifulSoup(content, "html.parser")
+
+    links = []
+    for item in soup.find_all("li", class_="dataset-item"):
+        try:
+            links.append(item.find("ul").find("li").find("a")["href"])
+        except (AttributeError, TypeError, KeyError):
+            break
+    return links
+
+
+def parse_dataset_page(content):
+    """
+    Parses a dataset page and extracts everything the crawler needs from it in one pass.
+
+    :param content: The HTML content of a dataset page.
+    :return: A dict with the dataset 'name', its 'tags', its 'download_link' and its 'resources',
+             a list of dicts with the 'name', 'url', 'format' and 'download_link' of each resource.
+             'name' and 'download_link' are None when the page has no resource.
+    """
+
+    soup = BeautifulSoup(content, "html.parser")
+
+    resources = []
+    for item in soup.find_all("li", class_="resource-item"):
+        heading = item.find("a")
+        download = item.find("a", class_="resource-url-analytics")
+        format_label = item.find(class_="format-label")
+        resources.append(
+            {
+                "name": heading.get("title") or heading.get_text().strip(),
+                "url": heading["href"],
+                "format": format_label.get("data-format") if format_label else None,
+                "download_link": download["href"] if download else None,
+            }
+        )
+
+    try:
+        tag_elements = soup.find("ul", class_="tag-list well").find_all("li")
+        tags = [tag.get_text().strip() for tag in tag_elements]
+    except AttributeError:
+        tags = []
+
+    download = soup.find("a", class_="resource-url-analytics")
+    return {
+        "name": get_dataset_name(resources[0]["url"]) if resources else None,
+        "tags": tags,
+        "download_link": download["href"] if download else None,
+        "resources": resources,
+    }
+
+
+def dataset_file_path(dataset, theme_name, data_dir="data"):
+    """
+    Builds the local path a dataset is saved to: '<data_dir>/<theme>/<name>.<ext>'.
+
+    :param dataset: A 'Dataset' object containing dataset details.
+    :param theme_name: A string representing the name of the theme.
+    :param data_dir: The root folder of the downloaded data.
+    :return: A string containing the file path.
+    """
+
+    file_extension = dataset.download_link.split(".")[-1]
+    folder_path = os.path.join(data_dir, theme_name)  # Folder path for the theme
+    return os.path.join(folder_path, f"{dataset.name}.{file_extension}")
+
+
 def get_dataset_name(link):
     """
     Extracts the dataset name from a URL.
@@ -91,32 +242,64 @@ def get_dataset_name(link):
     return db_name
 
 
-def get_dataset_tag(link):
+def fetch(url, use_cache=True):
     """
-    Retrieves tags for a dataset by scraping its web page.
+    GETs a page, going through the on-disk HTTP cache first.
 
-    :param link: A string representing the URL of a dataset.
-    :return: A list of strings, each representing a tag associated with the dataset.
+    :param url: The URL of the page.
+    :param use_cache: Set to False to always hit the site (the response is still cached).
+    :return: A (status code, content bytes) tuple. Only 200 responses are cached.
     """
 
-    logging.debug(f"get_dataset_tag: {link}")
-    nav = f"https://data.gov.ma/data/fr/dataset/{get_dataset_name(link)}"
-    link_page = requests.get(nav)
-    _status = link_page.status_code
+    cached = http_cache.get(url) if use_cache else None
+    if cached is not None:
+        return cached
+
+    page = client.get(url)
+    _status = page.status_code
 
     if _status != 200:
         logging.debug(f"\n\nERROR")
-        logging.debug(f"link: {link_page}")
+        logging.debug(f"link: {page.url}")
         logging.debug(f"status code: {_status}\n\n")
     else:
         logging.debug(f"status code: {_status}")
-    link_soup = BeautifulSoup(link_page.content, "html.parser")
-    try:
-        tag_elements = link_soup.find("ul", class_="tag-list well").find_all("li")
-        tags = [tag.get_text().strip() for tag in tag_elements]
-    except AttributeError:
-        tags = []
-    return tags
+        http_cache.set(url, page.content, _status)
+    return _status, page.content
+
+
+def get_dataset_page(url):
+    """
+    Fetches and parses a dataset page once.
+
+    :param url: A string representing the URL of a dataset page.
+    :return: The dict returned by 'parse_dataset_page', or None if the page could not be
+             fetched or has no downloadable resource.
+    """
+
+    logging.debug(f"get_dataset_page: {url}")
+    _status, content = fetch(url)
+    if _status != 200:
+        return None
+    page_info = parse_dataset_page(content)
+    if not page_info["name"] or not page_info["download_link"]:
+        logging.error(f"no downloadable resource on {url}")
+        return None
+    return page_info
+
+
+def get_dataset_tag(link):
+    """
+    Retrieves tags for a dataset by scraping its web page.
+
+    :param link: A string representing the URL of a dataset.
+    :return: A list of strings, each representing a tag associated with the dataset.
+    """
+
+    logging.debug(f"get_dataset_tag: {link}")
+    nav = f"{BASE_URL}/data/fr/dataset/{get_dataset_name(link)}"
+    page_info = get_dataset_page(nav)
+    return page_info["tags"] if page_info else []
 
 
 def get_download_link(link):
@@ -128,114 +311,432 @@ def get_download_link(link):
     """
 
     logging.debug(f"get_download_link: {link}")
-    nav = f"https://data.gov.ma/data/fr/dataset/{get_dataset_name(link)}"
-    link_page = requests.get(nav)
+    nav = f"{BASE_URL}/data/fr/dataset/{get_dataset_name(link)}"
+    page_info = get_dataset_page(nav)
+    return page_info["download_link"] if page_info else None
 
-    _status = link_page.status_code
 
-    if _status != 200:
-        logging.debug(f"\n\nERROR")
-        logging.debug(f"link: {link_page}")
-        logging.debug(f"status code: {_status}\n\n")
+def manifest_key(dataset, theme_name):
+    """
+    :return: The manifest key of a dataset file, '<theme>/<name>.<ext>'.
+    """
+
+    return f"{theme_name}/{os.path.basename(dataset_file_path(dataset, theme_name))}"
+
+
+def dataset_metadata(dataset):
+    """
+    :return: The scraped metadata of a dataset kept in the manifest, for the catalog.
+    """
+
+    return {"title": dataset.name, "page_url": dataset.url, "tags": list(dataset.tags)}
+
+
+def _expected_size(response):
+    """
+    :return: The full size of the file a response belongs to, or None when it is unknown.
+    """
+
+    if response.headers.get("Content-Encoding"):
+        return None  # the body is decoded on the fly, its length is not the file size
+    if response.status_code == 206:
+        total = response.headers.get("Content-Range", "").rpartition("/")[2]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get("Content-Length")
+    return int(length) if length and length.isdigit() else None
+
+
+def stream_download(
+    url, file_path, headers=None, expected_sha256=None, attempts=DOWNLOAD_ATTEMPTS
+):
+    """
+    Streams a file to disk in chunks, resuming a partial download when possible.
+
+    The file is written to '<file_path>.part' and atomically renamed to 'file_path' once it is
+    complete. The validator (ETag or Last-Modified) of the response is kept in
+    '<file_path>.part.json', so that a later attempt sends 'Range' with 'If-Range' and only appends
+    to the partial file if it still belongs to the same version upstream.
+
+    :param url: The URL of the file.
+    :param file_path: The final local path of the file.
+    :param headers: Extra request headers, e.g. conditional ones. Ignored when resuming.
+    :param expected_sha256: An optional hex SHA-256 the file must match.
+    :param attempts: The number of times a dropped or truncated transfer is resumed.
+    :return: A (status code, response headers, sha256, size) tuple. sha256 and size are None
+             when nothing was written (304 or error status).
+    :raises ValueError: If the file does not match 'expected_sha256'.
+    """
+
+    part_path = f"{file_path}.part"
+    validator_path = f"{part_path}.json"
+
+    for attempt in range(1, attempts + 1):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        request_headers = dict(headers or {})
+        if offset:
+            request_headers = {"Range": f"bytes={offset}-"}
+            if os.path.exists(validator_path):
+                with open(validator_path) as file:
+                    request_headers["If-Range"] = json.load(file)["validator"]
+
+        try:
+            with client.get(
+                url, headers=request_headers, stream=True, allow_redirects=True
+            ) as r:
+                if r.status_code == 416:
+                    # the partial file does not fit the remote one any more, start over
+                    os.remove(part_path)
+                    continue
+                if r.status_code not in [200, 206]:
+                    return r.status_code, r.headers, None, None
+
+                digest = hashlib.sha256()
+                if r.status_code == 206:
+                    with open(part_path, "rb") as file:
+                        for chunk in iter(lambda: file.read(DOWNLOAD_CHUNK_SIZE), b""):
+                            digest.update(chunk)
+                    mode = "ab"
+                else:
+                    offset = 0
+                    validator = r.headers.get("ETag") or r.headers.get("Last-Modified")
+                    with open(validator_path, "w") as file:
+                        json.dump({"url": url, "validator": validator}, file)
+                    mode = "wb"
+
+                size = offset
+                with open(part_path, mode) as file:
+                    for chunk in r.iter_content(DOWNLOAD_CHUNK_SIZE):
+                        file.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+
+                expected_size = _expected_size(r)
+                response_headers = r.headers
+        except (
+            requests.ConnectionError,
+            requests.exceptions.ChunkedEncodingError,
+        ) as e:
+            logging.warning(
+                f"download interrupted ({attempt}/{attempts}): {url}: {e!r}"
+            )
+            continue
+
+        if expected_size is not None and size < expected_size:
+            logging.warning(
+                f"download truncated ({attempt}/{attempts}): {url}: {size}/{expected_size}"
+            )
+            continue
+        break
     else:
-        logging.debug(f"status code: {_status}")
-    link_soup = BeautifulSoup(link_page.content, "html.parser")
-    download_link = link_soup.find("a", class_="resource-url-analytics")["href"]
-    return download_link
+        raise requests.ConnectionError(
+            f"download failed after {attempts} attempts: {url}"
+        )
+
+    sha256 = digest.hexdigest()
+    if expected_sha256 and sha256 != expected_sha256.lower():
+        os.remove(part_path)
+        os.remove(validator_path)
+        raise ValueError(f"checksum mismatch for {url}: {sha256} != {expected_sha256}")
+
+    os.replace(part_path, file_path)
+    if os.path.exists(validator_path):
+        os.remove(validator_path)
+    return r.status_code, response_headers, sha256, size
 
 
-def local_download(dataset, theme_name):
+def local_download(dataset, theme_name, manifest=None, expected_sha256=None):
     """
     Downloads a dataset and saves it to a specified theme directory.
 
     :param dataset: A 'Dataset' object containing dataset details.
     :param theme_name: A string representing the name of the theme.
-    :return: None. The function saves the downloaded file locally.
+    :param manifest: An optional 'Manifest'. When given, the request is conditional and the
+                     download is recorded in it.
+    :param expected_sha256: An optional hex SHA-256 the downloaded file must match.
+    :return: "added", "changed" or "unchanged" with a manifest, None otherwise. The function
+             saves the downloaded file locally.
     """
 
     logging.debug(f"local_download. dataset: {dataset}, theme_name: {theme_name}")
 
-    file_extension = dataset.download_link.split(".")[-1]
-    folder_path = os.path.join(f"data/{theme_name}")  # Folder path for the theme
+    file_path = dataset_file_path(dataset, theme_name)
+    folder_path = os.path.dirname(file_path)
+    key = manifest_key(dataset, theme_name)
 
     # Create the folder if it does not exist
     if not os.path.exists(folder_path):
         os.makedirs(folder_path)
 
-    file_path = os.path.join(folder_path, f"{dataset.name}.{file_extension}")
-    r = requests.get(dataset.download_link, allow_redirects=True)
-    with open(file_path, "wb") as file:
-        file.write(r.content)
+    headers = manifest.conditional_headers(key, file_path) if manifest else {}
+    _status, response_headers, sha256, size = stream_download(
+        dataset.download_link, file_path, headers, expected_sha256
+    )
+    if manifest and _status == 304:
+        logging.debug(f"not modified: {key}")
+        manifest.record_not_modified(key, dataset_metadata(dataset))
+        return "unchanged"
+    if sha256 is None:
+        logging.debug(f"\n\nERROR")
+        logging.debug(f"link: {dataset.download_link}")
+        logging.debug(f"status code: {_status}\n\n")
+        return None
+
+    if manifest:
+        status = manifest.record(
+            key,
+            dataset.download_link,
+            response_headers,
+            sha256,
+            size,
+            dataset_metadata(dataset),
+        )
+        logging.debug(f"{status}: {key}")
+        return status
+
+
+def dataset_from_page_info(page_info):
+    """
+    :param page_info: The dict returned by 'get_dataset_page'.
+    :return: The corresponding 'Dataset' object.
+    """
 
+    return Dataset(
+        name=page_info["name"],
+        url=f"{BASE_URL}/data/fr/dataset/{page_info['name']}",
+        download_link=page_info["download_link"],
+        tags=page_info["tags"],
+        resources=page_info["resources"],
+    )
 
-def get_datasets(theme):
+
+def seed_frontier(frontier):
+    """
+    Adds the first page of every theme to the frontier.
+
+    :param frontier: A 'Frontier' object.
+    :return: None.
     """
-    Scrapes and processes all datasets under a given theme.
 
-    :param theme: A 'Theme' object representing the theme to scrape.
-    :return: None. The function updates the 'Theme' object with datasets.
+    for theme in get_themes():
+        theme_url = f"{BASE_URL}/{theme.url}"
+        frontier.add(
+            "theme_page",
+            f"{theme_url}?page=1",
+            theme.name,
+            {"page": 1, "theme_url": theme_url, "theme_path": theme.url},
+        )
+
+
+def process_item(item, frontier, manifest=None):
     """
+    Processes one item of the frontier, adding the items it leads to.
 
-    logging.debug(f"get_datasets: {theme.name}")
+    - A theme page adds its dataset pages, and the next theme page unless it was empty.
+    - A dataset page adds the download of its dataset.
+    - A download saves the file through 'local_download'.
 
-    current_page = 1  # Start from the first page of the theme
-    base_url = f"https://data.gov.ma/{theme.url}"
-    while (
-        True or current_page < 50
-    ):  # <========= maybe find a better secondary condition ?
-        logging.debug(f"current_page: {current_page}")
-        paginated_url = f"{base_url}?page={current_page}"
-        page = requests.get(paginated_url)
+    :param item: An item claimed from the frontier.
+    :param frontier: The 'Frontier' the item comes from.
+    :param manifest: An optional 'Manifest' passed on to 'local_download'.
+    :return: The result to store with the item.
+    :raises RuntimeError: If the item could not be processed.
+    """
 
-        _status = page.status_code
+    kind, theme_name, payload = item["kind"], item["theme"], item["payload"]
+    logging.debug(f"process_item: {kind} {item['url']}")
 
+    if kind == "theme_page":
+        _status, content = fetch(item["url"])
         if _status != 200:
-            logging.debug(f"\n\nERROR")
-            logging.debug(f"link: {page.url}")
-            logging.debug(f"status code: {_status}\n\n")
-            break
-        else:
-            logging.debug(f"status code: {_status}")
-        soup = BeautifulSoup(page.content, "html.parser")
+            raise RuntimeError(f"status code {_status}")
+        dataset_links = parse_dataset_items(content)
+        for link in dataset_links:
+            frontier.add("dataset_page", f"{BASE_URL}/{link}", theme_name)
+
+        # an empty page is the end of the theme, so pagination simply stops here
+        page = payload["page"]
+        if dataset_links and page < MAX_PAGES:
+            frontier.add(
+                "theme_page",
+                f"{payload['theme_url']}?page={page + 1}",
+                theme_name,
+                dict(payload, page=page + 1),
+            )
+        return {"datasets": len(dataset_links)}
+
+    if kind == "dataset_page":
+        page_info = get_dataset_page(item["url"])
+        if page_info is None:
+            raise RuntimeError("dataset page without downloadable resource")
+        frontier.add("download", page_info["download_link"], theme_name, page_info)
+        return None
+
+    if kind == "download":
+        dataset = dataset_from_page_info(payload)
+        if local_download(dataset, theme_name, manifest) is None and manifest:
+            raise RuntimeError("download failed")
+        logging.info("=" * 50)
+        logging.info(dataset)
+        key = manifest_key(dataset, theme_name)
+        return {"key": key, "entry": manifest.entries.get(key) if manifest else None}
 
-        dataset_items = soup.find_all("li", class_="dataset-item")
-        if not dataset_items:
-            break  # while loop breakpoint
+    raise RuntimeError(f"unknown item kind: {kind}")
+
+
+def worker_settings():
+    """
+    :return: The settings of this process a spawned worker must apply, since it starts from a
+             fresh import of the module.
+    """
+
+    return {
+        "base_url": BASE_URL,
+        "rate": client.bucket.rate if client.bucket else None,
+        "cache_enabled": http_cache.enabled,
+        "cache_ttl": http_cache.ttl,
+    }
+
+
+def run_worker(
+    worker, frontier_path=FRONTIER_PATH, manifest_path=MANIFEST_PATH, settings=None
+):
+    """
+    Claims and processes items of the frontier until there is nothing left to do.
+
+    The worker only reads the manifest, for the conditional requests. What it downloads is
+    stored in the frontier and merged into the manifest by 'merge_downloads'.
+
+    :param worker: A name identifying the worker.
+    :param frontier_path: The path of the frontier database.
+    :param manifest_path: The path of the manifest.
+    :param settings: The dict returned by 'worker_settings' in the parent process, for a worker
+                     running in a process of its own.
+    :return: None.
+    """
 
-        for item in dataset_items:
-            try:
-                link = item.find("ul").find("li").find("a")["href"]
-            except:
+    global BASE_URL
+    if settings:
+        BASE_URL = settings["base_url"]
+        client.set_rate(settings["rate"])
+        http_cache.enabled = settings["cache_enabled"]
+        http_cache.ttl = settings["cache_ttl"]
+
+    frontier = Frontier(frontier_path)
+    manifest = Manifest(manifest_path)
+    idle_since = None
+    while True:
+        item = frontier.claim(worker)
+        if item is None:
+            # other workers may still add items from the pages they are processing
+            if not frontier.counts().get("running"):
                 break
+            idle_since = idle_since or time.monotonic()
+            if time.monotonic() - idle_since > WORKER_IDLE_TIMEOUT:
+                logging.warning(f"{worker}: giving up on items still running elsewhere")
+                break
+            time.sleep(1)
+            continue
+
+        idle_since = None
+        try:
+            result = process_item(item, frontier, manifest)
+        except Exception as e:
+            logging.error(f"{worker}: failed {item['kind']} {item['url']}: {e!r}")
+            frontier.fail(item["id"], repr(e))
+        else:
+            frontier.done(item["id"], result)
+
+    logging.info(f"{worker}: http client: {client.stats()}")
+    frontier.close()
+
+
+def run_workers(count, frontier_path=FRONTIER_PATH, manifest_path=MANIFEST_PATH):
+    """
+    Runs 'run_worker' in several processes until the frontier is exhausted.
+
+    The workers are spawned rather than forked: a SQLite connection or a pool of open sockets
+    must not be carried into a child process. When a worker dies, the items it was running are
+    put back to pending, or marked failed after MAX_ATTEMPTS, and it is restarted if there is
+    work left.
+
+    :param count: The number of worker processes.
+    :param frontier_path: The path of the frontier database.
+    :param manifest_path: The path of the manifest.
+    :return: None.
+    """
+
+    context = multiprocessing.get_context("spawn")
+    settings = worker_settings()
+    processes = {}
+
+    def start(worker):
+        processes[worker] = context.Process(
+            target=run_worker,
+            args=(worker, frontier_path, manifest_path, settings),
+            name=worker,
+        )
+        processes[worker].start()
+
+    for i in range(count):
+        start(f"worker-{i}")
+
+    frontier = Frontier(frontier_path)
+    while processes:
+        multiprocessing.connection.wait(
+            [process.sentinel for process in processes.values()]
+        )
+        for worker, process in list(processes.items()):
+            if process.exitcode is None:
+                continue
+            del processes[worker]
+            if process.exitcode == 0:
+                continue
+            pending, failed = frontier.requeue(worker, MAX_ATTEMPTS)
+            logging.error(
+                f"{worker} died with exit code {process.exitcode}: "
+                f"{pending} items put back to pending, {failed} failed"
+            )
+            if frontier.counts().get("pending"):
+                start(worker)
+    frontier.close()
 
-            nav = f"https://data.gov.ma/{link}"
-            link_page = requests.get(nav)
-            _status = link_page.status_code
-
-            if _status != 200:
-                logging.debug(f"\n\nERROR")
-                logging.debug(f"link: {link_page.url}")
-                logging.debug(f"status code: {_status}\n\n")
-            else:
-                logging.debug(f"status code: {_status}")
-            link_soup = BeautifulSoup(link_page.content, "html.parser")
-            db_link = link_soup.find("li", class_="resource-item").find("a")["href"]
-            db_name = get_dataset_name(db_link)
-            db_tags = get_dataset_tag(db_link)
-            download_link = get_download_link(db_link)
-            dataset = Dataset(
-                name=db_name,
-                url=f"https://data.gov.ma/data/fr/dataset/{db_name}",
-                download_link=download_link,
-                tags=db_tags,
+
+def merge_downloads(frontier, manifest):
+    """
+    Rebuilds the themes of a frontier and records its downloads in the manifest.
+
+    :param frontier: A 'Frontier' object.
+    :param manifest: The 'Manifest' to update.
+    :return: A list of 'Theme' objects filled with their downloaded datasets.
+    """
+
+    themes = {}
+    for item in frontier.items("theme_page", status=None):
+        if item["payload"]["page"] == 1:
+            themes[item["theme"]] = Theme(item["theme"])
+            themes[item["theme"]].change_url(item["payload"]["theme_path"])
+
+    for item in frontier.items("download"):
+        themes[item["theme"]].add_dataset(dataset_from_page_info(item["payload"]))
+        entry = item["result"]["entry"]
+        if entry:
+            headers = {"ETag": entry["etag"], "Last-Modified": entry["last_modified"]}
+            manifest.record(
+                item["result"]["key"],
+                entry["url"],
+                headers,
+                entry["sha256"],
+                entry["size"],
+                entry.get("metadata"),
             )
-            theme.add_dataset(dataset)
-            local_download(dataset, theme.name)
 
-            logging.info("=" * 50)
-            logging.info(dataset)
+    # a file that could not be downloaded this time is not gone upstream
+    for item in frontier.items("download", status="failed"):
+        manifest.keep(
+            manifest_key(dataset_from_page_info(item["payload"]), item["theme"])
+        )
 
-        current_page += 1  # move onto next page
+    return list(themes.values())
 
 
 def get_themes():
@@ -246,45 +747,92 @@ def get_themes():
     """
 
     logging.debug(f"get_themes")
-    url = "https://data.gov.ma/data/fr/group"
-    page = requests.get(url)
+    url = f"{BASE_URL}/data/fr/group"
+    _, content = fetch(url)
+    return parse_themes(content)
 
-    _status = page.status_code
-    if _status != 200:
-        logging.debug(f"\n\nERROR")
-        logging.debug(f"link: {page.url}")
-        logging.debug(f"status code: {_status}\n\n")
+
+def main():
+    parser = argparse.ArgumentParser(description="data.gov.ma harvest")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the page cache")
+    parser.add_argument(
+        "--cache-ttl", type=int, default=http_cache.ttl, help="in seconds"
+    )
+    parser.add_argument(
+        "--rate",
+        type=parse_rate,
+        default=RATE,
+        help="requests per second, per worker, 0 for no limit",
+    )
+    parser.add_argument(
+        "--resume", action="store_true", help="continue the harvest of the frontier"
+    )
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="continue the harvest of the frontier, retrying its failed items",
+    )
+    parser.add_argument("--workers", type=int, default=1, help="worker processes")
+    args = parser.parse_args()
+    http_cache.enabled = not args.no_cache
+    http_cache.ttl = args.cache_ttl
+    client.set_rate(args.rate)
+
+    resume = args.resume or args.retry_failed
+    if not resume:
+        for suffix in ["", "-wal", "-shm"]:
+            if os.path.exists(FRONTIER_PATH + suffix):
+                os.remove(FRONTIER_PATH + suffix)
+
+    frontier = Frontier()
+    if resume:
+        logging.info(f"resuming, {frontier.reset_running()} interrupted items reset")
+    if args.retry_failed:
+        logging.info(f"retrying {frontier.retry_failed()} failed items")
+    if not frontier.counts():
+        seed_frontier(frontier)
+
+    if args.workers > 1:
+        run_workers(args.workers)
     else:
-        logging.debug(f"status code: {_status}")
+        run_worker("worker-0")
 
-    soup = BeautifulSoup(page.content, "html.parser")
+    manifest = Manifest()
+    themes = merge_downloads(frontier, manifest)
+    counts = frontier.counts()
+    complete = not counts.get("failed") and not counts.get("pending")
 
-    theme_objects = []
-    for h2 in soup.find_all("h2", class_="media-heading"):
-        text = h2.get_text().strip()
-        theme_objects.append(Theme(text))
+    logging.info("\n\n\n")
+    logging.info(
+        "===== LOADING COMPLETE =====" if complete else "===== LOADING PARTIAL ====="
+    )
+    for theme in themes:
+        logging.info(theme)
+    logging.info(f"frontier: {counts}")
+    if not complete:
+        print(f"frontier: {counts}, rerun with --retry-failed or --resume")
 
-    theme_cnt = 0
-    for a in soup.find_all("a", class_="media-view"):
-        link = a["href"]
-        theme_objects[theme_cnt].change_url(link)
-        theme_cnt += 1
+    # removals are only known once every page of the harvest was seen
+    log_report(manifest.save(drop_removed=complete))
+    frontier.close()
 
-    return theme_objects
 
+def log_report(report):
+    """
+    Logs and prints what a harvest added, changed or removed.
 
-def main():
-    themes = get_themes()
-    for theme in themes:
-        logging.info("*" * 80)
-        logging.info(f"\n-----\t\tTheme: {theme.name}\t\t-----\n")
-        logging.info("*" * 80)
-        get_datasets(theme)
+    :param report: The dict returned by 'Manifest.save'.
+    :return: None.
+    """
 
-    logging.info("\n\n\n")
-    logging.info("===== LOADING COMPLETE =====")
-    for theme in themes:
-        logging.info(theme)
+    logging.info("===== CHANGES =====")
+    for status in ["added", "changed", "removed"]:
+        for key in report[status]:
+            logging.info(f"{status}: {key}")
+    print(
+        f"added: {len(report['added'])}, changed: {len(report['changed'])}, "
+        f"unchanged: {len(report['unchanged'])}, removed: {len(report['removed'])}"
+    )
 
 
 if __name__ == "__main__":
@@ -1,5 +1,27 @@
 import os
+import re
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
+from manifest import Manifest, file_sha256, load_changed_files
+from csv_index import index_path, write_index
+from csv_compression import gzip_path
+from dataset_profile import profile_path, write_profile
+from catalog import write_catalogs
+from search_index import write_search_index
+from dataset_query import clean_column_names
+
+try:
+    import python_calamine  # noqa: F401 (Rust reader, used through pandas' "calamine" engine)
+except ImportError:
+    python_calamine = None
+
+try:
+    import pyarrow  # noqa: F401 (Parquet writer, used through 'DataFrame.to_parquet')
+except ImportError:
+    pyarrow = None
 
 # import shutil
 
@@ -16,15 +38,68 @@ it identifies Excel files, reads them into a pandas DataFrame, and then saves th
 Each CSV file is named after the original Excel file and is stored in the corresponding thematic
 subfolder in 'csv_data'.
 
-The script is structured to handle and skip non-directory files encountered in the 'data' directory 
+The script is structured to handle and skip non-directory files encountered in the 'data' directory
 and also to skip files within each thematic folder that do not have an Excel file extension.
 
+Parsing Excel is CPU-bound, so the files are converted by a pool of worker processes, one per core
+by default. The conversion is incremental: a file is skipped when its CSV is newer than the source,
+or when the SHA-256 of the source matches the one recorded at its last conversion (in
+'conversions.json', next to the 'data' directory rather than in it, where it would be scanned as a
+theme). Every file is reported with its outcome and conversion time.
+
+Workbooks are read with the "calamine" engine when 'python-calamine' is installed: it parses
+large '.xls'/'.xlsx' files several times faster than openpyxl and xlrd, the pandas defaults, which
+remain the fallback (see 'benchmark_excel_engines.py'). Every sheet of a workbook is exported:
+the first one to '<name>.csv' as before, the next ones to '<name>__<sheet>.csv'. Every CSV gets a
+'<name>.idx.json' row offset index next to it ('csv_index.py'), so the handlers can fetch any page
+of it with a ranged S3 request, a gzip compressed copy, '<name>.csv.gz', that the handlers read
+instead of the CSV ('csv_compression.py'), and a '<name>.profile.json' profile: the type, null
+count, range and most frequent values of every column ('dataset_profile.py'), served by the stats
+endpoint.
+
+Next to the CSV, every sheet is also written as a zstd-compressed Parquet file in 'parquet_data',
+with the same '<theme>/<name>.parquet' layout. The CSV is kept verbatim, while the Parquet copy has
+a normalized schema (see 'normalize_frame'): snake_case column names ('clean_column_names' of
+'dataset_query.py'), and numeric, integer and
+date columns inferred from the text. The serving handlers read it to return typed JSON
+('s3_datasets.py'). Parquet needs 'pyarrow', and is skipped when it is not installed.
+
+At the end of a run, the catalogs of the datasets are written in 'csv_data': '_catalog.json' in
+every theme folder and a global one, with the size, rows, columns, ETag and scraped metadata of
+every CSV ('catalog.py'). The catalog endpoint serves them. The search index of the catalog,
+'csv_data/_search.json.gz', is written with them ('search_index.py').
+
+Functions:
+- find_excel_files(data_dir, changed_files): Lists the '(theme, filename)' pairs to convert.
+- pick_engine(engine): Resolves the "auto" engine to the fastest reader installed.
+- read_workbook(source_path, engine): Reads every sheet of a workbook, falling back to the pandas
+  default engines if the requested one fails.
+- sheet_output_path(path, sheet_name, index): Builds the output path of a sheet.
+- normalize_frame(df): Infers the column types of a sheet read as text.
+- convert_file(source_path, csv_path, parquet_path, previous_sha256, force, engine): Converts
+  one workbook, unless it is up to date. Runs in the worker processes.
+- process_all(data_dir, csv_dir, parquet_dir, workers, changed_only, force, engine,
+  conversions_path): Converts a whole data directory.
+- main(): The command line interface.
+
 Usage:
     Run this script with Python in an environment where pandas is installed.
+    Pass '--changed-only' to convert only the files the last harvest added or changed, as
+    recorded in 'data/manifest.json' (see 'manifest.py').
+    Pass '--workers 1' to convert in the current process, '--force' to reconvert everything.
+    Pass '--engine openpyxl' (or any pandas engine) to force a reader, '--engine default' to let
+    pandas pick.
+    Pass '--no-parquet' to write the CSV files only, keeping the Parquet files of earlier runs.
 
 Example:
     To execute the script, use the following command:
     python <script_name>.py
+    python <script_name>.py --changed-only
+    python <script_name>.py --workers 4 --force
+
+    Or from Python:
+    from data_processor import process_all
+    results = process_all("data", "csv_data")
 
 Note:
     - The script requires the 'data' directory to be present in the same directory as the script.
@@ -33,34 +108,434 @@ Note:
     - This script is compatible with Python 3.8 or later.
 """
 
-# Create csv_data directory if it doesn't exist
-csv_data_path = "csv_data"
-if not os.path.exists(csv_data_path):
-    os.makedirs(csv_data_path)
-
-for theme in os.listdir("data"):
-    theme_path = os.path.join("data", theme)
-
-    if os.path.isdir(theme_path):
-        print(f"Processing theme: {theme}")
-
-        # Create subdirectory for theme in csv_data if it doesn't exist
-        theme_csv_dir = os.path.join(csv_data_path, theme)
-        if not os.path.exists(theme_csv_dir):
-            os.makedirs(theme_csv_dir)
-
-        for filename in os.listdir(theme_path):
-            print(f"Processing {filename}")
-            file_path = os.path.join(theme_path, filename)
-            file_extension = filename.split(".")[-1]
-
-            if file_extension in ["xls", "xlsx"]:
-                df = pd.read_excel(file_path)
-                csv_filename = os.path.splitext(filename)[0] + ".csv"
-                csv_path = os.path.join(theme_csv_dir, csv_filename)
-                df.to_csv(csv_path, index=False)
-                print(f"Done with {filename}")
+DATA_PATH = "data"
+CSV_DATA_PATH = "csv_data"
+PARQUET_DATA_PATH = "parquet_data"
+PARQUET_COMPRESSION = "zstd"
+PARQUET_ROW_GROUP_SIZE = 100000  # row group statistics let filtered reads skip groups
+CONVERSIONS_FILENAME = "conversions.json"
+EXCEL_EXTENSIONS = ["xls", "xlsx"]
+SHEET_SEPARATOR = "__"
+MISSING_VALUES = ["", "-", "--", "n/a", "N/A", "nd", "n.d."]
+LEADING_ZERO_PATTERN = r"^[+-]?0\d"  # codes such as "01234", not numbers
+DATE_PATTERN = r"^\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}([ T]\d{1,2}:\d{2}(:\d{2})?)?$"
+
+
+def pick_engine(engine="auto"):
+    """
+    Resolves the engine passed to 'pd.read_excel'.
+
+    :param engine: "auto" for the fastest reader installed, "default" for the pandas defaults
+                   (openpyxl for '.xlsx', xlrd for '.xls'), or the name of a pandas engine.
+    :return: The engine name, or None for the pandas defaults.
+    """
+
+    if engine == "auto":
+        return "calamine" if python_calamine is not None else None
+    if engine == "default":
+        return None
+    return engine
+
+
+def read_workbook(source_path, engine="auto"):
+    """
+    Reads every sheet of an Excel file.
+
+    :param source_path: The path of the Excel file.
+    :param engine: See 'pick_engine'.
+    :return: A ({sheet name: DataFrame}, engine used) tuple, sheets in workbook order.
+    """
+
+    engine = pick_engine(engine)
+    try:
+        return pd.read_excel(source_path, sheet_name=None, engine=engine), engine
+    except Exception as e:
+        if engine is None:
+            raise
+        print(
+            f"{engine} failed on {source_path} ({e!r}), falling back to pandas defaults"
+        )
+        return pd.read_excel(source_path, sheet_name=None), None
+
+
+def sheet_output_path(path, sheet_name, index):
+    """
+    Builds the output path of a sheet. The first sheet keeps the path of the workbook, so single
+    sheet workbooks are converted as before.
+
+    :param path: The output path of the workbook, e.g. '<name>.csv'.
+    :param sheet_name: The name of the sheet.
+    :param index: The position of the sheet in the workbook.
+    :return: '<name>.csv' for the first sheet, '<name>__<sheet>.csv' for the next ones (same
+             extension as 'path').
+    """
+
+    if index == 0:
+        return path
+    slug = re.sub(r"[^\w-]+", "_", str(sheet_name)).strip("_") or str(index)
+    base, extension = os.path.splitext(path)
+    return f"{base}{SHEET_SEPARATOR}{slug}{extension}"
+
+
+def normalize_frame(df):
+    """
+    Builds the Parquet version of a sheet. Text columns whose every value parses as a number
+    (spaces and a decimal comma allowed) or as a date become numeric or datetime columns, unless
+    a value has leading zeros: such columns hold codes (postal codes, identifiers) and stay text.
+    Numeric columns holding only whole numbers become nullable integers. Other text columns are
+    stored as strings.
+
+    :param df: The sheet as read by 'pd.read_excel'.
+    :return: A new DataFrame with clean column names and inferred types.
+    """
+
+    df = df.copy()
+    df.columns = clean_column_names(df.columns)
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            text = series.map(
+                lambda value: None if pd.isna(value) else str(value).strip()
+            )
+            text = text.where(~text.isin(MISSING_VALUES))
+            values = text.dropna()
+            compact = text.str.replace("[\\s\u00a0]", "", regex=True)
+            numbers = pd.to_numeric(compact.str.replace(",", "."), errors="coerce")
+            codes = compact.dropna().str.match(LEADING_ZERO_PATTERN).any()
+            if values.empty:
+                series = text.astype("string")
+            elif numbers.notna().sum() == len(values) and not codes:
+                series = numbers
+            elif values.str.match(DATE_PATTERN).all():
+                dates = pd.to_datetime(text, errors="coerce", dayfirst=True)
+                series = dates if dates.notna().sum() == len(values) else text
             else:
-                print(f"Skipping non-Excel file: {filename}")
+                series = text
+            if pd.api.types.is_object_dtype(series):
+                series = series.astype("string")
+
+        if pd.api.types.is_datetime64_any_dtype(series):
+            # stored as Parquet dates when there is no time of day
+            values = series.dropna()
+            if (values == values.dt.normalize()).all():
+                series = series.dt.date
+
+        if pd.api.types.is_float_dtype(series):
+            values = series.dropna()
+            if not values.empty and (values == values.round()).all():
+                if values.abs().max() < 2**53:
+                    series = series.astype("Int64")
+        df[column] = series
+    return df
+
+
+def _write_atomic(path, write):
+    # write next to the target first so an interrupted run never leaves half a file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def find_excel_files(data_dir=DATA_PATH, changed_files=None):
+    """
+    Lists the Excel files of the thematic folders of a data directory.
+
+    :param data_dir: The directory holding one folder per theme.
+    :param changed_files: An optional set of '<theme>/<filename>' keys. Files outside of it are
+                          skipped.
+    :return: A sorted list of (theme, filename) tuples.
+    """
+
+    excel_files = []
+    for theme in sorted(os.listdir(data_dir)):
+        theme_path = os.path.join(data_dir, theme)
+        if not os.path.isdir(theme_path):
+            print(f"Skipping non-directory: {theme}")
+            continue
+
+        for filename in sorted(os.listdir(theme_path)):
+            if filename.split(".")[-1] not in EXCEL_EXTENSIONS:
+                print(f"Skipping non-Excel file: {theme}/{filename}")
+                continue
+            if changed_files is not None and f"{theme}/{filename}" not in changed_files:
+                print(f"Skipping unchanged file: {theme}/{filename}")
+                continue
+            excel_files.append((theme, filename))
+    return excel_files
+
+
+def convert_file(
+    source_path,
+    csv_path,
+    parquet_path=None,
+    previous_sha256=None,
+    force=False,
+    engine="auto",
+):
+    """
+    Converts every sheet of an Excel file to CSV and Parquet, unless its outputs are already up
+    to date.
+
+    :param source_path: The path of the Excel file.
+    :param csv_path: The path of the CSV file of the first sheet, see 'sheet_output_path'.
+    :param parquet_path: The path of the Parquet file of the first sheet. None writes no Parquet.
+    :param previous_sha256: The SHA-256 of the source at its last conversion, if any.
+    :param force: Convert even if the CSV looks up to date.
+    :param engine: See 'pick_engine'.
+    :return: A dict with the "status" ("converted", "up to date" or "unchanged"), the "sha256"
+             of the source (None when it was not needed), the number of "rows" of every sheet,
+             the "outputs" written and the "engine" used (None when skipped), and the
+             "seconds" spent.
+    """
+
+    start = time.perf_counter()
+    result = {
+        "status": None,
+        "sha256": None,
+        "rows": None,
+        "outputs": None,
+        "engine": None,
+    }
+
+    sidecars = [gzip_path(csv_path), index_path(csv_path), profile_path(csv_path)]
+    targets = [path for path in [csv_path, *sidecars, parquet_path] if path]
+    if not force and all(os.path.exists(path) for path in targets):
+        if min(map(os.path.getmtime, targets)) >= os.path.getmtime(source_path):
+            result["status"] = "up to date"
+        else:
+            # a new download of the same content only refreshes the mtime of the source
+            result["sha256"] = file_sha256(source_path)
+            if result["sha256"] == previous_sha256:
+                for path in targets:
+                    os.utime(path)
+                result["status"] = "unchanged"
+
+    if result["status"] is None:
+        result["sha256"] = result["sha256"] or file_sha256(source_path)
+        sheets, result["engine"] = read_workbook(source_path, engine)
+        result["rows"], result["outputs"] = [], []
+        for index, (sheet_name, df) in enumerate(sheets.items()):
+            if index > 0 and df.empty:
+                continue
+            sheet_path = sheet_output_path(csv_path, sheet_name, index)
+            _write_atomic(sheet_path, lambda path: df.to_csv(path, index=False))
+            result["outputs"].append(sheet_path)
+            result["outputs"].append(write_index(sheet_path, compress=True))
+            result["outputs"].append(gzip_path(sheet_path))
+            typed = normalize_frame(df)
+            result["outputs"].append(write_profile(sheet_path, df, typed))
+            if parquet_path:
+                sheet_path = sheet_output_path(parquet_path, sheet_name, index)
+                _write_atomic(
+                    sheet_path,
+                    lambda path: typed.to_parquet(
+                        path,
+                        index=False,
+                        compression=PARQUET_COMPRESSION,
+                        row_group_size=PARQUET_ROW_GROUP_SIZE,
+                    ),
+                )
+                result["outputs"].append(sheet_path)
+            result["rows"].append(len(df))
+        result["status"] = "converted"
+
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def _load_conversions(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def _inside(path, directory):
+    return os.path.commonpath([os.path.abspath(path), os.path.abspath(directory)]) == (
+        os.path.abspath(directory)
+    )
+
+
+def _save_conversions(path, conversions):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(conversions, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def process_all(
+    data_dir=DATA_PATH,
+    csv_dir=CSV_DATA_PATH,
+    parquet_dir=PARQUET_DATA_PATH,
+    workers=None,
+    changed_only=False,
+    force=False,
+    engine="auto",
+    conversions_path=None,
+):
+    """
+    Converts every Excel file of a data directory to CSV and Parquet, in parallel, then writes
+    the catalogs and the search index of the CSV directory ('catalog.py', 'search_index.py').
+
+    :param data_dir: The directory holding one folder per theme.
+    :param csv_dir: The directory the CSV files are written to, one folder per theme.
+    :param parquet_dir: The directory the Parquet files are written to, one folder per theme.
+                        None, or 'pyarrow' missing, writes no Parquet.
+    :param workers: The number of worker processes. None uses every core, 1 converts in the
+                    current process.
+    :param changed_only: Only consider the files the last harvest added or changed.
+    :param force: Reconvert files even if their CSV looks up to date.
+    :param engine: The Excel reader, see 'pick_engine'.
+    :param conversions_path: The record of the conversions, see 'convert_file'. None uses
+                             'conversions.json' next to the data directory.
+    :return: A dict of {'<theme>/<filename>': result}, see 'convert_file'. A failed conversion
+             has the "failed" status and an "error".
+    """
+
+    manifest_path = os.path.join(data_dir, "manifest.json")
+    changed_files = load_changed_files(manifest_path) if changed_only else None
+    if conversions_path is None:
+        parent_dir = os.path.dirname(os.path.abspath(data_dir))
+        conversions_path = os.path.join(parent_dir, CONVERSIONS_FILENAME)
+    legacy_path = os.path.join(data_dir, CONVERSIONS_FILENAME)
+    if os.path.exists(legacy_path) and not os.path.exists(conversions_path):
+        os.replace(legacy_path, conversions_path)
+    conversions = _load_conversions(conversions_path)
+
+    if parquet_dir and pyarrow is None:
+        print("pyarrow is not installed, skipping Parquet output")
+        parquet_dir = None
+    output_dirs = [output_dir for output_dir in [csv_dir, parquet_dir] if output_dir]
+
+    jobs = {}
+    for theme, filename in find_excel_files(data_dir, changed_files):
+        name = os.path.splitext(filename)[0]
+        paths = {}
+        for output_dir, extension in [(csv_dir, ".csv"), (parquet_dir, ".parquet")]:
+            if output_dir is None:
+                continue
+            theme_output_dir = os.path.join(output_dir, theme)
+            if not os.path.exists(theme_output_dir):
+                os.makedirs(theme_output_dir)
+            paths[extension] = os.path.join(theme_output_dir, name + extension)
+
+        key = f"{theme}/{filename}"
+        jobs[key] = (
+            os.path.join(data_dir, theme, filename),
+            paths[".csv"],
+            paths.get(".parquet"),
+            conversions.get(key, {}).get("sha256"),
+            force,
+            engine,
+        )
+
+    results = {}
+
+    def collect(key, result):
+        results[key] = result
+        if result["status"] == "failed":
+            print(f"Failed {key}: {result['error']}")
+            return
+        previous = conversions.get(key, {})
+        if result["outputs"] is not None:
+            # a workbook that lost sheets must not leave their CSV behind, but the outputs of a
+            # kind this run did not write (the Parquet files of a '--no-parquet' run) are kept
+            kept = [
+                path
+                for path in previous.get("outputs", [])
+                if not any(_inside(path, output_dir) for output_dir in output_dirs)
+            ]
+            stale = set(previous.get("outputs", [])) - set(result["outputs"] + kept)
+            for path in stale:
+                if os.path.exists(path):
+                    os.remove(path)
+            previous = {"outputs": result["outputs"] + kept, "engine": result["engine"]}
+        if result["sha256"]:
+            conversions[key] = dict(previous, sha256=result["sha256"])
+        print(f"{result['status'].capitalize()}: {key} ({result['seconds']:.2f}s)")
+
+    if workers == 1:
+        for key, job in jobs.items():
+            try:
+                collect(key, convert_file(*job))
+            except Exception as e:
+                collect(key, {"status": "failed", "error": repr(e)})
     else:
-        print(f"Skipping non-directory: {theme}")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(convert_file, *job): key for key, job in jobs.items()
+            }
+            for future in as_completed(futures):
+                try:
+                    collect(futures[future], future.result())
+                except Exception as e:
+                    collect(futures[future], {"status": "failed", "error": repr(e)})
+
+    _save_conversions(conversions_path, conversions)
+    # the catalogs describe every converted file, with what the harvest scraped about it
+    write_catalogs(csv_dir, conversions, Manifest(manifest_path).entries)
+    write_search_index(csv_dir)
+    return dict(sorted(results.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Excel to CSV and Parquet conversion")
+    parser.add_argument("--data-dir", default=DATA_PATH, help="harvested files")
+    parser.add_argument("--csv-dir", default=CSV_DATA_PATH, help="CSV output")
+    parser.add_argument(
+        "--parquet-dir", default=PARQUET_DATA_PATH, help="Parquet output"
+    )
+    parser.add_argument(
+        "--no-parquet", action="store_true", help="only write the CSV files"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="worker processes (default: cores)"
+    )
+    parser.add_argument(
+        "--changed-only",
+        action="store_true",
+        help="only the files the last harvest added or changed",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="reconvert files that look up to date"
+    )
+    parser.add_argument(
+        "--engine",
+        default="auto",
+        help='Excel reader: "auto" (calamine if installed), "default" or a pandas engine',
+    )
+    parser.add_argument(
+        "--conversions",
+        default=None,
+        help="record of the conversions (default: conversions.json next to --data-dir)",
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    print(f"Excel engine: {pick_engine(args.engine) or 'pandas default'}")
+    results = process_all(
+        args.data_dir,
+        args.csv_dir,
+        None if args.no_parquet else args.parquet_dir,
+        args.workers,
+        args.changed_only,
+        args.force,
+        args.engine,
+        args.conversions,
+    )
+    elapsed = time.perf_counter() - start
+
+    counts = {}
+    for result in results.values():
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    converted = [r["seconds"] for r in results.values() if r["status"] == "converted"]
+    print(f"{len(results)} files in {elapsed:.2f}s: {counts}")
+    if converted:
+        print(
+            f"conversion time: total {sum(converted):.2f}s, "
+            f"slowest {max(converted):.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
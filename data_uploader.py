@@ -0,0 +1,323 @@
+import os
+import gzip
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import boto3
+from boto3.s3.transfer import TransferConfig
+from csv_compression import GZIP_LEVEL, GZIP_SUFFIX, gzip_path
+from s3_datasets import BUCKET_NAME, CSV_PREFIX, PARQUET_PREFIX, STORED_CONTENT_TYPES
+
+"""
+Uploader of the Processed Data to S3
+
+The data hosting step: uploads 'csv_data' and 'parquet_data', as written by 'data_processor.py',
+to the bucket the handlers read, with the same layout ('csv_data/<theme>/<name>.csv', ...). Only
+the files whose content differs from the object of the bucket are sent, so an upload takes as long
+as the change, not as the corpus:
+- the bucket is listed once (one request per 1000 objects) for the ETag of every object,
+- the ETag of every local file is computed the way S3 computes it: the MD5 of the file, or for a
+  multipart upload the MD5 of the MD5s of its parts followed by '-<parts>',
+- a file whose ETag matches its object is skipped.
+
+Hashing is skipped too when a file keeps the size and modification time it had at the last upload:
+the ETags computed are remembered in 'data/uploads.json'.
+
+Every CSV is also uploaded gzip compressed, as '<name>.csv.gz' with 'Content-Encoding: gzip': the
+handlers read it instead of the CSV, and send it as it is to the clients accepting gzip. It is the
+block compressed copy written by 'data_processor.py' ('csv_compression.py'), or, for a CSV without
+one, a gzip stream written here. Either has no timestamp, so the same CSV always gives the same
+object and the same ETag. The object records the ETag and the size of its CSV in its metadata
+('source-etag', 'source-size'). With 'compressed_only', the CSV files themselves are not uploaded:
+the bucket then only stores (and bills) the compressed bytes.
+
+Files are uploaded by a pool of threads, files larger than MULTIPART_THRESHOLD in parts. The
+datasets go first: the catalogs and the search index ('_catalog.json', '_search.json.gz') are
+uploaded once the datasets they list are in the bucket.
+
+Functions:
+- local_files(directory, prefix): The files of a directory and their S3 keys.
+- s3_etag(path, ...): The ETag S3 gives a file once uploaded.
+- gzip_variant(path, directory): Writes the gzip variant of a file.
+- upload_all(csv_dir, parquet_dir, state_path, workers, s3_client, compressed_only): Uploads what
+  changed.
+"""
+
+DATA_PATH = "data"
+CSV_DATA_PATH = "csv_data"
+PARQUET_DATA_PATH = "parquet_data"
+UPLOADS_FILENAME = "uploads.json"
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+COMPRESSED_EXTENSIONS = (".csv",)  # the files that get a gzip variant
+CONTENT_TYPES = {
+    ".csv": STORED_CONTENT_TYPES["csv"],
+    ".parquet": STORED_CONTENT_TYPES["parquet"],
+    ".json": "application/json",
+    ".gz": "application/gzip",
+}
+
+
+def local_files(directory, prefix):
+    """
+    Lists the files of a directory to upload, temporary files excluded.
+
+    :param directory: The local directory, e.g. 'csv_data'.
+    :param prefix: Its S3 prefix, e.g. 'csv_data'.
+    :return: A sorted list of (path, key) tuples.
+    """
+
+    files = []
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            if filename.endswith(".tmp"):
+                continue
+            path = os.path.join(root, filename)
+            relative = os.path.relpath(path, directory).replace(os.sep, "/")
+            files.append((path, f"{prefix}/{relative}"))
+    return sorted(files)
+
+
+def s3_etag(path, threshold=MULTIPART_THRESHOLD, chunksize=MULTIPART_CHUNKSIZE):
+    """
+    Computes the ETag S3 gives a file uploaded with this threshold and part size.
+
+    :param path: The path of the file.
+    :return: The quoted ETag, as S3 returns it.
+    """
+
+    if os.path.getsize(path) <= threshold:
+        digest = hashlib.md5()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return f'"{digest.hexdigest()}"'
+
+    parts = []
+    with open(path, "rb") as file:
+        for part in iter(lambda: file.read(chunksize), b""):
+            parts.append(hashlib.md5(part).digest())
+    return f'"{hashlib.md5(b"".join(parts)).hexdigest()}-{len(parts)}"'
+
+
+def gzip_variant(path, directory):
+    """
+    Compresses a file without loading it in memory. The output has no timestamp nor file name,
+    so it only depends on the content.
+
+    :param path: The path of the file.
+    :param directory: Where to write the variant.
+    :return: The path of the variant.
+    """
+
+    # themes may hold files of the same name, every variant gets its own temporary file
+    target = tempfile.NamedTemporaryFile(
+        dir=directory, suffix=GZIP_SUFFIX, delete=False
+    )
+    with open(path, "rb") as source, target:
+        with gzip.GzipFile(
+            filename="", mode="wb", fileobj=target, compresslevel=GZIP_LEVEL, mtime=0
+        ) as compressed:
+            shutil.copyfileobj(source, compressed, CHUNK_SIZE)
+    return target.name
+
+
+def _remote_etags(s3_client, prefixes):
+    etags = {}
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for prefix in prefixes:
+        for page in paginator.paginate(Bucket=BUCKET_NAME, Prefix=f"{prefix}/"):
+            for obj in page.get("Contents", []):
+                etags[obj["Key"]] = obj["ETag"]
+    return etags
+
+
+def _load_state(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def _save_state(path, state):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(state, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def _content_type(key):
+    return CONTENT_TYPES.get(os.path.splitext(key)[1], "application/octet-stream")
+
+
+def _hashed(path, state):
+    # the ETags of a file, computed again only when its size or modification time changed
+    stat = os.stat(path)
+    entry = state.get(path, {})
+    if entry.get("size") != stat.st_size or entry.get("mtime") != stat.st_mtime:
+        entry = {"size": stat.st_size, "mtime": stat.st_mtime, "etag": s3_etag(path)}
+        state[path] = entry
+    return entry
+
+
+def _source_metadata(entry):
+    # what the handlers need to know of the CSV a compressed copy holds
+    return {"source-etag": entry["etag"], "source-size": str(entry["size"])}
+
+
+def _plan(path, key, state, tmp_dir, compressed_only=False):
+    # the uploads a file needs, with the ETags S3 would give them
+    entry = _hashed(path, state)
+    upload = {"path": path, "key": key, "etag": entry["etag"]}
+
+    if key.endswith(COMPRESSED_EXTENSIONS):
+        if os.path.exists(gzip_path(path)):
+            # its compressed copy, written by 'data_processor.py', is a file of its own
+            return [] if compressed_only else [upload]
+        variant = {
+            "path": None,
+            "key": gzip_path(key),
+            "source": path,
+            "encoding": "gzip",
+            "content_type": _content_type(key),
+            "metadata": _source_metadata(entry),
+        }
+        if "gzip_etag" not in entry:
+            variant["path"] = gzip_variant(path, tmp_dir)
+            entry["gzip_etag"] = s3_etag(variant["path"])
+        variant["etag"] = entry["gzip_etag"]
+        return [variant] if compressed_only else [upload, variant]
+
+    source_path = path[: -len(GZIP_SUFFIX)]
+    if source_path.endswith(COMPRESSED_EXTENSIONS) and os.path.exists(source_path):
+        upload["encoding"] = "gzip"
+        upload["content_type"] = _content_type(source_path)
+        upload["metadata"] = _source_metadata(_hashed(source_path, state))
+    return [upload]
+
+
+def _upload(s3_client, upload, config, tmp_dir):
+    # a variant whose ETag was remembered is only compressed again when it must be sent
+    path = upload["path"] or gzip_variant(upload["source"], tmp_dir)
+    extra_args = {"ContentType": upload.get("content_type") or _content_type(path)}
+    if upload.get("encoding"):
+        extra_args["ContentEncoding"] = upload["encoding"]
+    if upload.get("metadata"):
+        extra_args["Metadata"] = upload["metadata"]
+    s3_client.upload_file(
+        path, BUCKET_NAME, upload["key"], ExtraArgs=extra_args, Config=config
+    )
+    size = os.path.getsize(path)
+    if path.startswith(tmp_dir):
+        os.remove(path)
+    return size
+
+
+def upload_all(
+    csv_dir=CSV_DATA_PATH,
+    parquet_dir=PARQUET_DATA_PATH,
+    state_path=os.path.join(DATA_PATH, UPLOADS_FILENAME),
+    workers=8,
+    s3_client=None,
+    compressed_only=False,
+):
+    """
+    Uploads the files of the CSV and Parquet directories that differ from the bucket.
+
+    :param csv_dir: The CSV directory, uploaded under 'csv_data/'.
+    :param parquet_dir: The Parquet directory, uploaded under 'parquet_data/'. None skips it.
+    :param state_path: Where the ETags of the local files are remembered between runs.
+    :param workers: The number of files uploaded at the same time.
+    :param s3_client: A boto3 S3 client, a new one by default.
+    :param compressed_only: Upload the compressed copy of the CSV files, not the CSV.
+    :return: A dict with the "uploaded" and "skipped" keys and the number of "bytes" sent.
+    """
+
+    s3_client = s3_client or boto3.client("s3")
+    directories = [(csv_dir, CSV_PREFIX)]
+    if parquet_dir and os.path.isdir(parquet_dir):
+        directories.append((parquet_dir, PARQUET_PREFIX))
+    files = [file for args in directories for file in local_files(*args)]
+
+    remote = _remote_etags(s3_client, [prefix for _, prefix in directories])
+    state = _load_state(state_path)
+    config = TransferConfig(
+        multipart_threshold=MULTIPART_THRESHOLD, multipart_chunksize=MULTIPART_CHUNKSIZE
+    )
+    report = {"uploaded": [], "skipped": [], "bytes": 0}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pending = []
+        for path, key in files:
+            for upload in _plan(path, key, state, tmp_dir, compressed_only):
+                if remote.get(upload["key"]) == upload["etag"]:
+                    report["skipped"].append(upload["key"])
+                    if upload["path"] and upload["path"].startswith(tmp_dir):
+                        os.remove(upload["path"])
+                else:
+                    pending.append(upload)
+
+        # the datasets first, then the catalogs and search index that list them
+        indexes = [u for u in pending if os.path.basename(u["key"]).startswith("_")]
+        datasets = [u for u in pending if u not in indexes]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for batch in (datasets, indexes):
+                futures = {
+                    executor.submit(_upload, s3_client, upload, config, tmp_dir): upload
+                    for upload in batch
+                }
+                for future in as_completed(futures):
+                    report["bytes"] += future.result()
+                    report["uploaded"].append(futures[future]["key"])
+
+    _save_state(state_path, state)
+    report["uploaded"].sort()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload of the processed data to S3")
+    parser.add_argument("--csv-dir", default=CSV_DATA_PATH, help="CSV files")
+    parser.add_argument(
+        "--parquet-dir", default=PARQUET_DATA_PATH, help="Parquet files"
+    )
+    parser.add_argument(
+        "--no-parquet", action="store_true", help="only upload the CSV files"
+    )
+    parser.add_argument(
+        "--state",
+        default=os.path.join(DATA_PATH, UPLOADS_FILENAME),
+        help="ETags of the local files",
+    )
+    parser.add_argument("--workers", type=int, default=8, help="parallel uploads")
+    parser.add_argument(
+        "--compressed-only",
+        action="store_true",
+        help="upload the .csv.gz copies, not the CSV files",
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    report = upload_all(
+        args.csv_dir,
+        None if args.no_parquet else args.parquet_dir,
+        args.state,
+        args.workers,
+        compressed_only=args.compressed_only,
+    )
+    elapsed = time.perf_counter() - start
+    for key in report["uploaded"]:
+        print(f"Uploaded: {key}")
+    print(
+        f"{len(report['uploaded'])} uploaded ({report['bytes'] / 2**20:.1f} MiB), "
+        f"{len(report['skipped'])} unchanged, in {elapsed:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
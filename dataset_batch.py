@@ -0,0 +1,201 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from catalog import catalog_response
+from dataset_query import QueryError, parse_query
+from http_responses import cache_headers, etag_matches, not_modified, ok
+from s3_datasets import (
+    INLINE_MAX_BYTES,
+    dataset_name,
+    dataset_response,
+    is_true,
+    parse_paging,
+)
+
+"""
+Several Datasets in One Request
+
+A dashboard showing every dataset of a theme made one request per dataset: one HTTPS round trip
+and one Lambda invocation each, one after the other when the browser limits its connections. The
+batch endpoint ('getS3DataBatch.py', '/batch' of 'router.py') serves them in one request:
+    ?datasets=agriculture/cheptel-2010-2021,economie/pib    the datasets, '<theme>/<dataset>'
+    ?theme=agriculture&datasets=cheptel-2010-2021,...      several datasets of one theme
+    ?theme=agriculture                                     every dataset of the theme (catalog)
+The paging, projection, filter and typed parameters of the dataset endpoint apply to each dataset.
+The datasets are read concurrently, by a pool of BATCH_WORKERS threads, through the same
+'dataset_response' and warm-container cache as the dataset endpoint.
+
+The response is a JSON object keyed by '<theme>/<dataset>', in the order of the request, with the
+status of each dataset:
+    {
+        "agriculture/cheptel-2010-2021": {"status": 200, "data": {"columns": [...], "rows": ...}},
+        "agriculture/nope": {"status": 404, "error": "File not found"},
+        ...
+    }
+"data" is what the dataset endpoint returns in JSON, spliced in without being parsed again. A
+dataset too large to be sent whole gets a 303 and the presigned URL of its object, as from the
+dataset endpoint. Once the response reaches BATCH_MAX_BYTES, the remaining datasets get a 413:
+ask for pages, or for fewer datasets. A name that cannot be a theme or a dataset ('..', empty,
+holding a '/') gets a 400, without any request to S3.
+
+Functions:
+- batch_items(s3_client, params): The datasets a request asks for.
+- batch_response(s3_client, items, typed, paging, query): Reads the datasets and builds the
+  response.
+- handle_batch(s3_client, params, headers): The HTTP response of the batch endpoint, shared by the
+  handlers.
+"""
+
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", 8))
+MAX_BATCH_DATASETS = 50
+BATCH_MAX_BYTES = INLINE_MAX_BYTES
+LIST_SEPARATOR = ","
+INVALID_NAMES = ["", ".", ".."]
+
+
+def batch_items(s3_client, params):
+    """
+    Reads the datasets of a batch request, see the module docstring.
+
+    :param s3_client: A boto3 S3 client, to read the catalog of a theme.
+    :param params: The query string parameters.
+    :return: The list of the (theme, dataset) pairs, without duplicates, in the request order.
+    :raises QueryError: If the request names no dataset, or more than MAX_BATCH_DATASETS.
+    """
+
+    theme = params.get("theme")
+    names = [name for name in params.get("datasets", "").split(LIST_SEPARATOR) if name]
+    if not names and not theme:
+        raise QueryError("datasets or theme is required")
+
+    items = []
+    if names:
+        for name in names:
+            if "/" in name:
+                item_theme, dataset = name.split("/", 1)
+            elif theme:
+                item_theme, dataset = theme, name
+            else:
+                raise QueryError(f"{name} has no theme, use <theme>/<dataset>")
+            items.append((item_theme, dataset_name(dataset)))
+    else:
+        response, _ = catalog_response(s3_client, theme)
+        items = [(theme, entry["Name"]) for entry in json.loads(response["body"])]
+
+    items = list(dict.fromkeys(items))
+    if len(items) > MAX_BATCH_DATASETS:
+        raise QueryError(
+            f"at most {MAX_BATCH_DATASETS} datasets per request, got {len(items)}"
+        )
+    return items
+
+
+def _check_name(theme, dataset):
+    for name in [theme, dataset]:
+        if name in INVALID_NAMES or "/" in name or "\\" in name:
+            raise QueryError(f"invalid dataset name: {theme}/{dataset}")
+
+
+def _read_item(s3_client, item, typed, paging, query):
+    # one dataset, the errors kept as its status
+    theme, dataset = item
+    try:
+        _check_name(theme, dataset)
+        response, _ = dataset_response(s3_client, theme, dataset, typed, paging, query)
+    except QueryError as e:
+        return {"status": 400, "error": str(e)}
+    except s3_client.exceptions.NoSuchKey:
+        return {"status": 404, "error": "File not found"}
+    except Exception as e:
+        return {"status": 500, "error": str(e)}
+    return {
+        "status": 303 if response.get("url") else 200,
+        "body": response["body"],
+        "etag": response["etag"],
+        "last_modified": response["last_modified"],
+    }
+
+
+def batch_response(
+    s3_client, items, typed=False, paging=None, query=None, workers=BATCH_WORKERS
+):
+    """
+    Reads the datasets of a batch concurrently and assembles the response.
+
+    :param s3_client: A boto3 S3 client.
+    :param items: The (theme, dataset) pairs returned by 'batch_items'.
+    :param typed: Read the Parquet copies when there are some.
+    :param paging: An {"offset", "limit"} dict returned by 'parse_paging', or None.
+    :param query: An optional projection and filters, see 'dataset_query.parse_query'.
+    :param workers: The number of datasets read at the same time.
+    :return: A {"body", "etag", "last_modified"} dict. The ETag is a digest of those of the
+             datasets and of the parameters.
+    """
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(items)))) as pool:
+        results = list(
+            pool.map(
+                lambda item: _read_item(s3_client, item, typed, paging, query), items
+            )
+        )
+
+    parts = []
+    size = 0
+    digest = hashlib.md5(json.dumps([typed, paging, query]).encode("utf-8"))
+    last_modified = None
+    for (theme, dataset), result in zip(items, results):
+        if "body" in result and size + len(result["body"]) > BATCH_MAX_BYTES:
+            result = {
+                "status": 413,
+                "error": "Response too large, ask for pages or for fewer datasets",
+            }
+        if "body" in result:
+            size += len(result["body"])
+            # the JSON of the dataset endpoint, spliced in as it is
+            item = f'{{"status": {result["status"]}, "data": {result["body"]}}}'
+            digest.update(f"{theme}/{dataset}:{result['etag']};".encode("utf-8"))
+            if result["last_modified"] and (
+                last_modified is None or result["last_modified"] > last_modified
+            ):
+                last_modified = result["last_modified"]
+        else:
+            item = json.dumps(result)
+            digest.update(f"{theme}/{dataset}:{result['status']};".encode("utf-8"))
+        parts.append(f"{json.dumps(f'{theme}/{dataset}')}: {item}")
+
+    return {
+        "body": "{" + ", ".join(parts) + "}",
+        "etag": f'"{digest.hexdigest()}"',
+        "last_modified": last_modified,
+    }
+
+
+def handle_batch(s3_client, params, headers):
+    """
+    Answers a request of the batch endpoint, whichever handler or route received it.
+
+    :param s3_client: A boto3 S3 client.
+    :param params: The query string parameters: datasets=<theme>/<dataset>,... or theme=<theme>,
+                   with the typed, paging and filter parameters of the dataset endpoint.
+    :param headers: The request headers, names lower-cased ('http_responses.request_headers').
+    :return: A Lambda proxy integration response: 200 or 304.
+    :raises QueryError: If a parameter is invalid, answered with a 400.
+    """
+
+    if params.get("format", "json") != "json":
+        raise QueryError("batch responses are JSON only")
+    typed = is_true(params.get("typed"))
+    paging = parse_paging(params)
+    query = parse_query(params)
+    items = batch_items(s3_client, params)
+
+    # every dataset read concurrently, errors reported per dataset
+    response = batch_response(s3_client, items, typed, paging, query)
+    response_headers = {
+        "Content-Type": "application/json",
+        **cache_headers(response["etag"], response["last_modified"]),
+    }
+    if etag_matches(headers.get("if-none-match"), response["etag"]):
+        return not_modified(response_headers)
+    return ok(response["body"], response_headers, headers.get("accept-encoding"))
@@ -0,0 +1,135 @@
+import io
+import csv
+import json
+from dataset_query import QueryError
+from http_responses import quality_values
+from lazy_import import lazy_import
+
+# imported on the first Arrow response, None if not installed
+pa = lazy_import("pyarrow")
+
+"""
+Response Formats of the Dataset Endpoints
+
+The dataset endpoints answer with JSON by default, a list of rows or a page (see 's3_datasets.py').
+Clients that load the data into a tool of their own get it in a format that tool reads directly,
+with 'format=' or the 'Accept' header:
+- 'json' (application/json): the default,
+- 'csv' (text/csv): the dataset as it is stored. Without paging nor filters, the CSV object is
+  passed through as is, it is not parsed at all,
+- 'ndjson' (application/x-ndjson): one JSON object per row, '{"column": value, ...}'. The lines
+  are yielded as the rows are read, so the caller can stop reading once the body is too large to
+  be returned inline (see 's3_datasets.py'),
+- 'arrow' (application/vnd.apache.arrow.stream): an Arrow IPC stream, for pandas, polars or DuckDB.
+  With 'typed=true', the Parquet table is sent as it is decoded, without going through Python
+  values.
+
+'format=' wins over 'Accept'. When a page is not in JSON, the cursor of the next page is sent in
+the 'X-Next-Cursor' header instead of the body.
+
+Functions:
+- negotiate_format(params, accept): The format of a request.
+- to_csv(columns, rows): Writes rows as CSV.
+- to_ndjson(columns, rows): Yields the NDJSON lines of rows.
+- rows_to_table(columns, rows): Builds an Arrow table of strings from CSV rows.
+- to_arrow(table): Writes an Arrow table as an IPC stream.
+
+Note:
+- 'arrow' needs 'pyarrow' in the function, like 'typed=true'.
+"""
+
+FORMATS = {
+    "json": "application/json",
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+DEFAULT_FORMAT = "json"
+
+
+def negotiate_format(params, accept=None):
+    """
+    :param params: The query string parameters (may be None).
+    :param accept: The 'Accept' header of the request, or None.
+    :return: The name of the format, a key of FORMATS.
+    :raises QueryError: If 'format=' names an unknown or unavailable format.
+    """
+
+    name = (params or {}).get("format")
+    if name is None:
+        # the most preferred media type we serve, JSON if none ('*/*', no header)
+        qualities = quality_values(accept)
+        preferred = sorted(qualities.items(), key=lambda item: -item[1])
+        media_types = {
+            media_type.split(";")[0]: format_name
+            for format_name, media_type in FORMATS.items()
+        }
+        name = next(
+            (
+                media_types[media_type]
+                for media_type, quality in preferred
+                if quality > 0 and media_type in media_types
+            ),
+            DEFAULT_FORMAT,
+        )
+
+    name = name.lower()
+    if name not in FORMATS:
+        raise QueryError(f"format must be one of: {', '.join(FORMATS)}")
+    if name == "arrow" and pa is None:
+        raise QueryError("format arrow is not available")
+    return name
+
+
+def to_csv(columns, rows):
+    """
+    :param columns: The column names.
+    :param rows: An iterable of rows. None is written as an empty value.
+    :return: The CSV text, header first.
+    """
+
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator="\n")
+    writer.writerow(columns)
+    writer.writerows(rows)
+    return output.getvalue()
+
+
+def to_ndjson(columns, rows, default=None):
+    """
+    :param columns: The column names.
+    :param rows: An iterable of rows, consumed one row at a time.
+    :param default: The 'default' function of 'json.dumps', for dates and the like.
+    :return: A generator of the NDJSON lines, one object per row, newline included. Non ASCII
+             characters are escaped: a line has as many bytes as characters.
+    """
+
+    encode = json.JSONEncoder(default=default).encode
+    for row in rows:
+        yield encode(dict(zip(columns, row))) + "\n"
+
+
+def rows_to_table(columns, rows):
+    """
+    :param columns: The column names.
+    :param rows: An iterable of rows of strings, short rows are completed with nulls.
+    :return: An Arrow table of string columns.
+    """
+
+    width = len(columns)
+    padded = (list(row[:width]) + [None] * (width - len(row)) for row in rows)
+    values = list(zip(*padded)) or [()] * width
+    arrays = [pa.array(column, pa.string()) for column in values]
+    return pa.Table.from_arrays(arrays, names=list(columns))
+
+
+def to_arrow(table):
+    """
+    :param table: An Arrow table.
+    :return: The bytes of an Arrow IPC stream holding it.
+    """
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,196 @@
+import os
+import json
+import math
+import datetime
+from http_responses import cache_headers, etag_matches, not_modified, ok
+from response_cache import ResponseCache
+from s3_datasets import BUCKET_NAME, CSV_PREFIX, head_object
+
+"""
+Column Statistics of the Datasets
+
+To learn the columns, types, size or value ranges of a dataset, users downloaded the whole of it.
+This module computes a profile of every sheet at conversion time, written by 'data_processor.py'
+next to its CSV as '<dataset>.profile.json', and served by the stats endpoint
+('getS3DataStats.py'):
+    {
+        "version": 1,
+        "rows": 1520,
+        "columns": [
+            {"name": "Année", "typed_name": "annee", "type": "integer", "nulls": 0,
+             "distinct": 24, "min": 2000, "max": 2023, "mean": 2011.5},
+            {"name": "Région", "typed_name": "region", "type": "string", "nulls": 3,
+             "distinct": 12, "top": [["Casablanca-Settat", 180], ...]},
+            ...
+        ]
+    }
+"name" is the header of the CSV, "typed_name" the column of the Parquet copy ('typed=true'). The
+types are those inferred for the Parquet copy ('normalize_frame' in 'data_processor.py'): integer,
+number, boolean, date, datetime or string. Numeric columns get their min, max and mean, dates their
+min and max, strings and booleans their most frequent values.
+
+The statistics are computed on the whole frame at once (pandas reductions), not row by row.
+
+Functions:
+- profile_path(csv_path): The path (or S3 key) of the profile of a CSV.
+- build_profile(df, typed): The profile of a sheet.
+- write_profile(csv_path, df, typed): Builds the profile of a sheet and writes it next to its CSV.
+- profile_response(s3_client, theme, dataset): The profile of a dataset, as JSON.
+- handle_stats(s3_client, theme, dataset, headers): The HTTP response of the stats endpoint,
+  shared by the handlers.
+"""
+
+PROFILE_SUFFIX = ".profile.json"
+PROFILE_VERSION = 1
+TOP_VALUES = 5
+MAX_VALUE_LENGTH = 100  # longer text values are cut in the top values
+profile_cache = ResponseCache(max_bytes=16 * 1024 * 1024)
+
+TYPES = {"i": "integer", "u": "integer", "f": "number", "b": "boolean", "M": "datetime"}
+
+
+def profile_path(csv_path):
+    """
+    :param csv_path: The path or S3 key of a CSV file, '<name>.csv'.
+    :return: '<name>.profile.json'.
+    """
+
+    base = csv_path[: -len(".csv")] if csv_path.endswith(".csv") else csv_path
+    return base + PROFILE_SUFFIX
+
+
+def _type(series):
+    if series.dtype.kind in TYPES:
+        return TYPES[series.dtype.kind]
+    values = series.dropna()
+    # 'normalize_frame' stores the dates without time of day as 'datetime.date' objects
+    if not values.empty and isinstance(values.iloc[0], datetime.date):
+        return "date"
+    return "string"
+
+
+def _json_value(value, type_):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if type_ == "integer":
+        return int(value)
+    if type_ in ("date", "datetime"):
+        return value.isoformat()
+    if type_ == "boolean":
+        return bool(value)
+    if type_ == "number":
+        return float(value)
+    return str(value)[:MAX_VALUE_LENGTH]
+
+
+def build_profile(df, typed):
+    """
+    Computes the statistics of every column of a sheet.
+
+    :param df: The sheet as written to the CSV, for the column names.
+    :param typed: The same sheet with inferred types, see 'normalize_frame'.
+    :return: The profile dict, see the module docstring.
+    """
+
+    nulls = typed.isna().sum()
+    distinct = typed.nunique(dropna=True)
+    numeric = typed.select_dtypes("number")
+    ranges = numeric.agg(["min", "max", "mean"]) if len(numeric.columns) else None
+
+    columns = []
+    for name, typed_name in zip(df.columns, typed.columns):
+        series = typed[typed_name]
+        type_ = _type(series)
+        column = {
+            "name": str(name),
+            "typed_name": typed_name,
+            "type": type_,
+            "nulls": int(nulls[typed_name]),
+            "distinct": int(distinct[typed_name]),
+        }
+        if ranges is not None and typed_name in ranges.columns:
+            column["min"] = _json_value(ranges.at["min", typed_name], type_)
+            column["max"] = _json_value(ranges.at["max", typed_name], type_)
+            column["mean"] = _json_value(ranges.at["mean", typed_name], "number")
+        elif type_ in ("date", "datetime"):
+            values = series.dropna()
+            column["min"] = _json_value(values.min() if len(values) else None, type_)
+            column["max"] = _json_value(values.max() if len(values) else None, type_)
+        else:
+            counts = series.value_counts(dropna=True).head(TOP_VALUES)
+            column["top"] = [
+                [_json_value(value, type_), int(count)]
+                for value, count in counts.items()
+            ]
+        columns.append(column)
+
+    return {"version": PROFILE_VERSION, "rows": len(typed), "columns": columns}
+
+
+def write_profile(csv_path, df, typed):
+    """
+    Builds the profile of a sheet and writes it next to its CSV.
+
+    :return: The path of the profile.
+    """
+
+    path = profile_path(csv_path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(
+            build_profile(df, typed), file, separators=(",", ":"), ensure_ascii=False
+        )
+    os.replace(tmp_path, path)
+    return path
+
+
+def profile_response(s3_client, theme, dataset):
+    """
+    Reads the profile of a dataset through the warm-container cache.
+
+    :param s3_client: A boto3 S3 client.
+    :param theme: The theme of the dataset.
+    :param dataset: The name of the dataset, without extension.
+    :return: A (response, hit) tuple, response being a {"body", "etag", "last_modified"} dict.
+    :raises s3_client.exceptions.NoSuchKey: If the dataset has no profile.
+    """
+
+    key = profile_path(f"{CSV_PREFIX}/{theme}/{dataset}.csv")
+
+    def stat():
+        response = head_object(s3_client, key)
+        if response is None:
+            raise s3_client.exceptions.NoSuchKey(
+                {"Error": {"Code": "NoSuchKey", "Message": key}}, "HeadObject"
+            )
+        return {"etag": response["ETag"], "last_modified": response["LastModified"]}
+
+    def load(meta):
+        data = s3_client.get_object(Bucket=BUCKET_NAME, Key=key)["Body"].read()
+        return dict(meta, body=data.decode("utf-8")), len(data)
+
+    return profile_cache.get_or_load(key, stat, load)
+
+
+def handle_stats(s3_client, theme, dataset, headers):
+    """
+    Answers a request of the stats endpoint, whichever handler or route received it.
+
+    :param s3_client: A boto3 S3 client.
+    :param theme: The theme of the dataset.
+    :param dataset: The name of the dataset, without extension.
+    :param headers: The request headers, names lower-cased ('http_responses.request_headers').
+    :return: A Lambda proxy integration response: 200 or 304.
+    :raises s3_client.exceptions.NoSuchKey: If the dataset has no profile.
+    """
+
+    # the precomputed profile, a few hundred bytes instead of the whole dataset
+    response, hit = profile_response(s3_client, theme, dataset)
+    response_headers = {
+        "Content-Type": "application/json",
+        "X-Cache": "Hit" if hit else "Miss",
+        **cache_headers(response["etag"], response["last_modified"]),
+    }
+    if etag_matches(headers.get("if-none-match"), response["etag"]):
+        return not_modified(response_headers)
+    return ok(response["body"], response_headers, headers.get("accept-encoding"))
@@ -0,0 +1,256 @@
+import re
+import datetime
+import unicodedata
+from lazy_import import lazy_import
+
+# imported on the first typed read, None if not installed
+pa = lazy_import("pyarrow")
+
+"""
+Column Projection and Row Filters for the Dataset Endpoints
+
+Most clients of the dataset endpoints only need a few columns, or the rows of one region or one
+range of years. This module reads that selection from the query string, so the handlers only
+return (and, with Parquet, only decode) what was asked for:
+- 'columns=annee,region' keeps these columns, in this order,
+- 'filter.region=Rabat' keeps the rows equal to a value,
+- 'filter.annee=2015..2020' keeps the rows within an inclusive range, either bound may be left
+  out ('filter.annee=2015..', 'filter.annee=..2020'),
+- 'filter.region=Rabat,Fès' keeps the rows equal to one of the values.
+
+A filter is a query string parameter named FILTER_PREFIX and a column. The other parameters are
+not filters, those the endpoint does not know (a cache buster such as '_=123', 'utm_source') are
+ignored. Filters are combined with AND. Values compare as numbers when both sides are numbers, as
+text otherwise.
+
+On CSV, the filters run on the rows as they are parsed. On Parquet, the projection and the filters
+are handed to 'pyarrow.parquet.read_table': only the requested columns are decoded, and row groups
+whose statistics exclude the filters are skipped.
+
+The CSV keeps the headers of the workbook ('Région'), the Parquet copy has them cleaned
+('region', see 'clean_column_names'), as 'data_processor.py' writes them.
+
+Classes:
+- QueryError: A parameter the handlers cannot satisfy, answered with a 400.
+
+Functions:
+- clean_column_names(columns): The column names of the Parquet copy of a sheet.
+- parse_query(params): Reads the projection and the filters of a request.
+- select_rows(header, rows, query): Applies a query to CSV rows of strings.
+- arrow_read_options(schema, query): Converts a query for 'pyarrow.parquet.read_table'.
+"""
+
+FILTER_PREFIX = "filter."
+RANGE_SEPARATOR = ".."
+LIST_SEPARATOR = ","
+
+
+class QueryError(ValueError):
+    """A query string parameter the handlers cannot satisfy, answered with a 400."""
+
+
+def clean_column_names(columns):
+    """
+    Normalizes column names: accents stripped, lowercase, runs of other characters replaced by
+    '_'. Arabic letters are kept. Unnamed columns become 'column_<n>' and duplicates get a
+    '_<n>' suffix. Names already clean are kept as they are.
+
+    :param columns: The column names of a sheet.
+    :return: A list of unique names.
+    """
+
+    names, seen = [], {}
+    for position, column in enumerate(columns, start=1):
+        name = unicodedata.normalize("NFKD", str(column))
+        name = "".join(char for char in name if not unicodedata.combining(char))
+        name = re.sub(r"\W+", "_", name).strip("_").lower()
+        if not name or name.startswith("unnamed_"):
+            name = f"column_{position}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}_{seen[name]}"
+        else:
+            seen[name] = 1
+        names.append(name)
+    return names
+
+
+def parse_query(params):
+    """
+    Reads the column projection and the row filters of a request.
+
+    :param params: The query string parameters (may be None).
+    :return: A {"columns": list or None, "filters": [(column, operator, operand)]} dict, the
+             operator being "eq" (a value), "in" (a list of values) or "range" (a (low, high)
+             tuple, None for an open bound). None when the request selects nothing.
+    """
+
+    params = params or {}
+    columns = None
+    if params.get("columns"):
+        columns = [
+            name.strip() for name in params["columns"].split(",") if name.strip()
+        ]
+
+    filters = []
+    for name, value in params.items():
+        if not name.startswith(FILTER_PREFIX):
+            continue
+        name = name[len(FILTER_PREFIX) :]
+        if RANGE_SEPARATOR in value:
+            low, high = value.split(RANGE_SEPARATOR, 1)
+            filters.append((name, "range", (low or None, high or None)))
+        elif LIST_SEPARATOR in value:
+            filters.append((name, "in", value.split(LIST_SEPARATOR)))
+        else:
+            filters.append((name, "eq", value))
+
+    if not columns and not filters:
+        return None
+    return {"columns": columns, "filters": filters}
+
+
+def _check_columns(available, names):
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise QueryError(f"unknown column: {', '.join(unknown)}")
+
+
+def _number(text):
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return None
+
+
+def _predicate(operator, operand):
+    # operands are parsed once here, not for every row
+    if operator in ["eq", "in"]:
+        texts = {operand} if operator == "eq" else set(operand)
+        numbers = {_number(text) for text in texts} - {None}
+
+        def matches(value):
+            if value in texts:
+                return True
+            return bool(numbers) and _number(value) in numbers
+
+        return matches
+
+    bounds = [(bound, _number(bound)) for bound in operand]
+
+    def within(value, bound, sign):
+        text, number = bound
+        if text is None:
+            return True
+        if number is not None:
+            value_number = _number(value)
+            if value_number is not None:
+                return (value_number - number) * sign >= 0
+        return (value >= text) if sign > 0 else (value <= text)
+
+    def matches(value):
+        return within(value, bounds[0], 1) and within(value, bounds[1], -1)
+
+    return matches
+
+
+def select_rows(header, rows, query):
+    """
+    Applies a query to CSV rows.
+
+    :param header: The column names of the CSV.
+    :param rows: An iterable of rows, lists of strings.
+    :param query: A query returned by 'parse_query', or None.
+    :return: A (columns, rows) tuple, rows being a lazy iterator over the matching rows, projected.
+    :raises QueryError: If the query names a column the CSV does not have.
+    """
+
+    if query is None:
+        return header, rows
+
+    positions = {name: position for position, name in enumerate(header)}
+    columns = query["columns"] or header
+    _check_columns(positions, columns + [name for name, _, _ in query["filters"]])
+
+    filters = [
+        (positions[name], _predicate(operator, operand))
+        for name, operator, operand in query["filters"]
+    ]
+    projection = [positions[name] for name in columns]
+
+    def selected():
+        for row in rows:
+            if all(
+                position < len(row) and matches(row[position])
+                for position, matches in filters
+            ):
+                yield [
+                    row[position] if position < len(row) else ""
+                    for position in projection
+                ]
+
+    return columns, selected()
+
+
+def _to_int(value):
+    # a non whole bound ('annee=..2015.5') still compares with an integer column
+    return int(value) if value.lstrip("-").isdigit() else float(value)
+
+
+def _to_bool(value):
+    return value.lower() in ["1", "true", "yes"]
+
+
+def _converter(name, data_type):
+    if pa.types.is_integer(data_type):
+        convert = _to_int
+    elif pa.types.is_floating(data_type):
+        convert = float
+    elif pa.types.is_date(data_type):
+        convert = datetime.date.fromisoformat
+    elif pa.types.is_timestamp(data_type):
+        convert = datetime.datetime.fromisoformat
+    elif pa.types.is_boolean(data_type):
+        convert = _to_bool
+    else:
+        convert = str
+
+    def checked(value):
+        try:
+            return convert(value)
+        except ValueError:
+            raise QueryError(f"invalid value for {name}: {value}")
+
+    return checked
+
+
+def arrow_read_options(schema, query):
+    """
+    Converts a query into the 'columns' and 'filters' arguments of 'pyarrow.parquet.read_table'.
+    Filter values are converted to the types of their columns.
+
+    :param schema: The Arrow schema of the Parquet file.
+    :param query: A query returned by 'parse_query', or None.
+    :return: A (columns, filters) tuple, each None when not restricted.
+    :raises QueryError: If the query names an unknown column or a value of the wrong type.
+    """
+
+    if query is None:
+        return None, None
+    names = schema.names
+    _check_columns(names, (query["columns"] or []) + [f[0] for f in query["filters"]])
+
+    filters = []
+    for name, operator, operand in query["filters"]:
+        convert = _converter(name, schema.field(name).type)
+        if operator == "eq":
+            filters.append((name, "==", convert(operand)))
+        elif operator == "in":
+            filters.append((name, "in", [convert(item) for item in operand]))
+        else:
+            low, high = operand
+            if low is not None:
+                filters.append((name, ">=", convert(low)))
+            if high is not None:
+                filters.append((name, "<=", convert(high)))
+    return query["columns"], filters or None
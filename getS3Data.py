@@ -1,36 +1,35 @@
 import json
 import boto3
-import csv
+from dataset_query import QueryError
+from http_responses import request_headers
+from s3_datasets import handle_dataset
+
+# Initialize S3 client once per container, like the response cache
+s3_client = boto3.client("s3")
 
 
 def lambda_handler(event, context):
-    s3_client = boto3.client("s3")
-    bucket_name = "data-morocco"
 
     # Extracting theme and dataset names from the event
     theme = event["queryStringParameters"]["theme"]
     dataset = event["queryStringParameters"]["dataset"]
-    file_key = f"csv_data/{theme}/{dataset}.csv"
 
     try:
-        # Get the object from S3
-        response = s3_client.get_object(Bucket=bucket_name, Key=file_key)
-        content = response["Body"].read().decode("utf-8")
-
-        # Read the CSV file
-        lines = content.split("\n")
-        reader = csv.reader(lines)
-
-        # Convert CSV to list
-        data = list(reader)
-
-        # Return data as JSON
+        # paging, filters, format and caching as on every route of the dataset endpoint
+        return handle_dataset(
+            s3_client,
+            theme,
+            dataset,
+            event["queryStringParameters"],
+            request_headers(event),
+        )
+
+    except QueryError as e:
         return {
-            "statusCode": 200,
+            "statusCode": 400,
             "headers": {"Content-Type": "application/json"},
-            "body": json.dumps(data),
+            "body": json.dumps(str(e)),
         }
-
     except s3_client.exceptions.NoSuchKey:
         return {
             "statusCode": 404,
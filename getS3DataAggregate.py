@@ -0,0 +1,46 @@
+import json
+import boto3
+from aggregation import handle_aggregation
+from dataset_query import QueryError
+from http_responses import request_headers
+from s3_datasets import dataset_name
+
+# Initialize S3 client once per container, like the aggregation cache
+s3_client = boto3.client("s3")
+
+
+def lambda_handler(event, context):
+    # theme, dataset, then by/every/agg/values or x/y/downsample/points, and row filters
+    params = event.get("queryStringParameters") or {}
+
+    try:
+        if not params.get("theme") or not params.get("dataset"):
+            raise QueryError("theme and dataset are required")
+
+        # computed next to the data, as on every route of the aggregation endpoint
+        return handle_aggregation(
+            s3_client,
+            params["theme"],
+            dataset_name(params["dataset"]),
+            params,
+            request_headers(event),
+        )
+
+    except QueryError as e:
+        return {
+            "statusCode": 400,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps(str(e)),
+        }
+    except s3_client.exceptions.NoSuchKey:
+        return {
+            "statusCode": 404,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps("File not found"),
+        }
+    except Exception as e:
+        return {
+            "statusCode": 500,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps(str(e)),
+        }
@@ -0,0 +1,30 @@
+import json
+import boto3
+from dataset_batch import handle_batch
+from dataset_query import QueryError
+from http_responses import request_headers
+
+# Initialize S3 client once per container, shared by the threads of a batch
+s3_client = boto3.client("s3")
+
+
+def lambda_handler(event, context):
+    # datasets=<theme>/<dataset>,... or theme=<theme>, with the options of the dataset endpoint
+    params = event.get("queryStringParameters") or {}
+
+    try:
+        # every dataset read concurrently, as on every route of the batch endpoint
+        return handle_batch(s3_client, params, request_headers(event))
+
+    except QueryError as e:
+        return {
+            "statusCode": 400,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps(str(e)),
+        }
+    except Exception as e:
+        return {
+            "statusCode": 500,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps(str(e)),
+        }
@@ -0,0 +1,36 @@
+import json
+import boto3
+from dataset_query import QueryError
+from http_responses import request_headers
+from search_index import handle_search
+
+# Initialize S3 client once per container, like the search index
+s3_client = boto3.client("s3")
+
+
+def lambda_handler(event, context):
+    # q=<text>, tag=<tag>, theme=<theme>, limit=<n>: any of them, at least q or tag
+    params = event.get("queryStringParameters") or {}
+
+    try:
+        # the index of the warm container and caching as on every route of the search endpoint
+        return handle_search(s3_client, params, request_headers(event))
+
+    except QueryError as e:
+        return {
+            "statusCode": 400,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps(str(e)),
+        }
+    except s3_client.exceptions.NoSuchKey:
+        return {
+            "statusCode": 404,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps("Search index not found"),
+        }
+    except Exception as e:
+        return {
+            "statusCode": 500,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps(str(e)),
+        }
@@ -0,0 +1,31 @@
+import json
+import boto3
+from dataset_profile import handle_stats
+from http_responses import request_headers
+
+# Initialize S3 client once per container, like the profile cache
+s3_client = boto3.client("s3")
+
+
+def lambda_handler(event, context):
+
+    # Extracting theme and dataset names from the event
+    theme = event["queryStringParameters"]["theme"]
+    dataset = event["queryStringParameters"]["dataset"]
+
+    try:
+        # the precomputed profile and caching as on every route of the stats endpoint
+        return handle_stats(s3_client, theme, dataset, request_headers(event))
+
+    except s3_client.exceptions.NoSuchKey:
+        return {
+            "statusCode": 404,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps("Profile not found"),
+        }
+    except Exception as e:
+        return {
+            "statusCode": 500,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps(str(e)),
+        }
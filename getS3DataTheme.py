@@ -1,40 +1,18 @@
 import json
 import boto3
-import csv
-from datetime import datetime, timezone
+from catalog import handle_catalog
+from http_responses import request_headers
+
+# Initialize S3 client once per container, like the catalog cache
+s3_client = boto3.client('s3')
 
 def lambda_handler(event, context):
-    s3_client = boto3.client('s3')
-    bucket_name = 'data-morocco'
+    # Extracting the theme from the event, every theme without it
+    theme = (event.get('queryStringParameters') or {}).get('theme')
 
-    # Extracting theme and dataset names from the event
-    theme = event['queryStringParameters']['theme']
-    objects = s3_client.list_objects_v2(
-            Bucket=bucket_name, 
-            Prefix=f"csv_data/{theme}/" 
-        )
-        
     try:
-        datasets = []
-    
-        for obj in objects['Contents']:
-            key = obj['Key']
-            last_modified = obj['LastModified'].astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
-            size = obj['Size']
-            dataset = key.split('/')[-1].split('.')[0]
-    
-            dataset_meta = {
-                "Name": dataset,
-                "LastModified": last_modified,
-                "Size": size
-            }
-    
-            datasets.append(dataset_meta)
-    
-        return {
-          "statusCode": 200,
-          "body": json.dumps(datasets)   
-        }
+        # the precomputed catalog and caching as on every route of the catalog endpoint
+        return handle_catalog(s3_client, theme, request_headers(event))
 
     except s3_client.exceptions.NoSuchKey:
         return {
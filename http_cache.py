@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import hashlib
+import logging
+
+"""
+On-disk HTTP Response Cache for the Scrapers
+
+The crawlers fetch the same HTML pages of 'data.gov.ma' run after run. This module keeps the body
+of every successful page response on disk so that development re-runs and partial production
+re-runs do not hit the site again.
+
+Each entry is stored as two files named after the SHA-256 of the URL:
+- '<hash>.body': the raw response content,
+- '<hash>.json': the URL, status code, size and time the response was stored.
+
+Entries older than the TTL are treated as missing. When the total size of the bodies grows past
+'max_bytes', the least recently used entries are evicted (a hit refreshes the body's mtime).
+
+Classes:
+- HttpCache: The cache itself, with get(url), set(url, content, status), clear() and size().
+
+Note:
+- Only page responses belong here. Dataset files are tracked by the download manifest instead.
+- The cache is safe to share between the sequential and asyncio crawlers of the same process.
+"""
+
+CACHE_DIR = ".http_cache"
+CACHE_TTL = 24 * 60 * 60  # seconds
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+
+class HttpCache:
+    def __init__(
+        self,
+        cache_dir=CACHE_DIR,
+        ttl=CACHE_TTL,
+        max_bytes=CACHE_MAX_BYTES,
+        enabled=True,
+    ):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._total = None  # running size of the bodies, computed on first write
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.cache_dir, key)
+        return f"{base}.body", f"{base}.json"
+
+    def get(self, url):
+        """
+        Looks a URL up in the cache.
+
+        :param url: The URL of the response.
+        :return: A (status code, content bytes) tuple, or None on a miss or an expired entry.
+        """
+
+        if not self.enabled:
+            return None
+        body_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path) as file:
+                meta = json.load(file)
+            if time.time() - meta["stored_at"] > self.ttl:
+                self.misses += 1
+                return None
+            with open(body_path, "rb") as file:
+                content = file.read()
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+
+        os.utime(body_path)  # mark as recently used for the eviction
+        self.hits += 1
+        logging.debug(f"http cache hit: {url}")
+        return meta["status"], content
+
+    def set(self, url, content, status=200):
+        """
+        Stores a response, then evicts least recently used entries if the cache is over size.
+
+        :param url: The URL of the response.
+        :param content: The response content, as bytes.
+        :param status: The response status code.
+        :return: None.
+        """
+
+        if not self.enabled:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        body_path, meta_path = self._paths(url)
+
+        meta = {
+            "url": url,
+            "status": status,
+            "size": len(content),
+            "stored_at": time.time(),
+        }
+
+        # write to temporary files first so a concurrent reader never sees half an entry
+        for path, data, mode in [
+            (body_path, content, "wb"),
+            (meta_path, json.dumps(meta), "w"),
+        ]:
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, mode) as file:
+                file.write(data)
+            os.replace(tmp_path, path)
+
+        if self._total is None:
+            self._total = self.size()
+        else:
+            self._total += len(content)
+        if self._total > self.max_bytes:
+            self._evict()
+
+    def _entries(self):
+        entries = []
+        for filename in os.listdir(self.cache_dir):
+            if filename.endswith(".body"):
+                path = os.path.join(self.cache_dir, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def size(self):
+        """
+        :return: The total size in bytes of the cached bodies.
+        """
+
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+
+        # the running total over-counts overwritten entries, so re-check against the real size
+        for _, size, body_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            meta_path = body_path[: -len(".body")] + ".json"
+            for path in [body_path, meta_path]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+            logging.debug(f"http cache evicted: {body_path}")
+        self._total = total
+
+    def clear(self):
+        """
+        Removes every entry of the cache.
+
+        :return: None.
+        """
+
+        if not os.path.isdir(self.cache_dir):
+            return
+        for filename in os.listdir(self.cache_dir):
+            os.remove(os.path.join(self.cache_dir, filename))
+        self._total = 0
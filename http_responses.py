@@ -0,0 +1,212 @@
+import gzip
+import json
+import base64
+import datetime
+import email.utils
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+"""
+HTTP Caching and Compression for the Lambda Handlers
+
+The datasets change when the harvest runs again, not between two requests, yet every request used
+to download the whole response. This module adds what lets clients and the API Gateway cache keep
+their copy:
+- 'ETag' and 'Last-Modified' of the S3 object the response is read from, and a 'Cache-Control'
+  max age,
+- a 304 Not Modified, without body, when 'If-None-Match' holds the current ETag. The handlers
+  answer it before reading the object,
+- a gzip or brotli body when 'Accept-Encoding' allows it, as a base64 body for the Lambda proxy
+  integration.
+
+The ETag is the one of the S3 object, sent as a weak ETag ('W/"..."'): the response is a
+serialization of the object, and its compressed and uncompressed variants share the same ETag.
+
+Functions:
+- request_headers(event): The headers of a request, names lower-cased.
+- etag_matches(if_none_match, etag): Whether an 'If-None-Match' header holds an ETag.
+- cache_headers(etag, last_modified, max_age): The caching headers of a response.
+- not_modified(headers): A 304 response.
+- see_other(url, headers): A 303 redirect.
+- quality_values(header): The values of an 'Accept' like header, with their quality.
+- accepts_encoding(accept_encoding, encoding): Whether a client accepts a content coding.
+- negotiate_encoding(accept_encoding): The best encoding a client accepts.
+- ok(body, headers, accept_encoding): A 200 response, compressed when the client accepts it, or a
+  413 when it is still too large for Lambda.
+
+Note:
+- brotli is only offered when the 'brotli' package is in the deployment package, gzip otherwise.
+"""
+
+CACHE_MAX_AGE = 300  # seconds a response may be reused without revalidation
+MAX_RESPONSE_SIZE = 6 * 1000 * 1000  # the Lambda proxy integration limit
+MIN_COMPRESS_SIZE = 1024  # smaller bodies are not worth the base64 overhead
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # higher qualities cost far more time than they save bytes on JSON
+
+
+def request_headers(event):
+    """
+    :param event: The Lambda proxy integration event.
+    :return: The request headers, names lower-cased (HTTP header names are case insensitive).
+    """
+
+    return {name.lower(): value for name, value in (event.get("headers") or {}).items()}
+
+
+def _opaque_tag(etag):
+    etag = etag.strip()
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Compares ETags the way 'If-None-Match' does, weakly: 'W/"x"' matches '"x"'.
+
+    :param if_none_match: The 'If-None-Match' header, or None.
+    :param etag: The current ETag.
+    :return: True if the client already has the current response.
+    """
+
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    current = _opaque_tag(etag)
+    return any(_opaque_tag(tag) == current for tag in if_none_match.split(","))
+
+
+def cache_headers(etag, last_modified=None, max_age=CACHE_MAX_AGE):
+    """
+    :param etag: The ETag of the S3 object the response is read from.
+    :param last_modified: Its last modification, a timezone aware datetime, or None.
+    :param max_age: The seconds a response may be reused without being revalidated.
+    :return: The 'ETag', 'Last-Modified', 'Cache-Control' and 'Vary' headers. 'Accept' is in
+             'Vary' for the dataset endpoints, which negotiate their format.
+    """
+
+    headers = {
+        "ETag": f"W/{_opaque_tag(etag)}",
+        "Cache-Control": f"public, max-age={max_age}",
+        "Vary": "Accept, Accept-Encoding",
+    }
+    if last_modified is not None:
+        # boto3 returns its own UTC tzinfo, format_datetime only takes datetime's
+        last_modified = last_modified.astimezone(datetime.timezone.utc)
+        headers["Last-Modified"] = email.utils.format_datetime(
+            last_modified, usegmt=True
+        )
+    return headers
+
+
+def not_modified(headers):
+    return {"statusCode": 304, "headers": headers, "body": ""}
+
+
+def see_other(url, headers):
+    return {"statusCode": 303, "headers": dict(headers, Location=url), "body": ""}
+
+
+def _too_large():
+    return {
+        "statusCode": 413,
+        "headers": {"Content-Type": "application/json"},
+        "body": json.dumps(
+            "Response too large, ask for pages (offset/limit) or filters"
+        ),
+    }
+
+
+def quality_values(header):
+    """
+    :param header: An 'Accept' or 'Accept-Encoding' header, or None.
+    :return: A {value: quality} dict, values lower-cased, without their other parameters.
+    """
+
+    accepted = {}
+    for item in (header or "").split(","):
+        name, _, parameters = item.strip().partition(";")
+        quality = 1.0
+        for parameter in parameters.split(";"):
+            key, _, value = parameter.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    return accepted
+
+
+def accepts_encoding(accept_encoding, encoding):
+    """
+    :param accept_encoding: The 'Accept-Encoding' header, or None.
+    :param encoding: A content coding, e.g. "gzip".
+    :return: Whether the client accepts the coding.
+    """
+
+    accepted = quality_values(accept_encoding)
+    return accepted.get(encoding, accepted.get("*", 0)) > 0
+
+
+def negotiate_encoding(accept_encoding):
+    """
+    :param accept_encoding: The 'Accept-Encoding' header, or None.
+    :return: "br", "gzip" or None (identity). brotli is preferred, it is smaller at the same cost.
+    """
+
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    for encoding in candidates:
+        if accepts_encoding(accept_encoding, encoding):
+            return encoding
+    return None
+
+
+def ok(body, headers, accept_encoding=None):
+    """
+    Builds a 200 response, compressing the body when the client accepts it. A body whose
+    headers have a 'Content-Encoding' is compressed already and sent as it is.
+
+    :param body: The body, a string, or bytes for a binary format (sent base64 encoded).
+    :param headers: The headers of the response.
+    :param accept_encoding: The 'Accept-Encoding' header of the request, or None.
+    :return: The Lambda proxy integration response.
+    """
+
+    binary = isinstance(body, bytes)
+    encoding = negotiate_encoding(accept_encoding)
+    # a body sent with its 'Content-Encoding' already is compressed
+    if (
+        encoding is None
+        or len(body) < MIN_COMPRESS_SIZE
+        or "Content-Encoding" in headers
+    ):
+        if binary:
+            body = base64.b64encode(body).decode("ascii")
+        response = {
+            "statusCode": 200,
+            "headers": headers,
+            "body": body,
+            "isBase64Encoded": binary,
+        }
+    else:
+        data = body if binary else body.encode("utf-8")
+        if encoding == "br":
+            data = brotli.compress(data, quality=BROTLI_QUALITY)
+        else:
+            data = gzip.compress(data, compresslevel=GZIP_LEVEL)
+        response = {
+            "statusCode": 200,
+            "headers": dict(headers, **{"Content-Encoding": encoding}),
+            "body": base64.b64encode(data).decode("ascii"),
+            "isBase64Encoded": True,
+        }
+
+    # a larger response would fail in API Gateway with a less helpful error
+    if len(response["body"]) > MAX_RESPONSE_SIZE:
+        return _too_large()
+    return response
@@ -1,6 +1,8 @@
 import json
 import boto3
-import csv
+from dataset_query import QueryError
+from http_responses import request_headers
+from s3_datasets import dataset_name, handle_dataset
 
 # Initialize S3 client
 s3_client = boto3.client("s3")
@@ -24,25 +26,18 @@ def lambda_handler(event, context):
             "body": json.dumps("Missing thematic_subfolder or file_name"),
         }
 
-    # Define the bucket name and object key
-    bucket_name = "data-morocco"
-    file_key = f"csv_data/{thematic_subfolder}/{file_name}"
-
     try:
-        # Get the object from S3
-        response = s3_client.get_object(Bucket=bucket_name, Key=file_key)
-        content = response["Body"].read().decode("utf-8")
-
-        # Read the CSV file
-        lines = content.split("\n")
-        reader = csv.reader(lines)
-
-        # Convert CSV to list
-        data = list(reader)
-
-        # Return data as JSON
-        return {"statusCode": 200, "body": json.dumps(data)}
-
+        # paging, filters, format and caching as on every route of the dataset endpoint
+        return handle_dataset(
+            s3_client,
+            thematic_subfolder,
+            dataset_name(file_name),
+            event.get("queryStringParameters") or {},
+            request_headers(event),
+        )
+
+    except QueryError as e:
+        return {"statusCode": 400, "body": json.dumps(str(e))}
     except s3_client.exceptions.NoSuchKey:
         return {"statusCode": 404, "body": json.dumps("File not found")}
     except Exception as e:
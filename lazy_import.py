@@ -0,0 +1,50 @@
+import importlib
+import importlib.util
+
+"""
+Lazy Imports of the Optional Modules
+
+'pyarrow' takes a quarter of a second to import, as long as the rest of a handler together, and is
+only used by the typed reads and the Arrow format. The modules shared by the handlers imported it
+at load time, so every cold start paid for it, even to serve a catalog. They now get it from
+'lazy_import':
+    pa = lazy_import("pyarrow")
+is None when the package is not installed, like the 'try: import' it replaces, and otherwise a
+stand-in that imports the module on the first access to one of its attributes.
+
+Whether the package is installed is found with 'importlib.util.find_spec' on its top-level name,
+which looks for it without importing it.
+
+Functions:
+- lazy_import(name): A module imported on first use, or None if it is not installed.
+"""
+
+
+class LazyModule:
+    """
+    Stands for a module until one of its attributes is used, then imports it.
+    """
+
+    def __init__(self, name):
+        self.__dict__["_lazy_name"] = name
+
+    def __getattr__(self, attribute):
+        # only called for the attributes missing from the instance: once the module is imported
+        # its attributes are copied here, and later ones read from it
+        module = importlib.import_module(self._lazy_name)
+        self.__dict__.update(vars(module))
+        return getattr(module, attribute)
+
+    def __repr__(self):
+        return f"<lazy module {self._lazy_name!r}>"
+
+
+def lazy_import(name):
+    """
+    :param name: The name of a module, dotted for a submodule ('pyarrow.parquet').
+    :return: A LazyModule, or None if the package of the module is not installed.
+    """
+
+    if importlib.util.find_spec(name.partition(".")[0]) is None:
+        return None
+    return LazyModule(name)
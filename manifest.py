@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import hashlib
+
+"""
+Download Manifest for Incremental Harvesting
+
+The manifest remembers, for every file downloaded into 'data/', where it came from and what it
+looked like: its URL, the ETag and Last-Modified headers the server sent, its size and the SHA-256
+of its content. The title, page URL and tags scraped with it are kept under "metadata", for the
+catalog of the datasets ('catalog.py'). It is stored as 'data/manifest.json' and lets the crawlers:
+- send 'If-None-Match'/'If-Modified-Since' so the server can answer 304 for unchanged files,
+- recognise unchanged files by their hash when the server ignores conditional requests,
+- report which files were added, changed or removed since the previous run.
+
+The outcome of the last run is saved in the manifest under "last_run" so that the next step of the
+pipeline ('data_processor.py --changed-only') can convert only what changed.
+
+Entries are keyed by the path of the file relative to the data folder, '<theme>/<name>.<ext>'.
+
+Classes:
+- Manifest: Loads, updates and saves the manifest.
+
+Functions:
+- file_sha256(path): Hashes a file in chunks.
+- load_changed_files(path): Returns the keys added or changed by the last run.
+"""
+
+MANIFEST_PATH = os.path.join("data", "manifest.json")
+CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    """
+    Hashes a file without loading it in memory.
+
+    :param path: The path of the file.
+    :return: The hex SHA-256 digest of the file content.
+    """
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Manifest:
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self.entries = {}
+        self.added = []
+        self.changed = []
+        self.unchanged = []
+        self._seen = set()
+        if os.path.exists(path):
+            with open(path) as file:
+                self.entries = json.load(file).get("entries", {})
+
+    def conditional_headers(self, key, file_path):
+        """
+        Builds the conditional request headers for a file already downloaded.
+
+        :param key: The manifest key of the file.
+        :param file_path: The local path of the file. Nothing is sent if it is missing.
+        :return: A dict of headers, empty when the file was never downloaded.
+        """
+
+        entry = self.entries.get(key)
+        if not entry or not os.path.exists(file_path):
+            return {}
+
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def record_not_modified(self, key, metadata=None):
+        """
+        Records a file the server answered 304 for.
+
+        :param key: The manifest key of the file.
+        :param metadata: Optional scraped metadata of the dataset, see 'record'.
+        :return: None.
+        """
+
+        self._seen.add(key)
+        self.unchanged.append(key)
+        if metadata is not None and key in self.entries:
+            self.entries[key]["metadata"] = metadata
+
+    def keep(self, key):
+        """
+        Keeps an entry that could not be checked during this run, so it is not reported as
+        removed.
+
+        :param key: The manifest key of the file.
+        :return: None.
+        """
+
+        self._seen.add(key)
+
+    def record(self, key, url, headers, sha256, size, metadata=None):
+        """
+        Records a file just downloaded and classifies it as added, changed or unchanged.
+
+        :param key: The manifest key of the file.
+        :param url: The URL the file was downloaded from.
+        :param headers: The response headers.
+        :param sha256: The hex SHA-256 digest of the file content.
+        :param size: The size of the file in bytes.
+        :param metadata: Optional scraped metadata of the dataset ({"title", "page_url", "tags"}),
+                         kept for the catalog. The previous metadata is kept when None.
+        :return: One of "added", "changed" or "unchanged".
+        """
+
+        self._seen.add(key)
+        previous = self.entries.get(key)
+        if metadata is None and previous is not None:
+            metadata = previous.get("metadata")
+        self.entries[key] = {
+            "url": url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "size": size,
+            "sha256": sha256,
+            "downloaded_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+        if metadata is not None:
+            self.entries[key]["metadata"] = metadata
+
+        if previous is None:
+            status, bucket = "added", self.added
+        elif previous.get("sha256") != sha256:
+            status, bucket = "changed", self.changed
+        else:
+            status, bucket = "unchanged", self.unchanged
+        bucket.append(key)
+        return status
+
+    def removed(self):
+        """
+        :return: The keys of the manifest that were not seen during this run.
+        """
+
+        return sorted(set(self.entries) - self._seen)
+
+    def report(self):
+        """
+        :return: A dict with the sorted "added", "changed", "unchanged" and "removed" keys.
+        """
+
+        return {
+            "added": sorted(self.added),
+            "changed": sorted(self.changed),
+            "unchanged": sorted(self.unchanged),
+            "removed": self.removed(),
+        }
+
+    def save(self, drop_removed=True):
+        """
+        Writes the manifest and the outcome of this run atomically.
+
+        :param drop_removed: Forget the entries that were not seen during this run. Only pass
+                             True after a full harvest. With False, nothing is reported as
+                             removed.
+        :return: The report of this run.
+        """
+
+        report = self.report()
+        if drop_removed:
+            for key in report["removed"]:
+                del self.entries[key]
+        else:
+            report["removed"] = []
+
+        folder_path = os.path.dirname(self.path)
+        if folder_path and not os.path.exists(folder_path):
+            os.makedirs(folder_path)
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(
+                {
+                    "entries": self.entries,
+                    "last_run": {
+                        "finished_at": time.strftime(
+                            "%Y-%m-%dT%H:%M:%SZ", time.gmtime()
+                        ),
+                        "added": report["added"],
+                        "changed": report["changed"],
+                        "removed": report["removed"],
+                    },
+                },
+                file,
+                indent=2,
+                sort_keys=True,
+            )
+        os.replace(tmp_path, self.path)
+        return report
+
+
+def load_changed_files(path=MANIFEST_PATH):
+    """
+    Reads the keys the last harvest added or changed.
+
+    :param path: The path of the manifest.
+    :return: A set of '<theme>/<file name>' keys. Empty if there is no manifest yet.
+    """
+
+    if not os.path.exists(path):
+        return set()
+    with open(path) as file:
+        last_run = json.load(file).get("last_run", {})
+    return set(last_run.get("added", [])) | set(last_run.get("changed", []))
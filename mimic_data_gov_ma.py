@@ -0,0 +1,283 @@
+import os
+import time
+import asyncio
+import json
+import hashlib
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import data_get_requests
+import data_get_async
+import data_get_ckan
+from crawl_frontier import Frontier
+from manifest import Manifest
+
+"""
+Local stand-in for 'data.gov.ma'
+
+This script serves a small, fake copy of the pages the crawlers scrape (group page, paginated
+theme pages, dataset pages and resource downloads) from a local HTTP server, with an artificial
+latency on every response. It is to the crawlers what 'mimic_lambda_execution_environment.py' is to
+the Lambda functions: a way to run them end to end without touching the real site.
+
+Downloads carry an ETag and honour 'If-None-Match', 'Range' and 'If-Range', with a 416 for a range
+past the end. '/large/<size>' serves a download of any size, and 'StubHandler.truncate_after' cuts
+downloads short to mimic a dropped connection. The CKAN actions 'group_list' and 'package_search' serve the same themes and datasets
+as JSON.
+
+Run as a script, it crawls the stub with the sequential crawler ('data_get_requests.py'), the
+asyncio crawler ('data_get_async.py') and the CKAN API harvester ('data_get_ckan.py'), checks they
+all produced the same themes, datasets and files, and prints the time each one took.
+
+Usage:
+    python mimic_data_gov_ma.py
+"""
+
+THEMES = 3
+DATASETS_PER_THEME = 25
+PAGE_SIZE = 10
+LATENCY = 0.05  # seconds slept before answering each request
+PAYLOAD = b"col_a,col_b\n1,2\n" * 256
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = LATENCY
+    # bytes sent before a download is cut short, None to never cut
+    truncate_after = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send(self, status, body, content_type="text/html", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_download(self, payload):
+        etag = f'"{hashlib.md5(payload).hexdigest()}"'
+        if self.headers.get("If-None-Match") == etag:
+            return self.send(304, b"", "text/csv", {"ETag": etag})
+
+        start = 0
+        range_header = self.headers.get("Range", "")
+        if range_header.startswith("bytes=") and self.headers.get("If-Range") in [
+            None,
+            etag,
+        ]:
+            start = int(range_header[len("bytes=") :].split("-")[0])
+        if start and start >= len(payload):
+            headers = {"ETag": etag, "Content-Range": f"bytes */{len(payload)}"}
+            return self.send(416, b"", "text/csv", headers)
+        body = payload[start:]
+        status, headers = 200, {"ETag": etag, "Accept-Ranges": "bytes"}
+        if start:
+            status = 206
+            headers["Content-Range"] = (
+                f"bytes {start}-{len(payload) - 1}/{len(payload)}"
+            )
+
+        # with 'truncate_after' set, drop the connection part way, like a flaky upstream
+        if self.truncate_after is not None and len(body) > self.truncate_after:
+            self.send_response(status)
+            self.send_header("Content-Type", "text/csv")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body[: self.truncate_after])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.send(status, body, "text/csv", headers)
+
+    def send_ckan(self, action, query, host):
+        if action == "group_list":
+            result = [
+                {"name": f"theme{t}", "display_name": f"Theme{t}"}
+                for t in range(THEMES)
+            ]
+        elif action == "package_search":
+            names = sorted(
+                f"theme{t}-ds{d}"
+                for t in range(THEMES)
+                for d in range(DATASETS_PER_THEME)
+            )
+            start = int(query.get("start", ["0"])[0])
+            rows = int(query.get("rows", ["10"])[0])
+            packages = [
+                {
+                    "name": name,
+                    "groups": [{"name": name.split("-")[0]}],
+                    "tags": [
+                        {"name": f"tag-{name}", "display_name": f"tag-{name}"},
+                        {"name": "stub", "display_name": "stub"},
+                    ],
+                    "resources": [
+                        {
+                            "id": "r1",
+                            "name": name,
+                            "url": f"{host}/download/{name}.csv",
+                            "format": "CSV",
+                            "hash": "",
+                            "created": "2023-12-20T10:00:00",
+                            "last_modified": None,
+                        }
+                    ],
+                }
+                for name in names[start : start + rows]
+            ]
+            result = {"count": len(names), "results": packages}
+        else:
+            body = {"success": False, "error": {"message": "Not found"}}
+            return self.send(404, json.dumps(body).encode(), "application/json")
+
+        body = json.dumps({"success": True, "result": result}).encode()
+        self.send(200, body, "application/json")
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        url = urlsplit(self.path)
+        parts = [part for part in url.path.split("/") if part]
+
+        if parts == ["data", "fr", "group"]:
+            body = "".join(
+                f'<h2 class="media-heading">Theme{t}</h2>'
+                f'<a class="media-view" href="data/fr/group/theme{t}">view</a>'
+                for t in range(THEMES)
+            )
+            return self.send(200, body.encode())
+
+        if parts[:3] == ["data", "fr", "group"] and len(parts) == 4:
+            theme = parts[3]
+            page = int(parse_qs(url.query).get("page", ["1"])[0])
+            start = (page - 1) * PAGE_SIZE
+            names = range(start, min(start + PAGE_SIZE, DATASETS_PER_THEME))
+            body = "".join(
+                f'<li class="dataset-item"><ul><li>'
+                f'<a href="data/fr/dataset/{theme}-ds{d}">csv</a></li></ul></li>'
+                for d in names
+            )
+            return self.send(200, body.encode())
+
+        if parts[:3] == ["data", "fr", "dataset"] and len(parts) == 4:
+            name = parts[3]
+            host = f"http://{self.headers['Host']}"
+            body = (
+                f'<li class="resource-item">'
+                f'<a class="heading" href="/data/fr/dataset/{name}/resource/r1" title="{name}">'
+                f'res<span class="format-label" data-format="csv">csv</span></a>'
+                f'<a class="resource-url-analytics" href="{host}/download/{name}.csv">dl</a>'
+                f"</li>"
+                f'<ul class="tag-list well"><li>tag-{name}</li><li>stub</li></ul>'
+            )
+            return self.send(200, body.encode())
+
+        if parts[:4] == ["data", "api", "3", "action"]:
+            host = f"http://{self.headers['Host']}"
+            return self.send_ckan(parts[4], parse_qs(url.query), host)
+
+        if parts[:1] == ["download"]:
+            return self.send_download(PAYLOAD)
+
+        if parts[:1] == ["large"]:
+            return self.send_download(b"0123456789abcdef" * (int(parts[1]) // 16))
+
+        self.send(404, b"not found")
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # the default backlog of 5 drops the connections of a concurrent crawl, which are then only
+    # retried after a second
+    request_queue_size = 128
+
+
+def start_stub_server():
+    """
+    Starts the stub server on a free local port in a background thread.
+
+    :return: A (server, base url) tuple. Call 'server.shutdown()' when done.
+    """
+
+    server = StubServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def crawl_ckan():
+    themes = data_get_ckan.get_themes()
+    data_get_ckan.get_datasets(themes)
+    for theme in themes:
+        for dataset in theme.datasets:
+            data_get_requests.local_download(dataset, theme.name)
+    return themes
+
+
+def crawl_sequential(workers=1, frontier_path="frontier.sqlite3"):
+    # the frontier stays out of 'data/', whose files are compared across crawlers
+    frontier = Frontier(frontier_path)
+    data_get_requests.seed_frontier(frontier)
+    if workers > 1:
+        data_get_requests.run_workers(workers, frontier_path)
+    else:
+        data_get_requests.run_worker("worker-0", frontier_path)
+    themes = data_get_requests.merge_downloads(frontier, Manifest())
+    frontier.close()
+    return themes
+
+
+def summarize(themes, data_dir="data"):
+    datasets = {
+        theme.name: sorted(
+            (d.name, d.download_link, tuple(d.tags)) for d in theme.datasets
+        )
+        for theme in themes
+    }
+    files = sorted(
+        os.path.relpath(os.path.join(root, name), data_dir)
+        for root, _, names in os.walk(data_dir)
+        for name in names
+    )
+    return datasets, files
+
+
+def main():
+    server, base_url = start_stub_server()
+    data_get_requests.BASE_URL = base_url
+    data_get_requests.http_cache.enabled = False  # both crawls must really hit the stub
+    data_get_requests.client.bucket = None  # compare the crawls, not the rate limit
+    cwd = os.getcwd()
+    try:
+        results = {}
+        for mode in ["sequential", "asyncio", "ckan"]:
+            with tempfile.TemporaryDirectory() as tmp:
+                os.chdir(tmp)
+                start = time.perf_counter()
+                if mode == "sequential":
+                    themes = crawl_sequential()
+                elif mode == "asyncio":
+                    themes = asyncio.run(data_get_async.crawl(rate=None))
+                else:
+                    themes = crawl_ckan()
+                elapsed = time.perf_counter() - start
+                results[mode] = (elapsed, summarize(themes))
+                os.chdir(cwd)
+
+        for mode in ["asyncio", "ckan"]:
+            assert results[mode][1] == results["sequential"][1], f"{mode} crawl differs"
+        seq = results["sequential"][0]
+        for mode, (elapsed, _) in results.items():
+            print(f"{mode + ':':<12}{elapsed:.2f}s ({seq / elapsed:.1f}x)")
+    finally:
+        os.chdir(cwd)
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+"""
+Warm-Container Response Cache for the Lambda Handlers
+
+A Lambda container serves many invocations once warm, and the popular datasets are asked for over
+and over. Module-level state survives between those invocations, so this cache keeps the
+serialized responses of the handlers in memory, least recently used first out, within a byte
+budget. A repeated request then skips the S3 download, the parsing and the serialization.
+
+Entries are validated against the S3 object they were built from:
+- for 'ttl' seconds after being built or validated, an entry is served as is,
+- after that, a 'head_object' of the dataset compares its ETag with the one of the entry. Same
+  ETag: the entry is served and validated again. New ETag: it is rebuilt.
+
+Classes:
+- ResponseCache: The cache. get_or_load(key, stat, load) serves, revalidates or builds an entry;
+  get_fresh(key) peeks at an entry still within its TTL; stats() returns the hit, miss,
+  revalidation and eviction counters and the bytes held.
+
+Note:
+- The budget and the TTL come from the RESPONSE_CACHE_MAX_BYTES and RESPONSE_CACHE_TTL
+  environment variables of the function. Keep the budget well below the memory of the function.
+- Each container has its own cache. A cold start starts empty.
+"""
+
+CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", 30))  # seconds
+
+
+class ResponseCache:
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.counters = {"hits": 0, "misses": 0, "revalidations": 0, "evictions": 0}
+        self.lock = threading.Lock()
+
+    def get_or_load(self, key, stat, load):
+        """
+        Serves an entry, revalidating it if it is older than the TTL, or builds it.
+
+        :param key: A hashable key identifying the response.
+        :param stat: A function returning the current metadata of the S3 object, a dict with at
+                     least an "etag". Only called when the entry is missing or too old.
+        :param load: A function taking that metadata and returning a (value, size in bytes)
+                     tuple. Only called on a miss.
+        :return: A (value, hit) tuple.
+        """
+
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                if now - entry["validated_at"] < self.ttl:
+                    self.counters["hits"] += 1
+                    return entry["value"], True
+
+        meta = stat()
+        if entry is not None and entry["etag"] == meta["etag"]:
+            with self.lock:
+                entry["validated_at"] = now
+                self.counters["hits"] += 1
+                self.counters["revalidations"] += 1
+            return entry["value"], True
+
+        value, size = load(meta)
+        with self.lock:
+            self.counters["misses"] += 1
+            self._store(key, meta["etag"], value, size, now)
+        return value, False
+
+    def get_fresh(self, key):
+        """
+        :return: The value of an entry built or validated less than 'ttl' seconds ago, or None.
+                 Not counted, the request is expected to go on with 'get_or_load'.
+        """
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or time.monotonic() - entry["validated_at"] >= self.ttl:
+                return None
+            return entry["value"]
+
+    def _store(self, key, etag, value, size, now):
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.bytes -= previous["size"]
+        if size > self.max_bytes:
+            return  # would evict everything else and still not fit
+
+        self.entries[key] = {
+            "etag": etag,
+            "value": value,
+            "size": size,
+            "validated_at": now,
+        }
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.bytes -= evicted["size"]
+            self.counters["evictions"] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """
+        :return: A dict with the counters, the number of entries and the bytes held.
+        """
+
+        with self.lock:
+            stats = dict(self.counters)
+            stats["entries"] = len(self.entries)
+            stats["bytes"] = self.bytes
+        return stats
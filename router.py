@@ -0,0 +1,140 @@
+import json
+import urllib.parse
+import boto3
+from aggregation import handle_aggregation
+from catalog import handle_catalog
+from dataset_batch import handle_batch
+from dataset_profile import handle_stats
+from dataset_query import QueryError
+from http_responses import request_headers
+from s3_datasets import dataset_name, handle_dataset
+from search_index import handle_search
+
+"""
+Single Router for the API
+
+'lambda_function.py', 'getS3Data.py', 'getS3DataTheme.py', 'getS3DataStats.py' and
+'getS3DataSearch.py' are separate functions, each with its own cold starts and its own warm
+containers. This handler serves all of their routes from one function, so a container warmed by
+one route serves the others, with their in-memory caches:
+- GET /data?theme=<theme>&dataset=<dataset> or /data/<theme>/<dataset>: a dataset, with the
+  paging, filter, format and typed parameters of 'getS3Data.py',
+- GET /themes?theme=<theme> or /themes/<theme>: the catalog of a theme, of every theme without it,
+  as 'getS3DataTheme.py',
+- GET /catalog or /catalog/<theme>: the same catalogs,
+- GET /stats?theme=<theme>&dataset=<dataset> or /stats/<theme>/<dataset>: the profile of a
+  dataset, as 'getS3DataStats.py',
+- GET /search?q=<text>&tag=<tag>&theme=<theme>&limit=<n>: the search of 'getS3DataSearch.py',
+- GET /batch?datasets=<theme>/<dataset>,... or /batch?theme=<theme>: several datasets, as
+  'getS3DataBatch.py',
+- GET /aggregate?theme=<theme>&dataset=<dataset>&... or /aggregate/<theme>/<dataset>?...: the
+  aggregations and chart series of 'getS3DataAggregate.py'.
+The route is the first segment of the path, after the stage name if the path holds it (HTTP APIs),
+so the function works behind a '/{proxy+}' resource as well as behind one resource per route.
+
+What a cold start costs is what this module imports and builds at load time. The S3 client is
+created once, at load time, and shared by every route and invocation. 'pyarrow', the heaviest
+dependency, is only imported by the typed reads and the Arrow format, and 'pandas' by the
+aggregations ('lazy_import.py'): the other routes never load them. 'python benchmark_cold_start.py'
+measures both.
+"""
+
+# Initialize S3 client once per container, shared by every route
+s3_client = boto3.client("s3")
+
+
+def _error(status, message):
+    return {
+        "statusCode": status,
+        "headers": {"Content-Type": "application/json"},
+        "body": json.dumps(message),
+    }
+
+
+def _theme_and_dataset(event, params, arguments):
+    # /<route>/<theme>/<dataset>, the path parameters of 'lambda_function.py', or the query string
+    path_params = event.get("pathParameters") or {}
+    if len(arguments) >= 2:
+        theme, dataset = arguments[0], arguments[1]
+    elif path_params.get("themeName") and path_params.get("datasetName"):
+        theme, dataset = path_params["themeName"], path_params["datasetName"]
+    else:
+        theme, dataset = params.get("theme"), params.get("dataset")
+    if not theme or not dataset:
+        raise QueryError("theme and dataset are required")
+    return theme, dataset_name(dataset)
+
+
+def dataset_route(event, params, headers, arguments):
+    theme, dataset = _theme_and_dataset(event, params, arguments)
+    return handle_dataset(s3_client, theme, dataset, params, headers)
+
+
+def catalog_route(event, params, headers, arguments):
+    theme = arguments[0] if arguments else params.get("theme")
+    return handle_catalog(s3_client, theme, headers)
+
+
+def stats_route(event, params, headers, arguments):
+    theme, dataset = _theme_and_dataset(event, params, arguments)
+    return handle_stats(s3_client, theme, dataset, headers)
+
+
+def search_route(event, params, headers, arguments):
+    return handle_search(s3_client, params, headers)
+
+
+def batch_route(event, params, headers, arguments):
+    return handle_batch(s3_client, params, headers)
+
+
+def aggregate_route(event, params, headers, arguments):
+    theme, dataset = _theme_and_dataset(event, params, arguments)
+    return handle_aggregation(s3_client, theme, dataset, params, headers)
+
+
+# route: (handler, message of the 404 when the S3 object is missing)
+ROUTES = {
+    "data": (dataset_route, "File not found"),
+    "themes": (catalog_route, "File not found"),
+    "catalog": (catalog_route, "File not found"),
+    "stats": (stats_route, "Profile not found"),
+    "search": (search_route, "Search index not found"),
+    "batch": (batch_route, "File not found"),
+    "aggregate": (aggregate_route, "File not found"),
+}
+
+
+def route_of(event):
+    """
+    :param event: An API Gateway proxy event, of a REST API or an HTTP API.
+    :return: A (route, arguments) tuple, the first segment of the path and the decoded segments
+             after it. The route is "" for the root path.
+    """
+
+    path = event.get("rawPath") or event.get("path") or "/"
+    segments = [urllib.parse.unquote(segment) for segment in path.split("/") if segment]
+    stage = (event.get("requestContext") or {}).get("stage")
+    if segments and segments[0] == stage and segments[0] not in ROUTES:
+        segments = segments[1:]
+    if not segments:
+        return "", []
+    return segments[0], segments[1:]
+
+
+def lambda_handler(event, context):
+    route, arguments = route_of(event)
+    if route not in ROUTES:
+        return _error(404, f"Unknown route: /{route}")
+    handler, not_found = ROUTES[route]
+
+    try:
+        params = event.get("queryStringParameters") or {}
+        return handler(event, params, request_headers(event), arguments)
+
+    except QueryError as e:
+        return _error(400, str(e))
+    except s3_client.exceptions.NoSuchKey:
+        return _error(404, not_found)
+    except Exception as e:
+        return _error(500, str(e))
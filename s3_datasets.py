@@ -0,0 +1,881 @@
+import io
+import os
+import csv
+import gzip
+import json
+import base64
+import itertools
+import datetime
+import decimal
+from botocore.exceptions import ClientError
+from csv_compression import GZIP_SUFFIX, gzip_path, member_range
+from csv_index import INDEX_VERSION, index_path, locate
+from dataset_formats import (
+    FORMATS,
+    negotiate_format,
+    rows_to_table,
+    to_arrow,
+    to_csv,
+    to_ndjson,
+)
+from dataset_query import QueryError, arrow_read_options, parse_query, select_rows
+from http_responses import (
+    accepts_encoding,
+    cache_headers,
+    etag_matches,
+    not_modified,
+    ok,
+    see_other,
+)
+from lazy_import import lazy_import
+from response_cache import ResponseCache
+
+# imported on the first typed read, None if not installed
+pa = lazy_import("pyarrow")
+pc = lazy_import("pyarrow.compute")
+pq = lazy_import("pyarrow.parquet")
+
+"""
+Dataset Access for the Lambda Handlers
+
+'getS3Data.py' and 'lambda_function.py' serve the same datasets from the 'data-morocco' bucket,
+behind different API Gateway routes. This module holds what they share: where a dataset lives in
+the bucket and how its rows are read.
+
+'data_processor.py' writes every dataset twice, and both copies are uploaded to the bucket:
+- 'csv_data/<theme>/<dataset>.csv': the sheet as text, every value a string,
+- 'parquet_data/<theme>/<dataset>.parquet': the same sheet with a normalized schema (typed numbers
+  and dates, clean column names), compressed.
+
+The handlers serve the CSV by default. With 'typed=true' they serve the Parquet copy: the values
+come back as JSON numbers, nulls and ISO dates, and the (smaller) object is decoded in columnar
+form instead of parsing text. When the Parquet copy is missing, or 'pyarrow' is not available in
+the Lambda, the CSV is served instead.
+
+Without paging parameters, a handler returns the whole dataset as a list of rows, header first.
+With 'offset'/'limit', or the 'cursor' of a previous page, it returns one page:
+    {"columns": [...], "rows": [...], "offset": 100, "limit": 50, "next_cursor": "..."}
+The CSV is then parsed as it streams from S3, and the download stops as soon as the page is full,
+so latency and memory depend on the page size and depth, not on the size of the dataset.
+'next_cursor' is null on the last page.
+
+Both kinds of responses accept a column projection and row filters ('columns=...',
+'filter.<column>=...', see 'dataset_query.py'). Paging then counts the matching rows.
+
+When the CSV has its row offset index ('<dataset>.idx.json', see 'csv_index.py'), a page is read
+with a single ranged 'get_object' covering only its rows, so deep pages cost the same as the first
+one. Without an index, or with an index that does not match the object, the CSV is streamed from
+its start. Filtered pages are always streamed, the index does not know which rows match.
+
+The CSV is read from its gzip compressed copy, '<dataset>.csv.gz', when it was uploaded (see
+'csv_compression.py'), a third to a quarter of the bytes to transfer: decompressed as it
+streams for whole and filtered reads, fetched by runs of gzip members for indexed pages, and sent as it
+is stored to the clients accepting gzip when they ask for the whole CSV.
+
+Responses are JSON unless the request asks for CSV, NDJSON or an Arrow stream ('format=' or
+'Accept', see 'dataset_formats.py').
+
+A whole dataset (no paging, no filters) whose response is larger than INLINE_MAX_BYTES does not
+fit in a Lambda response (6 MB at most). The handlers then answer with a short-lived presigned URL
+of the object, and the client downloads it from S3 directly: a 303 redirect when the object is in
+the format asked for ('format=csv'), a JSON description of the download otherwise. The response is
+at least as large as the object it is read from, except for the Parquet copy: a larger object is
+offloaded without being read, the others once serialized, when their body turns out too large
+(JSON quotes every value and NDJSON repeats the column names, a CSV of short values doubles).
+
+The handlers answer with 'handle_dataset', which reads the parameters of the request and goes
+through 'dataset_response', which keeps the serialized responses in the
+warm-container cache of 'response_cache.py', keyed by the request and checked against the ETag of
+the object they were read from.
+
+Functions:
+- csv_key(theme, dataset), parquet_key(theme, dataset): Build the S3 keys of a dataset.
+- dataset_name(file_name): Strips the '.csv' extension some routes include.
+- read_csv_rows(s3_client, theme, dataset): Reads a CSV dataset as a list of rows of strings.
+- read_parquet_rows(s3_client, theme, dataset): Reads a Parquet dataset as a list of typed rows.
+- read_rows(s3_client, theme, dataset, typed, query): Reads from Parquet or CSV, falling back to
+  CSV.
+- read_csv_selection(s3_client, theme, dataset, query, consume): Hands the selected rows of a CSV
+  to a function while it streams.
+- read_parquet_table(s3_client, theme, dataset, query): Reads a Parquet dataset as an Arrow table.
+- parse_paging(params): Reads 'offset', 'limit' and 'cursor' from the query string.
+- read_page(s3_client, theme, dataset, offset, limit, typed, query): Reads one page of a dataset.
+- to_json(data): Serializes rows, dates included.
+- head_object(s3_client, key): The metadata of an object of the bucket, None if it is missing.
+- stat_dataset(s3_client, theme, dataset, typed): The object a request is served from, with a
+  'head_object'.
+- serialize_dataset(s3_client, theme, dataset, typed, fmt, paging, query, max_size): Reads the
+  rows or the page of a request in a response format (see 'dataset_formats.py').
+- offload_response(s3_client, meta, fmt): Points to the S3 object of a dataset too large to send.
+- dataset_response(s3_client, theme, dataset, typed, paging, query, if_none_match, fmt): The
+  serialized rows or page of a request, from the cache when it is still valid.
+- handle_dataset(s3_client, theme, dataset, params, headers): The HTTP response of the dataset
+  endpoint, shared by the handlers.
+- is_true(value): Parses a boolean query string parameter.
+"""
+
+BUCKET_NAME = "data-morocco"
+CSV_PREFIX = "csv_data"
+PARQUET_PREFIX = "parquet_data"
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000  # keeps a page well under the 6 MB Lambda response limit
+# whole datasets whose response is larger than this are downloaded from S3 through a presigned URL
+INLINE_MAX_BYTES = int(os.environ.get("DATASET_INLINE_MAX_BYTES", 4 * 1024 * 1024))
+PRESIGNED_URL_EXPIRES = int(os.environ.get("PRESIGNED_URL_EXPIRES", 300))  # seconds
+STORED_CONTENT_TYPES = {
+    "csv": FORMATS["csv"],
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# module-level: survives between the invocations of a warm container
+response_cache = ResponseCache()
+
+
+class _TooLarge(Exception):
+    # raised by the load of a whole dataset whose body is too large, nothing is cached
+    def __init__(self, meta=None):
+        super().__init__(meta and meta["key"])
+        self.meta = meta
+
+
+def _join(lines, max_size=None):
+    # stops reading the rows as soon as the body is larger than max_size
+    parts, size = [], 0
+    for line in lines:
+        size += len(line)
+        if max_size is not None and size > max_size:
+            raise _TooLarge()
+        parts.append(line)
+    return "".join(parts)
+
+
+def csv_key(theme, dataset):
+    return f"{CSV_PREFIX}/{theme}/{dataset}.csv"
+
+
+def parquet_key(theme, dataset):
+    return f"{PARQUET_PREFIX}/{theme}/{dataset}.parquet"
+
+
+def dataset_name(file_name):
+    """
+    :param file_name: A dataset name, with or without its '.csv' extension.
+    :return: The dataset name without extension.
+    """
+
+    return file_name[: -len(".csv")] if file_name.endswith(".csv") else file_name
+
+
+def is_true(value):
+    return str(value).lower() in ["1", "true", "yes"]
+
+
+def _csv_rows(body):
+    # newline="" lets the csv module handle line breaks inside quoted values
+    reader = csv.reader(io.TextIOWrapper(body, encoding="utf-8", newline=""))
+    return (row for row in reader if row)
+
+
+def _get_csv(s3_client, theme, dataset):
+    # the compressed copy when it was uploaded, decompressed as it streams, the CSV otherwise
+    try:
+        response = s3_client.get_object(
+            Bucket=BUCKET_NAME, Key=gzip_path(csv_key(theme, dataset))
+        )
+    except s3_client.exceptions.NoSuchKey:
+        response = s3_client.get_object(Bucket=BUCKET_NAME, Key=csv_key(theme, dataset))
+        return response["Body"], response["Body"]
+    return response["Body"], gzip.GzipFile(fileobj=response["Body"], mode="rb")
+
+
+def read_csv_selection(s3_client, theme, dataset, query, consume):
+    """
+    Reads a CSV dataset, from its compressed copy if there is one, and hands the selected rows to
+    a function while the object streams from S3.
+
+    :param query: An optional projection and filters, see 'dataset_query.parse_query', or a
+                  function building them from the column names of the CSV.
+    :param consume: A function of the column names and a lazy iterator over the rows, lists of
+                    strings. The download stops when it returns.
+    :return: What 'consume' returns.
+    :raises s3_client.exceptions.NoSuchKey: If the dataset does not exist.
+    :raises QueryError: If the query does not fit the dataset.
+    """
+
+    body, stream = _get_csv(s3_client, theme, dataset)
+    try:
+        rows = _csv_rows(stream)
+        header = next(rows, [])
+        if callable(query):
+            query = query(header)
+        columns, rows = select_rows(header, rows, query)
+        return consume(columns, rows)
+    finally:
+        # stops the download when 'consume' did not read every row
+        body.close()
+
+
+def read_csv_rows(s3_client, theme, dataset, query=None):
+    """
+    Reads a CSV dataset. Blank lines are not rows, as in pages.
+
+    :param query: An optional projection and filters, see 'dataset_query.parse_query'.
+    :return: A list of rows, the header first, every value a string.
+    :raises s3_client.exceptions.NoSuchKey: If the dataset does not exist.
+    :raises QueryError: If the query does not fit the dataset.
+    """
+
+    return read_csv_selection(
+        s3_client,
+        theme,
+        dataset,
+        query,
+        lambda columns, rows: [columns] + list(rows),
+    )
+
+
+def read_parquet_rows(s3_client, theme, dataset, query=None):
+    """
+    Reads a Parquet dataset.
+
+    :param query: An optional projection and filters, see 'dataset_query.parse_query'.
+    :return: A list of rows, the header first, values typed (int, float, str, None). Dates and
+             timestamps are ISO strings.
+    :raises s3_client.exceptions.NoSuchKey: If the dataset has no Parquet copy.
+    :raises QueryError: If the query does not fit the dataset.
+    """
+
+    table = read_parquet_table(s3_client, theme, dataset, query)
+    return [table.column_names] + _table_rows(table)
+
+
+def read_parquet_table(s3_client, theme, dataset, query=None):
+    """
+    Reads the Parquet copy of a dataset, only the columns and row groups a query needs.
+
+    :param query: An optional projection and filters, see 'dataset_query.parse_query', or a
+                  function building them from the column names of the Parquet copy.
+    :return: A 'pyarrow.Table'.
+    :raises s3_client.exceptions.NoSuchKey: If the dataset has no Parquet copy.
+    :raises QueryError: If the query does not fit the dataset.
+    """
+
+    response = s3_client.get_object(Bucket=BUCKET_NAME, Key=parquet_key(theme, dataset))
+    source = io.BytesIO(response["Body"].read())
+    if query is None:
+        return pq.read_table(source)
+    schema = pq.read_schema(source)
+    if callable(query):
+        query = query(schema.names)
+    columns, filters = arrow_read_options(schema, query)
+    source.seek(0)
+    return pq.read_table(source, columns=columns, filters=filters)
+
+
+def _table_rows(table):
+    # building Python date objects is by far the slowest part, Arrow formats them much faster
+    columns = []
+    for column in table.columns:
+        if pa.types.is_timestamp(column.type):
+            column = pc.cast(column, pa.timestamp("s"), safe=False)
+            column = pc.strftime(column, format="%Y-%m-%dT%H:%M:%S")
+        elif pa.types.is_date(column.type):
+            column = column.cast(pa.string())
+        columns.append(column.to_pylist())
+    # rows stay tuples, 'json.dumps' writes them as arrays
+    return list(zip(*columns))
+
+
+def read_rows(s3_client, theme, dataset, typed=False, query=None):
+    """
+    Reads a dataset, from its Parquet copy when typed values are asked for.
+
+    :param s3_client: A boto3 S3 client.
+    :param theme: The theme folder of the dataset.
+    :param dataset: The dataset name, without extension.
+    :param typed: Read the Parquet copy if there is one.
+    :param query: An optional projection and filters, see 'dataset_query.parse_query'.
+    :return: A (rows, source) tuple, source being "parquet" or "csv".
+    :raises s3_client.exceptions.NoSuchKey: If the dataset does not exist.
+    :raises QueryError: If the query does not fit the dataset.
+    """
+
+    if typed and pq is not None:
+        try:
+            return read_parquet_rows(s3_client, theme, dataset, query), "parquet"
+        except s3_client.exceptions.NoSuchKey:
+            pass
+    return read_csv_rows(s3_client, theme, dataset, query), "csv"
+
+
+def encode_cursor(offset):
+    payload = json.dumps({"offset": offset}).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """
+    :param cursor: A cursor returned as 'next_cursor'.
+    :return: The offset the cursor points to.
+    :raises QueryError: If the cursor is malformed.
+    """
+
+    try:
+        offset = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))["offset"]
+    except (ValueError, TypeError, KeyError, UnicodeError):
+        raise QueryError("invalid cursor")
+    if not isinstance(offset, int) or offset < 0:
+        raise QueryError("invalid cursor")
+    return offset
+
+
+def _non_negative_int(params, name):
+    try:
+        value = int(params[name])
+    except ValueError:
+        raise QueryError(f"{name} must be an integer")
+    if value < 0:
+        raise QueryError(f"{name} must not be negative")
+    return value
+
+
+def parse_paging(params):
+    """
+    Reads the paging parameters of a request.
+
+    :param params: The query string parameters (may be None).
+    :return: An {"offset", "limit"} dict, or None when the request asks for no paging.
+    :raises QueryError: If a parameter is invalid, to be answered with a 400.
+    """
+
+    params = params or {}
+    if not any(name in params for name in ["offset", "limit", "cursor"]):
+        return None
+
+    offset = 0
+    if "cursor" in params:
+        offset = decode_cursor(params["cursor"])
+    elif "offset" in params:
+        offset = _non_negative_int(params, "offset")
+
+    limit = DEFAULT_LIMIT
+    if "limit" in params:
+        limit = _non_negative_int(params, "limit")
+        if not 1 <= limit <= MAX_LIMIT:
+            raise QueryError(f"limit must be between 1 and {MAX_LIMIT}")
+    return {"offset": offset, "limit": limit}
+
+
+def _page(columns, rows, offset, limit, has_next=None):
+    if has_next is None:
+        # one row more than the page is read to know whether there is a next page
+        has_next = len(rows) > limit
+    return {
+        "columns": columns,
+        "rows": rows[:limit],
+        "offset": offset,
+        "limit": limit,
+        "next_cursor": encode_cursor(offset + limit) if has_next else None,
+    }
+
+
+def _read_csv_index(s3_client, theme, dataset):
+    try:
+        response = s3_client.get_object(
+            Bucket=BUCKET_NAME, Key=index_path(csv_key(theme, dataset))
+        )
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    index = json.loads(response["Body"].read())
+    return index if index.get("version") == INDEX_VERSION else None
+
+
+def _get_range(s3_client, key, first, last, size):
+    # the bytes of an object, None if the object is not the size the index expects
+    response = s3_client.get_object(
+        Bucket=BUCKET_NAME, Key=key, Range=f"bytes={first}-{last}"
+    )
+    if response.get("ContentRange", "").rsplit("/", 1)[-1] != str(size):
+        response["Body"].close()
+        return None
+    return response["Body"].read()
+
+
+def _read_csv_range(s3_client, theme, dataset, index, start, end):
+    # the bytes of the CSV from 'start' to 'end', from its compressed copy when there is one,
+    # None when no object can be read by ranges
+    compressed = index.get("gzip")
+    if compressed is not None:
+        first, last, trim = member_range(
+            compressed["members"], compressed["size"], start, end
+        )
+        try:
+            data = _get_range(
+                s3_client,
+                gzip_path(csv_key(theme, dataset)),
+                first,
+                last,
+                compressed["size"],
+            )
+        except s3_client.exceptions.NoSuchKey:
+            pass  # only the CSV was uploaded
+        else:
+            # a run of whole members is a gzip file of its own
+            return (
+                None
+                if data is None
+                else gzip.decompress(data)[trim:][: end - start + 1]
+            )
+
+    try:
+        key = csv_key(theme, dataset)
+        return _get_range(s3_client, key, start, end, index["size"])
+    except s3_client.exceptions.NoSuchKey:
+        # only a compressed copy without members, streamed by 'read_csv_page' instead
+        return None
+
+
+def read_indexed_csv_page(s3_client, theme, dataset, offset, limit, index):
+    """
+    Reads a page of a CSV dataset with a ranged request, using its row offset index.
+
+    :return: A page dict, or None if the index does not match the CSV, or if the objects stored
+             cannot be read by ranges.
+    """
+
+    byte_range = locate(index, offset, limit)
+    if byte_range is None:
+        return _page(index["columns"], [], offset, limit, has_next=False)
+
+    start, end, skip = byte_range
+    data = _read_csv_range(s3_client, theme, dataset, index, start, end)
+    if data is None:
+        # the CSV was rewritten since its index was built, or only its gzip stream was uploaded
+        return None
+
+    count = min(limit, index["rows"] - offset)
+    page_rows = list(itertools.islice(_csv_rows(io.BytesIO(data)), skip, skip + count))
+    return _page(
+        index["columns"], page_rows, offset, limit, offset + limit < index["rows"]
+    )
+
+
+def read_csv_page(s3_client, theme, dataset, offset, limit, query=None):
+    """
+    Reads a page of a CSV dataset, with a ranged request when it has an index and while it
+    streams from S3 otherwise. Blank lines are not rows.
+
+    :param query: An optional projection and filters, see 'dataset_query.parse_query'.
+    :return: A page dict, see the module docstring.
+    :raises s3_client.exceptions.NoSuchKey: If the dataset does not exist.
+    :raises QueryError: If the query does not fit the dataset.
+    """
+
+    index = _read_csv_index(s3_client, theme, dataset) if query is None else None
+    if index is not None:
+        page = read_indexed_csv_page(s3_client, theme, dataset, offset, limit, index)
+        if page is not None:
+            return page
+
+    def page(columns, rows):
+        # the rest of the object is never transferred
+        page_rows = list(itertools.islice(rows, offset, offset + limit + 1))
+        return _page(columns, page_rows, offset, limit)
+
+    return read_csv_selection(s3_client, theme, dataset, query, page)
+
+
+def read_page(s3_client, theme, dataset, offset, limit, typed=False, query=None):
+    """
+    Reads a page of a dataset, from its Parquet copy when typed values are asked for.
+
+    :param s3_client: A boto3 S3 client.
+    :param theme: The theme folder of the dataset.
+    :param dataset: The dataset name, without extension.
+    :param offset: The number of rows to skip.
+    :param limit: The number of rows of the page.
+    :param typed: Read the Parquet copy if there is one.
+    :param query: An optional projection and filters, see 'dataset_query.parse_query'.
+    :return: A (page, source) tuple, source being "parquet" or "csv".
+    :raises s3_client.exceptions.NoSuchKey: If the dataset does not exist.
+    :raises QueryError: If the query does not fit the dataset.
+    """
+
+    if typed and pq is not None:
+        try:
+            table = read_parquet_table(s3_client, theme, dataset, query)
+        except s3_client.exceptions.NoSuchKey:
+            pass
+        else:
+            rows = _table_rows(table.slice(offset, limit + 1))
+            return _page(table.column_names, rows, offset, limit), "parquet"
+    return read_csv_page(s3_client, theme, dataset, offset, limit, query), "csv"
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "replace")
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def to_json(data):
+    return json.dumps(data, default=_json_default)
+
+
+def _encode(fmt, columns, rows, max_size=None):
+    if fmt == "csv":
+        return to_csv(columns, rows)
+    if fmt == "ndjson":
+        return _join(to_ndjson(columns, rows, _json_default), max_size)
+    return to_arrow(rows_to_table(columns, rows))
+
+
+def serialize_dataset(
+    s3_client,
+    theme,
+    dataset,
+    typed=False,
+    fmt="json",
+    paging=None,
+    query=None,
+    max_size=None,
+):
+    """
+    Reads the rows or the page a request asks for and writes them in a response format, with as
+    little work as the format allows: a CSV without paging nor filters is passed through, NDJSON
+    is written while the CSV streams, an Arrow stream of the Parquet copy is written from the
+    decoded table.
+
+    :param typed: Read the Parquet copy, which must exist (see 'stat_dataset').
+    :param fmt: A format of 'dataset_formats.FORMATS'.
+    :param paging: An {"offset", "limit"} dict returned by 'parse_paging', or None.
+    :param query: An optional projection and filters, see 'dataset_query.parse_query'.
+    :param max_size: The size of NDJSON body at which the rows stop being read, None for no
+                     limit.
+    :return: A (body, next_cursor) tuple. The body is bytes for "arrow", a string otherwise.
+             next_cursor is that of a page in a format other than JSON, None otherwise.
+    :raises s3_client.exceptions.NoSuchKey: If the dataset does not exist.
+    :raises QueryError: If the query does not fit the dataset.
+    :raises _TooLarge: If the NDJSON body is larger than 'max_size'.
+    """
+
+    if fmt == "json":
+        if paging is None:
+            data, _ = read_rows(s3_client, theme, dataset, typed, query)
+        else:
+            data, _ = read_page(
+                s3_client, theme, dataset, typed=typed, query=query, **paging
+            )
+        return to_json(data), None
+
+    if typed and fmt == "arrow":
+        table = read_parquet_table(s3_client, theme, dataset, query)
+        next_cursor = None
+        if paging is not None:
+            offset, limit = paging["offset"], paging["limit"]
+            if offset + limit < table.num_rows:
+                next_cursor = encode_cursor(offset + limit)
+            table = table.slice(offset, limit)
+        return to_arrow(table), next_cursor
+
+    if paging is not None:
+        page, _ = read_page(
+            s3_client, theme, dataset, typed=typed, query=query, **paging
+        )
+        return _encode(fmt, page["columns"], page["rows"]), page["next_cursor"]
+
+    if typed:
+        table = read_parquet_table(s3_client, theme, dataset, query)
+        rows = _table_rows(table)
+        return _encode(fmt, table.column_names, rows, max_size), None
+
+    if fmt == "csv" and query is None:
+        # the stored object already is the response
+        body, stream = _get_csv(s3_client, theme, dataset)
+        try:
+            return stream.read().decode("utf-8"), None
+        finally:
+            body.close()
+
+    return (
+        read_csv_selection(
+            s3_client,
+            theme,
+            dataset,
+            query,
+            lambda columns, rows: _encode(fmt, columns, rows, max_size),
+        ),
+        None,
+    )
+
+
+def head_object(s3_client, key):
+    """
+    :return: The 'head_object' response of a key of the bucket, or None if it does not exist.
+    """
+
+    try:
+        return s3_client.head_object(Bucket=BUCKET_NAME, Key=key)
+    except ClientError as e:
+        # a missing key is a bare 404 for head_object, there is no body to name the error
+        if e.response["Error"]["Code"] not in ["404", "NoSuchKey"]:
+            raise
+        return None
+
+
+def stat_dataset(s3_client, theme, dataset, typed=False):
+    """
+    Finds the object a request is served from, without downloading it.
+
+    :param typed: Look for the Parquet copy first.
+    :return: A {"source", "key", "etag", "last_modified", "size", "stored_size", "encoding"}
+             dict. "encoding" is "gzip" for the compressed copy of a CSV, whose "size" is that of
+             the CSV and "stored_size" that of the object.
+    :raises s3_client.exceptions.NoSuchKey: If the dataset does not exist.
+    """
+
+    candidates = [
+        ("csv", gzip_path(csv_key(theme, dataset))),
+        ("csv", csv_key(theme, dataset)),
+    ]
+    if typed and pq is not None:
+        candidates.insert(0, ("parquet", parquet_key(theme, dataset)))
+
+    for source, key in candidates:
+        response = head_object(s3_client, key)
+        if response is not None:
+            # the uploader records the size of the CSV on its compressed copy
+            size = response.get("Metadata", {}).get("source-size")
+            return {
+                "source": source,
+                "key": key,
+                "etag": response["ETag"],
+                "last_modified": response["LastModified"],
+                "size": int(size or response["ContentLength"]),
+                "stored_size": response["ContentLength"],
+                "encoding": response.get("ContentEncoding"),
+            }
+    raise s3_client.exceptions.NoSuchKey(
+        {"Error": {"Code": "NoSuchKey", "Message": candidates[-1][1]}}, "HeadObject"
+    )
+
+
+def offload_response(s3_client, meta, fmt="json"):
+    """
+    Points the client to the S3 object of a dataset instead of sending it.
+
+    :param meta: The 'stat_dataset' dict of the object.
+    :param fmt: The format asked for.
+    :return: A response dict like those of 'dataset_response', with the presigned "url", and a
+             JSON body describing the download. "redirect" is True when the object is in the
+             format asked for, and the client can be sent to it directly.
+    """
+
+    file_name = meta["key"].rsplit("/", 1)[-1]
+    if meta.get("encoding") == "gzip":
+        # S3 sends the compressed copy with 'Content-Encoding: gzip', clients save the CSV
+        file_name = file_name[: -len(GZIP_SUFFIX)]
+    url = s3_client.generate_presigned_url(
+        "get_object",
+        Params={
+            "Bucket": BUCKET_NAME,
+            "Key": meta["key"],
+            "ResponseContentDisposition": f'attachment; filename="{file_name}"',
+        },
+        ExpiresIn=PRESIGNED_URL_EXPIRES,
+    )
+    download = {
+        "url": url,
+        "expires_in": PRESIGNED_URL_EXPIRES,
+        "size": meta.get("stored_size", meta["size"]),
+        "content_type": STORED_CONTENT_TYPES[meta["source"]],
+    }
+    if meta.get("encoding"):
+        download["content_encoding"] = meta["encoding"]
+    return {
+        **meta,
+        "body": to_json(download),
+        "content_type": FORMATS["json"],
+        "next_cursor": None,
+        "url": url,
+        "redirect": fmt == meta["source"],
+    }
+
+
+def dataset_response(
+    s3_client,
+    theme,
+    dataset,
+    typed=False,
+    paging=None,
+    query=None,
+    if_none_match=None,
+    fmt="json",
+    accept_encoding=None,
+):
+    """
+    Reads and serializes the rows or the page a request asks for, through the warm-container
+    cache. A cached response is served as is within the TTL of the cache, and after a
+    'head_object' shows the object still has the same ETag otherwise.
+
+    When the client already has the current version ('If-None-Match'), nothing is read: the
+    response has no body. A whole dataset whose object is larger than INLINE_MAX_BYTES is not read
+    either, the response points to it (see 'offload_response'), as it does when the serialized
+    body of a smaller object is larger than INLINE_MAX_BYTES. A whole CSV asked for by a client accepting
+    gzip is sent as its compressed copy is stored, without being decompressed.
+
+    :param s3_client: A boto3 S3 client.
+    :param theme: The theme folder of the dataset.
+    :param dataset: The dataset name, without extension.
+    :param typed: Read the Parquet copy if there is one.
+    :param paging: An {"offset", "limit"} dict returned by 'parse_paging', or None.
+    :param query: An optional projection and filters, see 'dataset_query.parse_query'.
+    :param if_none_match: The 'If-None-Match' header of the request, or None.
+    :param fmt: The response format, a key of 'dataset_formats.FORMATS'.
+    :param accept_encoding: The 'Accept-Encoding' header of the request, or None.
+    :return: A (response, hit) tuple, response being the 'stat_dataset' dict of the
+             object read, with the serialized "body", its "content_type" and the
+             "next_cursor" of a page not in JSON. The body is None when the client
+             has the current version. A compressed body has its "content_encoding".
+    :raises s3_client.exceptions.NoSuchKey: If the dataset does not exist.
+    :raises QueryError: If the query does not fit the dataset.
+    """
+
+    whole = paging is None and query is None
+    # only a whole CSV can be sent as it is stored
+    gzip_ok = whole and fmt == "csv" and accepts_encoding(accept_encoding, "gzip")
+    cache_key = (
+        theme,
+        dataset,
+        bool(typed),
+        json.dumps(paging, sort_keys=True),
+        json.dumps(query),
+        fmt,
+        gzip_ok,
+    )
+
+    def load(meta):
+        if gzip_ok and meta.get("encoding") == "gzip":
+            data = s3_client.get_object(Bucket=BUCKET_NAME, Key=meta["key"])[
+                "Body"
+            ].read()
+            response = dict(
+                meta,
+                body=data,
+                content_type=FORMATS[fmt],
+                content_encoding="gzip",
+                next_cursor=None,
+            )
+            return response, len(data)
+
+        # read from the object that was stat'ed, not through the fallbacks again
+        try:
+            body, next_cursor = serialize_dataset(
+                s3_client,
+                theme,
+                dataset,
+                meta["source"] == "parquet",
+                fmt,
+                paging,
+                query,
+                INLINE_MAX_BYTES if whole else None,
+            )
+        except _TooLarge:
+            raise _TooLarge(meta)
+        response = dict(
+            meta, body=body, content_type=FORMATS[fmt], next_cursor=next_cursor
+        )
+        # JSON escapes non ASCII characters, one character is one byte; CSV does not
+        size = len(body.encode("utf-8")) if fmt == "csv" else len(body)
+        if whole and size > INLINE_MAX_BYTES:
+            raise _TooLarge(meta)
+        return response, size
+
+    meta = None
+    if if_none_match or whole:
+        # a cached response is never an offloaded one, its size was fine
+        cached = response_cache.get_fresh(cache_key)
+        meta = cached or stat_dataset(s3_client, theme, dataset, typed)
+        if etag_matches(if_none_match, meta["etag"]):
+            not_modified = {**meta, "body": None, "content_type": FORMATS[fmt]}
+            return not_modified, cached is not None
+        sent = meta["size"]
+        if gzip_ok and meta.get("encoding") == "gzip":
+            sent = meta["stored_size"]
+        # the body is at least the size of the object, the Parquet copy aside
+        if whole and sent > INLINE_MAX_BYTES:
+            return offload_response(s3_client, meta, fmt), False
+
+    def stat():
+        # a 'head_object' already made for 'If-None-Match' is not made twice
+        if meta is not None:
+            return meta
+        return stat_dataset(s3_client, theme, dataset, typed)
+
+    try:
+        return response_cache.get_or_load(cache_key, stat, load)
+    except _TooLarge as e:
+        return offload_response(s3_client, e.meta, fmt), False
+
+
+def handle_dataset(s3_client, theme, dataset, params, headers):
+    """
+    Answers a request of the dataset endpoint, whichever handler or route received it.
+
+    :param s3_client: A boto3 S3 client.
+    :param theme: The theme folder of the dataset.
+    :param dataset: The dataset name, without extension.
+    :param params: The query string parameters.
+    :param headers: The request headers, names lower-cased ('http_responses.request_headers').
+    :return: A Lambda proxy integration response: 200, 303 to a presigned URL or 304.
+    :raises s3_client.exceptions.NoSuchKey: If the dataset does not exist.
+    :raises QueryError: If a parameter is invalid, answered with a 400.
+    """
+
+    # typed=true serves the Parquet copy: numbers, nulls and dates instead of strings
+    typed = is_true(params.get("typed"))
+    # offset/limit or cursor: one page, read without downloading the whole file
+    paging = parse_paging(params)
+    # columns=... and filter.<column>=... filters, applied while the data is read
+    query = parse_query(params)
+    # format=csv|ndjson|arrow or the Accept header, JSON by default
+    fmt = negotiate_format(params, headers.get("accept"))
+
+    # repeated requests are served from the memory of the warm container,
+    # and not at all when the client already has the current version
+    response, hit = dataset_response(
+        s3_client,
+        theme,
+        dataset,
+        typed,
+        paging,
+        query,
+        if_none_match=headers.get("if-none-match"),
+        fmt=fmt,
+        accept_encoding=headers.get("accept-encoding"),
+    )
+    response_headers = {
+        "Content-Type": response["content_type"],
+        "X-Data-Source": response["source"],
+        "X-Cache": "Hit" if hit else "Miss",
+        **cache_headers(response["etag"], response["last_modified"]),
+    }
+    if response.get("next_cursor"):
+        response_headers["X-Next-Cursor"] = response["next_cursor"]
+    if response.get("content_encoding"):
+        # the compressed copy of the CSV, sent as it is stored
+        response_headers["Content-Encoding"] = response["content_encoding"]
+    if response["body"] is None:
+        return not_modified(response_headers)
+    if response.get("url"):
+        # too large for a Lambda response: downloaded from S3, with a URL that expires
+        response_headers["Cache-Control"] = "no-store"
+        if response["redirect"]:
+            return see_other(response["url"], response_headers)
+
+    # Return data, compressed if the client accepts it
+    return ok(response["body"], response_headers, headers.get("accept-encoding"))
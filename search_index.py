@@ -0,0 +1,410 @@
+import os
+import re
+import gzip
+import json
+import math
+import heapq
+import operator
+import bisect
+import functools
+import itertools
+import unicodedata
+from csv_index import index_path
+from catalog import catalog_path
+from dataset_query import QueryError
+from http_responses import cache_headers, etag_matches, not_modified, ok
+from response_cache import ResponseCache
+from s3_datasets import BUCKET_NAME, CSV_PREFIX, head_object
+
+"""
+Search Index of the Dataset Catalog
+
+The harvest scrapes a title and tags for every dataset, and the CSV headers tell what a dataset
+holds, but the only way to find a dataset was to list a theme and read it. This module builds an
+inverted index over the names, titles, tags and column headers of the catalog ('catalog.py'), at
+processing time, and answers ranked queries from it.
+
+Text is tokenized the same way on both sides, so that accents and spellings do not matter:
+- French: lower-cased, accents removed ('Économie' -> 'economie'),
+- Arabic: diacritics (harakat) and tatweel removed, alef, teh marbuta and alef maksura variants
+  unified ('الإحصاءات' and 'الاحصاءات' are the same token),
+- split on anything that is not a letter or a digit, a few stop words dropped.
+
+Fields weigh differently: a token of the name or title counts more than one of the tags, which
+counts more than one of the column headers. Each posting stores the final score of a token in a
+dataset, field weight times the inverse document frequency of the token, so a query only adds
+numbers up. Results are ranked by the number of query tokens matched, then by score. The last
+query token also matches as a prefix ('econ' finds 'economie'), for search as you type.
+
+The index is written as 'csv_data/_search.json.gz', uploaded with the data, and loaded once by each
+warm container of the search endpoint ('getS3DataSearch.py'):
+    {
+        "version": 1,
+        "docs": [[theme, name, title, tags], ...],
+        "postings": {token: [[doc id deltas], [scores x 100]]},
+        "tags": {normalized tag: [doc id deltas]}
+    }
+Document ids are delta-encoded and scores are integers, which keeps the file compact. The tag and
+theme filters are set lookups, and a query only decodes the postings of its own tokens.
+
+Classes:
+- SearchIndex: A loaded index. search(query, tag, theme, limit) ranks the datasets.
+
+Functions:
+- tokenize(text): Normalizes and splits a text into tokens.
+- tag_key(tag): The normalized form of a tag.
+- build_search_index(entries): Builds the index of catalog entries.
+- write_search_index(csv_dir): Builds the index of the global catalog and writes it.
+- load_search_index(s3_client): The index of the bucket, loaded once per warm container.
+- parse_limit(params): The number of results asked for by a query string.
+- handle_search(s3_client, params, headers): The HTTP response of the search endpoint, shared by
+  the handlers.
+"""
+
+SEARCH_INDEX_FILENAME = "_search.json.gz"
+SEARCH_INDEX_KEY = f"{CSV_PREFIX}/{SEARCH_INDEX_FILENAME}"
+SEARCH_INDEX_VERSION = 1
+FIELD_WEIGHTS = {"name": 3.0, "tags": 2.0, "columns": 1.0}
+MAX_PREFIX_EXPANSIONS = 50  # tokens a prefix may stand for
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+STOP_WORDS = {
+    # French
+    *["a", "au", "aux", "d", "de", "des", "du", "en", "et", "l", "la", "le", "les"],
+    *["par", "pour", "sur", "un", "une"],
+    # Arabic
+    *["في", "من", "على", "الى", "عن", "و"],
+}
+
+ARABIC_VARIANTS = str.maketrans(
+    {
+        "أ": "ا",
+        "إ": "ا",
+        "آ": "ا",
+        "ٱ": "ا",
+        "ة": "ه",
+        "ى": "ي",
+        "ـ": None,  # tatweel
+    }
+)
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+
+def tokenize(text):
+    """
+    :param text: Any text, None included.
+    :return: The list of its normalized tokens, in order, stop words dropped.
+    """
+
+    if not text:
+        return []
+    # NFKD splits accents, Arabic harakat and hamzas off their letter, as combining marks
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    normalized = stripped.translate(ARABIC_VARIANTS)
+    return [
+        token for token in TOKEN_PATTERN.findall(normalized) if token not in STOP_WORDS
+    ]
+
+
+@functools.lru_cache(maxsize=65536)
+def _tokens(text):
+    # tags and column headers repeat across datasets, they are tokenized once
+    return tuple(tokenize(text))
+
+
+def tag_key(tag):
+    """
+    :return: The normalized form of a tag, under which the index files its datasets.
+    """
+
+    return " ".join(_tokens(tag))
+
+
+def _fields(entry):
+    return {
+        "name": tokenize(entry["Name"].replace("-", " "))
+        + tokenize(entry.get("Title")),
+        "tags": [token for tag in entry.get("Tags") or [] for token in _tokens(tag)],
+        "columns": [
+            token
+            for column in entry.get("ColumnNames") or []
+            for token in _tokens(column)
+        ],
+    }
+
+
+def _deltas(ids):
+    return [ids[0]] + [b - a for a, b in zip(ids, ids[1:])]
+
+
+def build_search_index(entries):
+    """
+    Builds the inverted index of catalog entries.
+
+    :param entries: Catalog entries with their "Theme", and their "ColumnNames" when known.
+    :return: The index dict, see the module docstring.
+    """
+
+    docs = []
+    weights = {}  # token -> {doc id: field weight}
+    tagged = {}  # tag key -> [doc ids]
+    for doc_id, entry in enumerate(entries):
+        tags = entry.get("Tags") or []
+        docs.append([entry["Theme"], entry["Name"], entry.get("Title"), tags])
+        for field, tokens in _fields(entry).items():
+            weight = FIELD_WEIGHTS[field]
+            for token in tokens:
+                by_doc = weights.setdefault(token, {})
+                # a token counts once per field, whatever its repetitions
+                if by_doc.get(doc_id, 0) < weight:
+                    by_doc[doc_id] = weight
+        for key in {tag_key(tag) for tag in tags}:
+            if key:
+                tagged.setdefault(key, []).append(doc_id)
+
+    postings = {}
+    count = len(docs)
+    for token, by_doc in weights.items():
+        idf = math.log(1 + count / len(by_doc))
+        ids = sorted(by_doc)
+        scores = [round(by_doc[doc_id] * idf * 100) for doc_id in ids]
+        postings[token] = [_deltas(ids), scores]
+
+    return {
+        "version": SEARCH_INDEX_VERSION,
+        "docs": docs,
+        "postings": postings,
+        "tags": {key: _deltas(ids) for key, ids in tagged.items()},
+    }
+
+
+def write_search_index(csv_dir):
+    """
+    Builds the index of the global catalog of a CSV directory and writes it next to it. The
+    column headers come from the row offset indexes of the CSV files.
+
+    :return: The path of the index.
+    """
+
+    with open(catalog_path(csv_dir)) as file:
+        entries = json.load(file)
+    for entry in entries:
+        csv_path = os.path.join(csv_dir, entry["Theme"], f"{entry['Name']}.csv")
+        if os.path.exists(index_path(csv_path)):
+            with open(index_path(csv_path)) as file:
+                entry["ColumnNames"] = json.load(file)["columns"]
+
+    path = os.path.join(csv_dir, SEARCH_INDEX_FILENAME)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    data = json.dumps(
+        build_search_index(entries), separators=(",", ":"), ensure_ascii=False
+    )
+    with open(tmp_path, "wb") as file:
+        file.write(gzip.compress(data.encode("utf-8")))
+    os.replace(tmp_path, path)
+    return path
+
+
+class SearchIndex:
+    def __init__(self, index):
+        if index.get("version") != SEARCH_INDEX_VERSION:
+            raise ValueError(
+                f"unsupported search index version: {index.get('version')}"
+            )
+        self.docs = index["docs"]
+        self.postings = index["postings"]
+        self.tags = index["tags"]
+        self.vocabulary = sorted(self.postings)
+        self.themes = {}  # theme -> {doc ids}
+        for doc_id, doc in enumerate(self.docs):
+            self.themes.setdefault(doc[0], set()).add(doc_id)
+
+    @classmethod
+    def loads(cls, data):
+        """
+        :param data: The bytes of a '_search.json.gz' file.
+        :return: A SearchIndex.
+        """
+
+        return cls(json.loads(gzip.decompress(data)))
+
+    def _expand(self, prefix):
+        # the tokens starting with the prefix follow it in the sorted vocabulary
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        end = min(start + MAX_PREFIX_EXPANSIONS, len(self.vocabulary))
+        return list(
+            itertools.takewhile(
+                lambda token: token.startswith(prefix), self.vocabulary[start:end]
+            )
+        )
+
+    def _scores(self, candidates):
+        # {doc id: score} of the best candidate token of each dataset
+        best = {}
+        for candidate in candidates:
+            deltas, scores = self.postings.get(candidate, ([], []))
+            decoded = dict(zip(itertools.accumulate(deltas), scores))
+            if len(decoded) > len(best):
+                best, decoded = decoded, best
+            for doc_id, score in decoded.items():
+                if score > best.get(doc_id, 0):
+                    best[doc_id] = score
+        return best
+
+    def _rank(self, tokens, allowed, limit):
+        # the last token may still be being typed
+        matches = [self._scores([token]) for token in tokens[:-1]]
+        matches.append(self._scores(self._expand(tokens[-1])))
+        matches.sort(key=len)
+
+        # datasets matching every token rank first: a set intersection, usually enough
+        if len(matches) == 1 and allowed is None:
+            # a single token: its postings are the totals, ranked without a Python loop
+            every = matches[0]
+            totals = zip(every.values(), map(operator.neg, every))
+        else:
+            every = set(matches[0]).intersection(*matches[1:])
+            if allowed is not None:
+                every &= allowed
+            totals = (
+                (sum(match[doc_id] for match in matches), -doc_id) for doc_id in every
+            )
+        ranked = heapq.nlargest(limit, totals)
+        ranked = [(len(matches), score, -negated) for score, negated in ranked]
+        if len(ranked) == limit or len(matches) == 1:
+            return ranked
+
+        # then the datasets matching fewer tokens
+        partial = set().union(*matches) - every
+        if allowed is not None:
+            partial &= allowed
+        partial_ranked = heapq.nlargest(
+            limit - len(ranked),
+            (
+                (
+                    sum(doc_id in match for match in matches),
+                    sum(match.get(doc_id, 0) for match in matches),
+                    -doc_id,
+                )
+                for doc_id in partial
+            ),
+        )
+        return ranked + [
+            (matched, score, -negated) for matched, score, negated in partial_ranked
+        ]
+
+    def search(self, query=None, tag=None, theme=None, limit=20):
+        """
+        Ranks the datasets matching a query.
+
+        :param query: The text searched for, or None to only filter on tag and theme.
+        :param tag: Only the datasets with this tag (compared normalized).
+        :param theme: Only the datasets of this theme.
+        :param limit: The number of results.
+        :return: A list of {"Theme", "Name", "Title", "Tags", "Score"} dicts, best first.
+        """
+
+        allowed = None  # the doc ids the filters leave, None for every dataset
+        if theme is not None:
+            allowed = self.themes.get(theme, set())
+        if tag:
+            tagged = set(itertools.accumulate(self.tags.get(tag_key(tag), [])))
+            allowed = tagged if allowed is None else allowed & tagged
+
+        tokens = tokenize(query)
+        if tokens:
+            ranked = self._rank(tokens, allowed, limit)
+        else:
+            ids = range(len(self.docs)) if allowed is None else sorted(allowed)
+            ranked = [(0, 0, doc_id) for doc_id in ids[:limit]]
+
+        return [
+            {
+                "Theme": self.docs[doc_id][0],
+                "Name": self.docs[doc_id][1],
+                "Title": self.docs[doc_id][2],
+                "Tags": self.docs[doc_id][3],
+                "Score": score / 100,
+            }
+            for _, score, doc_id in ranked
+        ]
+
+
+# module-level: the index is loaded once per warm container, then only revalidated
+search_index_cache = ResponseCache(max_bytes=float("inf"))
+
+
+def load_search_index(s3_client):
+    """
+    Loads the search index of the bucket, or reuses the one loaded by a previous invocation if
+    its ETag did not change.
+
+    :return: A (SearchIndex, metadata) tuple, metadata being a {"etag", "last_modified"} dict.
+    :raises s3_client.exceptions.NoSuchKey: If no search index was uploaded.
+    """
+
+    def stat():
+        response = head_object(s3_client, SEARCH_INDEX_KEY)
+        if response is None:
+            raise s3_client.exceptions.NoSuchKey(
+                {"Error": {"Code": "NoSuchKey", "Message": SEARCH_INDEX_KEY}},
+                "HeadObject",
+            )
+        return {"etag": response["ETag"], "last_modified": response["LastModified"]}
+
+    def load(meta):
+        response = s3_client.get_object(Bucket=BUCKET_NAME, Key=SEARCH_INDEX_KEY)
+        return (SearchIndex.loads(response["Body"].read()), meta), 0
+
+    loaded, _ = search_index_cache.get_or_load(SEARCH_INDEX_KEY, stat, load)
+    return loaded
+
+
+def parse_limit(params):
+    """
+    :param params: The query string parameters of a search, with an optional "limit".
+    :return: The number of results, DEFAULT_LIMIT by default.
+    :raises QueryError: If the limit is not an integer between 1 and MAX_LIMIT.
+    """
+
+    try:
+        limit = int(params.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        raise QueryError("limit must be an integer")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise QueryError(f"limit must be between 1 and {MAX_LIMIT}")
+    return limit
+
+
+def handle_search(s3_client, params, headers):
+    """
+    Answers a request of the search endpoint, whichever handler or route received it.
+
+    :param s3_client: A boto3 S3 client.
+    :param params: The query string parameters: q=<text>, tag=<tag>, theme=<theme>, limit=<n>,
+                   at least q or tag.
+    :param headers: The request headers, names lower-cased ('http_responses.request_headers').
+    :return: A Lambda proxy integration response: 200 or 304.
+    :raises s3_client.exceptions.NoSuchKey: If no search index was uploaded.
+    :raises QueryError: If a parameter is invalid, answered with a 400.
+    """
+
+    limit = parse_limit(params)
+    if not params.get("q") and not params.get("tag"):
+        raise QueryError("q or tag is required")
+
+    # loaded once per warm container, then revalidated with a head_object
+    index, meta = load_search_index(s3_client)
+    response_headers = {
+        "Content-Type": "application/json",
+        **cache_headers(meta["etag"], meta["last_modified"]),
+    }
+    # the results only change with the index
+    if etag_matches(headers.get("if-none-match"), meta["etag"]):
+        return not_modified(response_headers)
+
+    results = index.search(
+        params.get("q"), params.get("tag"), params.get("theme"), limit
+    )
+    return ok(json.dumps(results), response_headers, headers.get("accept-encoding"))
@@ -0,0 +1,77 @@
+import os
+import sys
+
+import boto3
+import pytest
+from moto import mock_aws
+
+# the modules live at the root of the repository, next to this folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aggregation
+import catalog
+import data_get_requests
+import dataset_profile
+import mimic_data_gov_ma
+import s3_datasets
+import search_index
+from csv_index import write_index
+from data_uploader import upload_all
+
+"""
+Shared fixtures of the test suite.
+
+- stub: the local stand-in for 'data.gov.ma' ('mimic_data_gov_ma.py'), crawled from a temporary
+  working directory, without page cache or rate limit.
+- s3: a boto3 client of an S3 mocked with 'moto', holding the empty 'data-morocco' bucket. The
+  warm-container caches start empty.
+- upload_csv: a function of a theme, a dataset name and the text of a CSV, which writes it, with
+  its index and compressed copy unless 'index=False' or 'compress=False', and uploads them to
+  the mocked bucket with 'data_uploader.upload_all'.
+"""
+
+
+@pytest.fixture
+def stub(monkeypatch, tmp_path):
+    monkeypatch.setattr(mimic_data_gov_ma.StubHandler, "latency", 0)
+    server, base_url = mimic_data_gov_ma.start_stub_server()
+    monkeypatch.setattr(data_get_requests, "BASE_URL", base_url)
+    monkeypatch.setattr(data_get_requests.http_cache, "enabled", False)
+    monkeypatch.setattr(data_get_requests.client, "bucket", None)
+    monkeypatch.chdir(tmp_path)
+    yield base_url
+    server.shutdown()
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with mock_aws():
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(Bucket=s3_datasets.BUCKET_NAME)
+        s3_datasets.response_cache.clear()
+        catalog.catalog_cache.clear()
+        dataset_profile.profile_cache.clear()
+        aggregation.aggregation_cache.clear()
+        search_index.search_index_cache.clear()
+        yield s3_client
+
+
+@pytest.fixture
+def upload_csv(s3, tmp_path):
+    csv_dir = tmp_path / "csv_data"
+
+    def upload(theme, dataset, text, index=True, compress=True, **options):
+        os.makedirs(csv_dir / theme, exist_ok=True)
+        path = str(csv_dir / theme / f"{dataset}.csv")
+        with open(path, "w", encoding="utf-8", newline="") as file:
+            file.write(text)
+        if index:
+            # an offset every other row, so that pages start between recorded offsets
+            write_index(path, every=2, compress=compress)
+        state_path = str(tmp_path / "uploads.json")
+        return upload_all(str(csv_dir), None, state_path, s3_client=s3, **options)
+
+    return upload
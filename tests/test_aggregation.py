@@ -0,0 +1,217 @@
+import os
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import aggregation
+import getS3DataAggregate
+from aggregation import aggregate, downsample, lttb, minmax, parse_aggregation
+from data_processor import normalize_frame
+from data_uploader import upload_all
+from dataset_query import QueryError
+
+CSV = (
+    "Année,Région,Effectif,Date\n"
+    "2014,Rabat,10,2014-01-15\n"
+    "2014,Fès,20,2014-02-03\n"
+    "2015,Rabat,30,2014-02-20\n"
+    "2015,Fès,,2015-03-01\n"
+    "2016,Rabat,50,2015-03-09\n"
+)
+
+
+def frame(text=CSV):
+    # as the CSV is read: every value a string, empty ones None
+    header, *rows = [line.split(",") for line in text.strip().split("\n")]
+    return pd.DataFrame(rows, columns=header).replace("", None)
+
+
+def spec(**params):
+    return parse_aggregation(params)
+
+
+def test_parse_aggregation():
+    assert spec(by="Région,Année", values="Effectif") == {
+        "by": ["Région", "Année"],
+        "time": None,
+        "every": None,
+        "agg": ["sum"],
+        "values": ["Effectif"],
+        "x": None,
+        "y": None,
+        "downsample": None,
+        "points": 500,
+        "filters": [],
+    }
+    parsed = spec(x="Date", y="Effectif", downsample="minmax", points="3")
+    assert (parsed["downsample"], parsed["points"]) == ("minmax", 3)
+    parsed = spec(time="Date", every="month", agg="count", **{"filter.Région": "Rabat"})
+    assert parsed["filters"] == [("Région", "eq", "Rabat")]
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {},
+        {"values": "Effectif"},
+        {"every": "decade", "time": "Date"},
+        {"every": "month"},
+        {"by": "Région", "agg": "median"},
+        {"x": "Date", "y": "Effectif"},
+        {"x": "Date", "downsample": "lttb"},
+        {"x": "Date", "y": "Effectif", "downsample": "lttb", "by": "Région"},
+        {"x": "Date", "y": "Effectif", "downsample": "lttb", "points": "x"},
+        {"x": "Date", "y": "Effectif", "downsample": "lttb", "points": "2"},
+        {"x": "Date", "y": "Effectif", "downsample": "lttb", "points": "2001"},
+    ],
+)
+def test_parse_aggregation_errors(params):
+    with pytest.raises(QueryError):
+        parse_aggregation(params)
+
+
+def test_group_by():
+    columns, rows = aggregate(frame(), spec(by="Région", agg="sum,mean,count"))
+    # the years are no values to add up
+    assert columns == ["Région", "Effectif_sum", "Effectif_mean", "count"]
+    assert rows == [["Fès", 20.0, 20.0, 2], ["Rabat", 90.0, 30.0, 3]]
+
+
+def test_periods():
+    columns, rows = aggregate(
+        frame(), spec(time="Date", every="quarter", values="Effectif")
+    )
+    assert columns == ["Date", "Effectif_sum"]
+    assert rows == [["2014-01-01", 60.0], ["2015-01-01", 50.0]]
+
+    # years, grouped with a column
+    columns, rows = aggregate(
+        frame(), spec(by="Région", time="Année", every="year", agg="count")
+    )
+    assert columns == ["Région", "Année", "count"]
+    assert rows == [
+        ["Fès", "2014-01-01", 1],
+        ["Fès", "2015-01-01", 1],
+        ["Rabat", "2014-01-01", 1],
+        ["Rabat", "2015-01-01", 1],
+        ["Rabat", "2016-01-01", 1],
+    ]
+
+
+def test_too_many_groups(monkeypatch):
+    monkeypatch.setattr(aggregation, "MAX_GROUPS", 2)
+    assert len(aggregate(frame(), spec(by="Région"))[1]) == 2
+    with pytest.raises(QueryError, match="3 groups, at most 2"):
+        aggregate(frame(), spec(by="Année"))
+
+
+def series(count):
+    x = np.arange(count, dtype=float)
+    y = np.sin(x / 50)
+    y[count // 3] = 10  # a peak
+    y[count // 2] = -10  # a trough
+    return x, y
+
+
+@pytest.mark.parametrize("points", [3, 10, 100])
+def test_lttb(points):
+    x, y = series(1000)
+    kept = lttb(x, y, points)
+    assert len(kept) == points
+    assert (np.diff(kept) > 0).all()
+    # the endpoints, and the extremes, are kept
+    assert (kept[0], kept[-1]) == (0, 999)
+    if points > 3:
+        assert {333, 500} <= set(kept)
+    # fewer points than asked for: all of them
+    assert list(lttb(x[:points], y[:points], points)) == list(range(points))
+
+
+@pytest.mark.parametrize("points", [4, 10, 100])
+def test_minmax(points):
+    _, y = series(1000)
+    kept = minmax(y, points)
+    assert len(kept) <= points
+    assert (np.diff(kept) > 0).all()
+    assert {333, 500} <= set(kept)
+    assert list(minmax(y[:points], points)) == list(range(points))
+
+
+def test_downsample():
+    x, y = series(1000)
+    dates = pd.date_range("2000-01-01", periods=1000, freq="D")
+    df = pd.DataFrame({"date": dates.strftime("%d/%m/%Y"), "valeur": y.astype(str)})
+    df = df.iloc[::-1]  # sorted by x before downsampling
+    df.loc[df.index[0], "valeur"] = "n/a"  # dropped
+
+    parsed = spec(x="date", y="valeur", downsample="lttb", points="50")
+    columns, rows, rows_in = downsample(df, parsed)
+    assert (columns, rows_in, len(rows)) == (["date", "valeur"], 999, 50)
+    assert rows[0] == ["2000-01-01", 0.0]
+    assert rows[-1][0] == "2002-09-25"
+    assert [row[0] for row in rows] == sorted(row[0] for row in rows)
+
+    parsed = dict(parsed, downsample="minmax")
+    columns, rows, rows_in = downsample(df, parsed)
+    assert rows_in == 999 and len(rows) <= 50
+    assert ["2000-11-29", 10.0] in rows
+
+
+@pytest.fixture(params=["csv", "parquet"])
+def get(request, s3, tmp_path, upload_csv, monkeypatch):
+    monkeypatch.setattr(getS3DataAggregate, "s3_client", s3)
+    if request.param == "parquet":
+        os.makedirs(tmp_path / "parquet_data" / "t")
+        typed = normalize_frame(frame())
+        typed.to_parquet(tmp_path / "parquet_data" / "t" / "d.parquet", index=False)
+    upload_csv("t", "d", CSV)
+    upload_all(
+        str(tmp_path / "csv_data"),
+        str(tmp_path / "parquet_data"),
+        str(tmp_path / "uploads.json"),
+        s3_client=s3,
+    )
+
+    def get(**params):
+        event = {"queryStringParameters": dict(params, theme="t", dataset="d")}
+        response = getS3DataAggregate.lambda_handler(event, None)
+        return response["statusCode"], json.loads(response["body"])
+
+    get.source = request.param
+    return get
+
+
+def test_column_names_of_either_copy(get):
+    # original or cleaned names, the same response from either copy
+    for by, values in [("Région", "Effectif"), ("region", "effectif")]:
+        status, body = get(by=by, values=values, **{"filter.Année": "2014..2015"})
+        assert status == 200
+        assert body == {
+            "columns": ["region", "effectif_sum"],
+            "rows": [["Fès", 20.0], ["Rabat", 40.0]],
+            "source": get.source,
+        }
+
+    status, body = get(x="Date", y="effectif", downsample="lttb", points="3")
+    assert status == 200
+    assert body["columns"] == ["date", "effectif"]
+    assert (body["rows_in"], len(body["rows"])) == (4, 3)
+    assert body["rows"][0] == ["2014-01-15", 10.0]
+
+
+def test_errors(get):
+    for params in [
+        {"by": "province"},
+        {"x": "Date", "y": "nope", "downsample": "lttb"},
+        # the same column, under its two names
+        {"x": "Effectif", "y": "effectif", "downsample": "minmax"},
+        {"x": "Date", "y": "Date", "downsample": "lttb"},
+    ]:
+        status, body = get(**params)
+        assert status == 400, params
+    assert get(by="province")[1] == "unknown column: province"
+    assert get(x="Date", y="Date", downsample="lttb")[1] == (
+        "x and y must be different columns"
+    )
@@ -0,0 +1,78 @@
+import os
+import json
+
+import pytest
+
+import catalog
+import getS3Data
+import s3_datasets
+from csv_index import write_index
+from data_uploader import upload_all
+
+BUCKET = s3_datasets.BUCKET_NAME
+
+
+def write_dataset(csv_dir, theme, name, text, compress=True):
+    os.makedirs(os.path.join(csv_dir, theme), exist_ok=True)
+    path = os.path.join(csv_dir, theme, f"{name}.csv")
+    with open(path, "w") as file:
+        file.write(text)
+    write_index(path, compress=compress)
+    return {f"{theme}/{name}.xlsx": {"outputs": [path]}}
+
+
+def large_csv():
+    # random hex: the compressed copy is still above the multipart threshold
+    rows = (os.urandom(32).hex() for _ in range(350000))
+    return "value\n" + "\n".join(rows) + "\n"
+
+
+@pytest.mark.parametrize("compressed_only", [False, True])
+def test_catalog_etag_is_that_of_the_object_served(
+    s3, tmp_path, monkeypatch, compressed_only
+):
+    monkeypatch.setattr(getS3Data, "s3_client", s3)
+    csv_dir = str(tmp_path / "csv_data")
+    conversions = write_dataset(csv_dir, "t", "small", "a,b\n1,2\n")
+    conversions.update(write_dataset(csv_dir, "t", "large", large_csv()))
+    catalog.write_catalogs(csv_dir, conversions, {})
+    upload_all(
+        csv_dir,
+        None,
+        str(tmp_path / "uploads.json"),
+        s3_client=s3,
+        compressed_only=compressed_only,
+    )
+
+    with open(catalog.catalog_path(csv_dir, "t")) as file:
+        entries = {entry["Name"]: entry for entry in json.load(file)}
+    assert entries["large"]["ETag"].endswith('-2"')
+    for name, entry in entries.items():
+        stored = s3.head_object(Bucket=BUCKET, Key=f"csv_data/t/{name}.csv.gz")
+        assert entry["ETag"] == stored["ETag"]
+
+        # a client can compare it with the ETag of the dataset endpoint
+        event = {
+            "queryStringParameters": {"theme": "t", "dataset": name},
+            "headers": {"If-None-Match": entry["ETag"]},
+        }
+        assert getS3Data.lambda_handler(event, None)["statusCode"] == 304
+
+
+def test_listing_has_the_etag_of_the_compressed_copy(s3, tmp_path):
+    csv_dir = str(tmp_path / "csv_data")
+    write_dataset(csv_dir, "t", "d", "a,b\n1,2\n")
+    upload_all(csv_dir, None, str(tmp_path / "uploads.json"), s3_client=s3)
+
+    [dataset] = catalog.list_datasets(s3, "t")
+    stored = s3.head_object(Bucket=BUCKET, Key="csv_data/t/d.csv.gz")
+    assert (dataset["Name"], dataset["Size"]) == ("d", 8)
+    assert dataset["ETag"] == stored["ETag"]
+
+
+def test_csv_without_compressed_copy_has_no_etag(tmp_path):
+    csv_dir = str(tmp_path / "csv_data")
+    conversions = write_dataset(csv_dir, "t", "d", "a,b\n1,2\n", compress=False)
+    [entry] = catalog.build_catalogs(csv_dir, conversions, {})["t"]
+    assert "ETag" not in entry
+    assert (entry["Rows"], entry["Columns"]) == (1, 2)
@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+import itertools
+
+import pytest
+
+import data_get_ckan
+import mimic_data_gov_ma
+from manifest import Manifest
+
+
+@pytest.fixture
+def counted_stub(stub, monkeypatch):
+    # the paths requested from the stub, in order
+    paths = []
+    do_get = mimic_data_gov_ma.StubHandler.do_GET
+
+    def do_GET(handler):
+        paths.append(handler.path)
+        do_get(handler)
+
+    monkeypatch.setattr(mimic_data_gov_ma.StubHandler, "do_GET", do_GET)
+    return paths
+
+
+def crawl_in(directory, crawl):
+    os.makedirs(directory)
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        return mimic_data_gov_ma.summarize(crawl())
+    finally:
+        os.chdir(cwd)
+
+
+def test_harvest_matches_the_html_crawl(stub):
+    expected = crawl_in("html", mimic_data_gov_ma.crawl_sequential)
+    assert crawl_in("ckan", mimic_data_gov_ma.crawl_ckan) == expected
+
+
+def test_listing_takes_a_handful_of_calls(counted_stub):
+    themes = data_get_ckan.get_themes()
+    data_get_ckan.get_datasets(themes)
+
+    assert [theme.name for theme in themes] == ["Theme0", "Theme1", "Theme2"]
+    datasets = list(itertools.chain.from_iterable(t.datasets for t in themes))
+    assert (
+        len(datasets) == mimic_data_gov_ma.THEMES * mimic_data_gov_ma.DATASETS_PER_THEME
+    )
+    assert all(dataset.download_link.endswith(".csv") for dataset in datasets)
+    assert themes[0].datasets[0].tags == ["tag-theme0-ds0", "stub"]
+    assert len(counted_stub) == 2
+
+
+def test_pages_through_package_search(counted_stub, monkeypatch):
+    monkeypatch.setattr(data_get_ckan, "ROWS", 10)
+    themes = data_get_ckan.get_themes()
+    data_get_ckan.get_datasets(themes)
+
+    total = mimic_data_gov_ma.THEMES * mimic_data_gov_ma.DATASETS_PER_THEME
+    assert sum(len(theme.datasets) for theme in themes) == total
+    # group_list, then one package_search per ten datasets
+    assert len(counted_stub) == 1 + -(-total // 10)
+
+
+def test_api_errors_raise(stub):
+    with pytest.raises(RuntimeError, match="no_such_action failed with 404"):
+        data_get_ckan.api_call("no_such_action")
+
+
+def test_package_to_dataset(stub):
+    package = {
+        "name": "pib",
+        "tags": [{"name": "economie"}],
+        "resources": [
+            {"id": "r0", "name": "notes", "url": ""},
+            {
+                "id": "r1",
+                "name": "PIB",
+                "url": "https://example.org/pib.xlsx",
+                "format": "XLSX",
+                "hash": "sha256:" + "AB" * 32,
+                "created": "2023-01-01T00:00:00",
+                "last_modified": None,
+            },
+        ],
+    }
+    dataset = data_get_ckan.package_to_dataset(package)
+    assert dataset.name == "pib"
+    assert dataset.url == f"{stub}/data/fr/dataset/pib"
+    assert dataset.download_link == "https://example.org/pib.xlsx"
+    assert dataset.tags == ["economie"]
+    [resource] = dataset.resources
+    assert resource["format"] == "xlsx"
+    assert resource["sha256"] == "ab" * 32
+    assert resource["last_modified"] == "2023-01-01T00:00:00"
+
+    package["resources"] = package["resources"][:1]
+    assert data_get_ckan.package_to_dataset(package) is None
+
+
+def test_failed_downloads_stay_in_the_manifest(stub, monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["data_get_ckan.py", "--rate", "0"])
+    data_get_ckan.main()
+    total = mimic_data_gov_ma.THEMES * mimic_data_gov_ma.DATASETS_PER_THEME
+    assert len(Manifest().entries) == total
+
+    do_get = mimic_data_gov_ma.StubHandler.do_GET
+
+    def do_GET(handler):
+        if handler.path.endswith("/theme0-ds0.csv"):
+            return handler.send(404, b"not found")
+        if handler.path.endswith("/theme0-ds1.csv"):
+            # not the file the API has the hash of: the download raises
+            return handler.send(200, b"other content", "text/csv")
+        do_get(handler)
+
+    monkeypatch.setattr(mimic_data_gov_ma.StubHandler, "do_GET", do_GET)
+    data_get_ckan.main()
+
+    with open(os.path.join("data", "manifest.json")) as file:
+        saved = json.load(file)
+    assert len(saved["entries"]) == total
+    assert saved["last_run"]["removed"] == []
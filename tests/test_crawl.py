@@ -0,0 +1,130 @@
+import os
+import sys
+import json
+import time
+import asyncio
+
+import aiohttp
+
+import data_get_async
+import data_get_requests
+import mimic_data_gov_ma
+from crawler_client import AsyncCrawlerClient
+from manifest import Manifest
+
+
+def crawl_in(directory, crawl):
+    os.makedirs(directory)
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        start = time.perf_counter()
+        themes = crawl()
+        elapsed = time.perf_counter() - start
+        return elapsed, mimic_data_gov_ma.summarize(themes)
+    finally:
+        os.chdir(cwd)
+
+
+def test_async_crawl_matches_sequential_and_is_faster(stub, monkeypatch):
+    monkeypatch.setattr(mimic_data_gov_ma.StubHandler, "latency", 0.02)
+    monkeypatch.setattr(mimic_data_gov_ma, "DATASETS_PER_THEME", 12)
+
+    sequential, expected = crawl_in("sequential", mimic_data_gov_ma.crawl_sequential)
+    concurrent, result = crawl_in(
+        "asyncio", lambda: asyncio.run(data_get_async.crawl(rate=None))
+    )
+
+    datasets, files = expected
+    assert result == expected
+    assert sum(len(names) for names in datasets.values()) == 3 * 12
+    assert len(files) == 3 * 12
+    assert concurrent * 2 < sequential
+
+
+def test_async_crawl_honours_a_single_connection_limit(stub):
+    themes = asyncio.run(
+        data_get_async.crawl(max_concurrency=1, max_per_host=1, rate=None)
+    )
+    _, files = mimic_data_gov_ma.summarize(themes)
+    assert len(files) == mimic_data_gov_ma.THEMES * mimic_data_gov_ma.DATASETS_PER_THEME
+
+
+def test_manifest_skips_unchanged_downloads(stub, monkeypatch):
+    def harvest():
+        manifest = Manifest()
+        asyncio.run(data_get_async.crawl(manifest=manifest, rate=None))
+        return manifest.save()
+
+    total = mimic_data_gov_ma.THEMES * mimic_data_gov_ma.DATASETS_PER_THEME
+    assert len(harvest()["added"]) == total
+
+    report = harvest()
+    assert len(report["unchanged"]) == total
+    assert not report["added"] and not report["changed"] and not report["removed"]
+
+    monkeypatch.setattr(mimic_data_gov_ma, "PAYLOAD", b"col_a,col_b\n3,4\n")
+    assert len(harvest()["changed"]) == total
+    with open(os.path.join("data", "Theme0", "theme0-ds0.csv"), "rb") as file:
+        assert file.read() == b"col_a,col_b\n3,4\n"
+
+
+def test_sequential_download_is_conditional(stub):
+    dataset = data_get_requests.Dataset(
+        "theme0-ds0",
+        f"{stub}/data/fr/dataset/theme0-ds0",
+        f"{stub}/download/theme0-ds0.csv",
+    )
+    manifest = Manifest()
+    assert data_get_requests.local_download(dataset, "Theme0", manifest) == "added"
+    assert data_get_requests.local_download(dataset, "Theme0", manifest) == "unchanged"
+    entry = manifest.entries["Theme0/theme0-ds0.csv"]
+    assert entry["size"] == len(mimic_data_gov_ma.PAYLOAD)
+    assert entry["etag"]
+
+
+def test_async_download_of_an_error_writes_nothing(stub):
+    async def download(link):
+        async with aiohttp.ClientSession() as session:
+            client = AsyncCrawlerClient(session, rate=None, retries=0)
+            dataset = data_get_requests.Dataset("x", f"{stub}/dataset/x", link)
+            return await data_get_async.local_download(
+                client, dataset, "Theme0", manifest=manifest
+            )
+
+    manifest = Manifest()
+    assert asyncio.run(download(f"{stub}/nope/x.csv")) is None
+    assert not os.path.exists(os.path.join("data", "Theme0", "x.csv"))
+    assert not os.path.exists(os.path.join("data", "Theme0", "x.csv.part"))
+    assert manifest.entries == {}
+
+    # the file of an earlier run stays as it was
+    assert asyncio.run(download(f"{stub}/download/x.csv")) == "added"
+    assert asyncio.run(download(f"{stub}/nope/x.csv")) is None
+    with open(os.path.join("data", "Theme0", "x.csv"), "rb") as file:
+        assert file.read() == mimic_data_gov_ma.PAYLOAD
+
+
+def test_failed_datasets_stay_in_the_manifest(stub, monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["data_get_async.py", "--rate", "0", "--no-cache"])
+    data_get_async.main()
+    total = mimic_data_gov_ma.THEMES * mimic_data_gov_ma.DATASETS_PER_THEME
+    assert len(Manifest().entries) == total
+
+    do_get = mimic_data_gov_ma.StubHandler.do_GET
+
+    def do_GET(handler):
+        # the download of one dataset fails, the page of another one
+        if handler.path.endswith(("/theme0-ds0.csv", "/theme0-ds1")):
+            return handler.send(404, b"not found")
+        do_get(handler)
+
+    monkeypatch.setattr(mimic_data_gov_ma.StubHandler, "do_GET", do_GET)
+    data_get_async.main()
+
+    with open(os.path.join("data", "manifest.json")) as file:
+        saved = json.load(file)
+    assert len(saved["entries"]) == total
+    assert saved["last_run"]["removed"] == []
+    with open(os.path.join("data", "Theme0", "theme0-ds0.csv"), "rb") as file:
+        assert file.read() == mimic_data_gov_ma.PAYLOAD
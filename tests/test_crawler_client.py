@@ -0,0 +1,84 @@
+import asyncio
+import argparse
+import itertools
+
+import aiohttp
+import pytest
+
+import data_get_async
+import mimic_data_gov_ma
+from crawler_client import (
+    AsyncCrawlerClient,
+    CrawlerClient,
+    TokenBucket,
+    parse_rate,
+)
+
+
+@pytest.fixture
+def flaky_stub(stub, monkeypatch):
+    # every other request answers 503
+    requests = itertools.count()
+    do_get = mimic_data_gov_ma.StubHandler.do_GET
+
+    def do_GET(handler):
+        if next(requests) % 2 == 0:
+            return handler.send(503, b"busy", headers={"Retry-After": "0"})
+        do_get(handler)
+
+    monkeypatch.setattr(mimic_data_gov_ma.StubHandler, "do_GET", do_GET)
+    return stub
+
+
+def test_rate_zero_turns_the_limit_off():
+    assert parse_rate("0") == 0
+    assert parse_rate("2.5") == 2.5
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_rate("-1")
+    with pytest.raises(ValueError):
+        TokenBucket(0)
+
+    client = CrawlerClient()
+    client.set_rate(0)
+    assert client.bucket is None
+    client.set_rate(3)
+    assert client.bucket.rate == 3
+    assert AsyncCrawlerClient(None, rate=0).bucket is None
+
+
+def test_token_bucket_reserve():
+    bucket = TokenBucket(rate=10, burst=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    # the third token is one tenth of a second away, the fourth two
+    assert 0.09 < bucket.reserve() <= 0.1
+    assert 0.19 < bucket.reserve() <= 0.2
+
+
+def test_sync_client_retries(flaky_stub):
+    client = CrawlerClient(rate=None, backoff=0)
+    response = client.get(f"{flaky_stub}/data/fr/group")
+    assert response.status_code == 200
+    stats = client.stats()
+    assert (stats["requests"], stats["retries"], stats["failures"]) == (2, 1, 0)
+
+
+def test_async_client_retries(flaky_stub):
+    async def get():
+        async with aiohttp.ClientSession() as session:
+            client = AsyncCrawlerClient(session, rate=None, backoff=0)
+            async with await client.get(f"{flaky_stub}/data/fr/group") as response:
+                return response.status, client.stats()
+
+    status, stats = asyncio.run(get())
+    assert status == 200
+    assert (stats["requests"], stats["retries"], stats["failures"]) == (2, 1, 0)
+
+
+def test_async_crawl_survives_transient_errors(flaky_stub, monkeypatch):
+    monkeypatch.setattr(mimic_data_gov_ma, "THEMES", 1)
+    monkeypatch.setattr(mimic_data_gov_ma, "DATASETS_PER_THEME", 4)
+    # without retries, half of the pages and downloads would be lost
+    themes = asyncio.run(data_get_async.crawl(rate=100))
+    _, files = mimic_data_gov_ma.summarize(themes)
+    assert len(files) == 4
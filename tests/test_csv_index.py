@@ -0,0 +1,110 @@
+import io
+import csv
+import gzip
+import json
+
+import pytest
+
+import getS3Data
+import s3_datasets
+from csv_compression import gzip_path
+from csv_index import build_index, locate, write_index
+
+CSV = 'id,note\n1,a\n\n2,"b\nc"\n3,"d ""e"""\r\n4,f\n5,g\n'
+ROWS = [["1", "a"], ["2", "b\nc"], ["3", 'd "e"'], ["4", "f"], ["5", "g"]]
+
+
+@pytest.fixture
+def gets(s3):
+    # the keys and ranges of the 'get_object' calls of the client
+    calls = []
+    s3.meta.events.register(
+        "before-parameter-build.s3.GetObject",
+        lambda params, **_: calls.append((params["Key"], params.get("Range"))),
+    )
+    return calls
+
+
+def write_csv(path, text=CSV):
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        file.write(text)
+    return str(path)
+
+
+def test_offsets_are_row_starts(tmp_path):
+    path = write_csv(tmp_path / "d.csv")
+    index = build_index(path, every=2)
+    assert index["columns"] == ["id", "note"]
+    assert (index["rows"], index["size"]) == (5, len(CSV.encode()))
+    assert len(index["offsets"]) == 3
+
+    with open(path, "rb") as file:
+        data = file.read()
+    for number, offset in enumerate(index["offsets"]):
+        # a row read from a recorded offset is the row the offset stands for
+        text = io.StringIO(data[offset:].decode("utf-8"), newline="")
+        assert next(csv.reader(text)) == ROWS[number * 2]
+
+
+def test_locate(tmp_path):
+    index = build_index(write_csv(tmp_path / "d.csv"), every=2)
+    offsets = index["offsets"]
+    assert locate(index, 0, 2) == (offsets[0], offsets[1] - 1, 0)
+    assert locate(index, 3, 1) == (offsets[1], offsets[2] - 1, 1)
+    assert locate(index, 3, 10) == (offsets[1], index["size"] - 1, 1)
+    assert locate(index, 5, 1) is None
+
+
+def test_compressed_copy_decompresses_to_the_csv(tmp_path):
+    path = write_csv(tmp_path / "d.csv")
+    write_index(path, every=2, compress=True)
+    with gzip.open(gzip_path(path), "rb") as file:
+        assert file.read() == CSV.encode()
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_deep_page_is_one_ranged_get(upload_csv, s3, gets, compress):
+    upload_csv("t", "d", CSV, compress=compress)
+    page = s3_datasets.read_csv_page(s3, "t", "d", 3, 2)
+    assert page["rows"] == ROWS[3:5]
+    assert page["next_cursor"] is None
+
+    key = "csv_data/t/d.csv"
+    [(index_key, _), (data_key, byte_range)] = gets
+    assert index_key == "csv_data/t/d.idx.json"
+    assert data_key == (gzip_path(key) if compress else key)
+    assert byte_range.startswith("bytes=")
+
+
+def test_page_past_the_end_reads_only_the_index(upload_csv, s3, gets):
+    upload_csv("t", "d", CSV)
+    page = s3_datasets.read_csv_page(s3, "t", "d", 10, 2)
+    assert (page["rows"], page["next_cursor"]) == ([], None)
+    assert [key for key, _ in gets] == ["csv_data/t/d.idx.json"]
+
+
+def test_stale_index_is_ignored(upload_csv, s3):
+    upload_csv("t", "d", CSV, compress=False)
+    # the CSV was replaced, its index was not
+    s3.delete_object(Bucket=s3_datasets.BUCKET_NAME, Key="csv_data/t/d.csv.gz")
+    s3.put_object(
+        Bucket=s3_datasets.BUCKET_NAME,
+        Key="csv_data/t/d.csv",
+        Body=b"id,note\n9,z\n8,y\n7,x\n6,w\n",
+    )
+    page = s3_datasets.read_csv_page(s3, "t", "d", 1, 2)
+    assert page["rows"] == [["8", "y"], ["7", "x"]]
+
+
+def test_handler_pages_from_the_index(upload_csv, s3, gets, monkeypatch):
+    monkeypatch.setattr(getS3Data, "s3_client", s3)
+    upload_csv("t", "d", CSV)
+    params = {"theme": "t", "dataset": "d", "offset": "1", "limit": "2"}
+    response = getS3Data.lambda_handler({"queryStringParameters": params}, None)
+
+    assert response["statusCode"] == 200
+    page = json.loads(response["body"])
+    assert page["rows"] == ROWS[1:3]
+    assert s3_datasets.decode_cursor(page["next_cursor"]) == 3
+    # neither the CSV nor its compressed copy were read whole
+    assert all(byte_range for key, byte_range in gets if key.endswith(".gz"))
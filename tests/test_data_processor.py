@@ -0,0 +1,165 @@
+import os
+import json
+
+import pandas as pd
+import pytest
+
+import data_processor
+from data_processor import convert_file, normalize_frame, process_all
+
+
+def write_workbook(path, sheets):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with pd.ExcelWriter(path) as writer:
+        for name, rows in sheets.items():
+            pd.DataFrame(rows).to_excel(writer, sheet_name=name, index=False)
+
+
+@pytest.fixture
+def data(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_workbook(
+        "data/t/d.xlsx",
+        {
+            "main": {"annee": [2014, 2015], "region": ["Rabat", "Fès"]},
+            "detail": {"code": ["01", "02"]},
+        },
+    )
+    return tmp_path
+
+
+def run(**options):
+    return process_all("data", "csv_data", "parquet_data", workers=1, **options)
+
+
+def test_process_all(data, capsys):
+    [result] = run().values()
+    assert (result["status"], result["rows"]) == ("converted", [2, 2])
+    assert os.path.exists("csv_data/t/d.csv")
+    assert os.path.exists("csv_data/t/d__detail.csv.gz")
+    assert os.path.exists("parquet_data/t/d__detail.parquet")
+    assert os.path.exists("csv_data/_catalog.json")
+    assert pd.read_csv("csv_data/t/d.csv").to_dict("list") == {
+        "annee": [2014, 2015],
+        "region": ["Rabat", "Fès"],
+    }
+
+    # the record of the conversions is not in the scanned data directory
+    assert not os.path.exists("data/conversions.json")
+    with open("conversions.json") as file:
+        conversions = json.load(file)
+    assert conversions["t/d.xlsx"]["outputs"] == result["outputs"]
+
+    capsys.readouterr()
+    [result] = run().values()
+    assert result["status"] == "up to date"
+    assert "Skipping non-directory" not in capsys.readouterr().out
+
+
+def test_record_in_the_data_directory_is_moved(data):
+    run()
+    os.replace("conversions.json", "data/conversions.json")
+    os.utime("data/t/d.xlsx")
+    [result] = run().values()
+    # the recorded hash was found: the source is not converted again
+    assert result["status"] == "unchanged"
+    assert os.path.exists("conversions.json")
+    assert not os.path.exists("data/conversions.json")
+
+
+def test_convert_file_skips(tmp_path):
+    source = str(tmp_path / "d.xlsx")
+    csv_path = str(tmp_path / "d.csv")
+    write_workbook(source, {"main": {"a": [1, 2]}})
+
+    first = convert_file(source, csv_path)
+    assert first["status"] == "converted"
+    assert first["engine"] == data_processor.pick_engine()
+    assert convert_file(source, csv_path)["status"] == "up to date"
+
+    # a new download of the same content: its hash is checked, the outputs are touched
+    for path in first["outputs"]:
+        os.utime(path, (0, 0))
+    result = convert_file(source, csv_path, previous_sha256=first["sha256"])
+    assert (result["status"], result["outputs"]) == ("unchanged", None)
+    assert convert_file(source, csv_path)["status"] == "up to date"
+
+    # a new content, and a missing output, are converted
+    for path in first["outputs"]:
+        os.utime(path, (0, 0))
+    write_workbook(source, {"main": {"a": [1, 2, 3]}})
+    result = convert_file(source, csv_path, previous_sha256=first["sha256"])
+    assert (result["status"], result["rows"]) == ("converted", [3])
+    os.remove(result["outputs"][1])
+    assert convert_file(source, csv_path)["status"] == "converted"
+    assert convert_file(source, csv_path, force=True)["status"] == "converted"
+
+
+def test_lost_sheets_are_removed(data):
+    run()
+    write_workbook("data/t/d.xlsx", {"main": {"annee": [2016]}})
+    [result] = run(force=True).values()
+    assert result["rows"] == [1]
+    assert not os.path.exists("csv_data/t/d__detail.csv")
+    assert not os.path.exists("parquet_data/t/d__detail.parquet")
+
+
+def test_run_without_parquet_keeps_the_parquet_files(data):
+    run()
+    results = process_all("data", "csv_data", None, workers=1, force=True)
+    assert results["t/d.xlsx"]["status"] == "converted"
+    assert os.path.exists("parquet_data/t/d.parquet")
+    assert os.path.exists("parquet_data/t/d__detail.parquet")
+
+    # they are still known, and removed with their sheet
+    write_workbook("data/t/d.xlsx", {"main": {"annee": [2016]}})
+    run(force=True)
+    assert os.path.exists("parquet_data/t/d.parquet")
+    assert not os.path.exists("parquet_data/t/d__detail.parquet")
+
+
+def test_normalize_frame():
+    df = pd.DataFrame(
+        {
+            "Année": ["2014", "2015", None],
+            "Taux (%)": ["1,5", "2", "-"],
+            "Population": ["1 200 000", "950 000", "n/a"],
+            "Date": ["01/02/2020", "15/03/2021", None],
+            "Région": ["Rabat", "Fès", "Rabat"],
+            "Code": ["01234", "20000", "30100"],
+            "Unnamed: 6": [1.0, 2.0, 3.0],
+        },
+        dtype=object,
+    )
+    typed = normalize_frame(df)
+    assert list(typed.columns) == [
+        "annee",
+        "taux",
+        "population",
+        "date",
+        "region",
+        "code",
+        "column_7",
+    ]
+    assert str(typed["annee"].dtype) == "Int64"
+    assert typed["annee"].tolist()[:2] == [2014, 2015]
+    assert typed["annee"].isna().tolist() == [False, False, True]
+    assert typed["taux"].tolist()[:2] == [1.5, 2.0]
+    assert typed["population"].tolist()[:2] == [1200000, 950000]
+    assert [str(date) for date in typed["date"].tolist()[:2]] == [
+        "2020-02-01",
+        "2021-03-15",
+    ]
+    assert pd.api.types.is_string_dtype(typed["region"])
+    # identifiers with leading zeros are not numbers
+    assert pd.api.types.is_string_dtype(typed["code"])
+    assert typed["code"].tolist() == ["01234", "20000", "30100"]
+    assert str(typed["column_7"].dtype) == "Int64"
+    # the sheet itself is left as it was read
+    assert df["Code"].tolist() == ["01234", "20000", "30100"]
+
+
+@pytest.mark.parametrize("values", [["0", "10"], ["0,5", "1"], ["-0.25", "3"]])
+def test_zero_is_not_a_leading_zero(values):
+    typed = normalize_frame(pd.DataFrame({"a": values}, dtype=object))
+    assert pd.api.types.is_numeric_dtype(typed["a"])
@@ -0,0 +1,104 @@
+import os
+import gzip
+
+import pytest
+
+import s3_datasets
+from csv_index import write_index
+from data_uploader import MULTIPART_THRESHOLD, s3_etag, upload_all
+
+BUCKET = s3_datasets.BUCKET_NAME
+
+
+@pytest.fixture
+def data(tmp_path):
+    # two themes holding a dataset of the same name, and a Parquet copy
+    for theme, text in [("a", "x,y\n1,2\n"), ("b", "x,y\n3,4\n")]:
+        os.makedirs(tmp_path / "csv_data" / theme)
+        (tmp_path / "csv_data" / theme / "d.csv").write_text(text)
+    os.makedirs(tmp_path / "parquet_data" / "a")
+    (tmp_path / "parquet_data" / "a" / "d.parquet").write_bytes(b"PAR1...PAR1")
+    return tmp_path
+
+
+def upload(s3, directory, **options):
+    return upload_all(
+        str(directory / "csv_data"),
+        str(directory / "parquet_data"),
+        str(directory / "uploads.json"),
+        s3_client=s3,
+        **options,
+    )
+
+
+def keys(s3):
+    response = s3.list_objects_v2(Bucket=BUCKET)
+    return sorted(obj["Key"] for obj in response.get("Contents", []))
+
+
+def test_uploads_only_what_changed(s3, data):
+    report = upload(s3, data)
+    assert (
+        report["uploaded"]
+        == keys(s3)
+        == [
+            "csv_data/a/d.csv",
+            "csv_data/a/d.csv.gz",
+            "csv_data/b/d.csv",
+            "csv_data/b/d.csv.gz",
+            "parquet_data/a/d.parquet",
+        ]
+    )
+
+    report = upload(s3, data)
+    assert (report["uploaded"], report["bytes"]) == ([], 0)
+    assert len(report["skipped"]) == 5
+
+    # without the remembered ETags, the files are hashed again, with the same result
+    os.remove(data / "uploads.json")
+    assert upload(s3, data)["uploaded"] == []
+
+    (data / "csv_data" / "b" / "d.csv").write_text("x,y\n3,5\n")
+    assert upload(s3, data)["uploaded"] == ["csv_data/b/d.csv", "csv_data/b/d.csv.gz"]
+
+
+@pytest.mark.parametrize("blocks", [False, True])
+def test_compressed_copy(s3, data, blocks):
+    path = str(data / "csv_data" / "a" / "d.csv")
+    if blocks:
+        # the block compressed copy written by 'data_processor.py'
+        write_index(path, every=1, compress=True)
+    upload(s3, data)
+
+    response = s3.get_object(Bucket=BUCKET, Key="csv_data/a/d.csv.gz")
+    assert response["ContentEncoding"] == "gzip"
+    assert response["ContentType"] == "text/csv; charset=utf-8"
+    assert response["Metadata"] == {"source-etag": s3_etag(path), "source-size": "8"}
+    assert gzip.decompress(response["Body"].read()) == b"x,y\n1,2\n"
+    assert s3_datasets.read_csv_rows(s3, "a", "d") == [["x", "y"], ["1", "2"]]
+
+
+def test_compressed_only(s3, data):
+    upload(s3, data, compressed_only=True)
+    assert [key for key in keys(s3) if key.startswith("csv_data/")] == [
+        "csv_data/a/d.csv.gz",
+        "csv_data/b/d.csv.gz",
+    ]
+    # the handlers read the compressed copy and know the size of the CSV
+    assert s3_datasets.read_csv_rows(s3, "b", "d") == [["x", "y"], ["3", "4"]]
+    assert s3_datasets.stat_dataset(s3, "b", "d")["size"] == 8
+
+    assert upload(s3, data, compressed_only=True)["uploaded"] == []
+
+
+def test_multipart_etag(s3, data):
+    path = data / "csv_data" / "a" / "d.csv"
+    with open(path, "wb") as file:
+        for n in range(MULTIPART_THRESHOLD // 16 + 1):
+            file.write(b"%015d\n" % n)
+    upload(s3, data)
+
+    etag = s3.head_object(Bucket=BUCKET, Key="csv_data/a/d.csv")["ETag"]
+    assert etag == s3_etag(str(path))
+    assert etag.endswith('-2"')
+    assert upload(s3, data)["uploaded"] == []
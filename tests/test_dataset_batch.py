@@ -0,0 +1,118 @@
+import json
+
+import pytest
+
+import dataset_batch
+import getS3Data
+import getS3DataBatch
+import s3_datasets
+
+CSV = "annee,region\n2014,Rabat\n2015,Fès\n2016,Rabat\n"
+OTHER = "code,valeur\n1,10\n2,20\n"
+
+
+@pytest.fixture
+def batch(s3, upload_csv, monkeypatch):
+    for module in [getS3Data, getS3DataBatch]:
+        monkeypatch.setattr(module, "s3_client", s3)
+    upload_csv("t", "d", CSV)
+    upload_csv("t", "e", OTHER)
+
+    def call(headers=None, **params):
+        event = {"queryStringParameters": params, "headers": headers}
+        return getS3DataBatch.lambda_handler(event, None)
+
+    return call
+
+
+def dataset(**params):
+    event = {"queryStringParameters": dict(params, theme="t")}
+    return json.loads(getS3Data.lambda_handler(event, None)["body"])
+
+
+def test_status_of_each_dataset(batch):
+    response = batch(datasets="t/d,t/nope,../x,t/,t/d.csv,t/e")
+    assert response["statusCode"] == 200
+    body = json.loads(response["body"])
+    # in the request order, without duplicates
+    assert list(body) == ["t/d", "t/nope", "../x", "t/", "t/e"]
+    assert body["t/d"] == {"status": 200, "data": dataset(dataset="d")}
+    assert body["t/e"] == {"status": 200, "data": dataset(dataset="e")}
+    assert body["t/nope"] == {"status": 404, "error": "File not found"}
+    assert body["../x"] == {"status": 400, "error": "invalid dataset name: ../x"}
+    assert body["t/"]["status"] == 400
+
+
+def test_theme_and_options(batch):
+    # every dataset of the theme, with the options of the dataset endpoint
+    body = json.loads(batch(theme="t", limit="1")["body"])
+    assert list(body) == ["t/d", "t/e"]
+    assert body["t/d"]["data"] == dataset(dataset="d", limit="1")
+    assert len(body["t/d"]["data"]["rows"]) == 1
+
+    body = json.loads(batch(theme="t", datasets="d", columns="region")["body"])
+    assert body == {
+        "t/d": {"status": 200, "data": dataset(dataset="d", columns="region")}
+    }
+    # a filter on a column only one of them has
+    body = json.loads(batch(datasets="t/d,t/e", **{"filter.region": "Rabat"})["body"])
+    assert body["t/d"]["data"] == [
+        ["annee", "region"],
+        ["2014", "Rabat"],
+        ["2016", "Rabat"],
+    ]
+    assert body["t/e"]["status"] == 400
+
+
+def test_invalid_requests(batch, monkeypatch):
+    for params in [
+        {},
+        {"datasets": "d"},
+        {"datasets": "t/d", "format": "csv"},
+        {"datasets": "t/d", "limit": "x"},
+    ]:
+        response = batch(**params)
+        assert response["statusCode"] == 400, params
+
+    assert batch(datasets="t/d", format="json")["statusCode"] == 200
+    monkeypatch.setattr(dataset_batch, "MAX_BATCH_DATASETS", 1)
+    response = batch(datasets="t/d,t/e")
+    assert response["statusCode"] == 400
+    assert json.loads(response["body"]) == "at most 1 datasets per request, got 2"
+
+
+def test_size_budget(batch, monkeypatch):
+    first = json.dumps(dataset(dataset="d"), separators=(", ", ": "))
+    monkeypatch.setattr(dataset_batch, "BATCH_MAX_BYTES", len(first) + 10)
+    body = json.loads(batch(datasets="t/d,t/e,t/nope")["body"])
+    assert body["t/d"]["status"] == 200
+    assert body["t/e"] == {
+        "status": 413,
+        "error": "Response too large, ask for pages or for fewer datasets",
+    }
+    # the errors do not count
+    assert body["t/nope"]["status"] == 404
+
+
+def test_offloaded_dataset(batch, monkeypatch):
+    monkeypatch.setattr(s3_datasets, "INLINE_MAX_BYTES", 10)
+    body = json.loads(batch(datasets="t/d")["body"])
+    assert body["t/d"]["status"] == 303
+    assert "/csv_data/t/d.csv.gz?" in body["t/d"]["data"]["url"]
+
+
+def test_not_modified(batch, upload_csv):
+    etag = batch(datasets="t/d,t/e")["headers"]["ETag"]
+    assert batch(datasets="t/d,t/e", limit="1")["headers"]["ETag"] != etag
+    assert batch(datasets="t/e,t/d")["headers"]["ETag"] != etag
+
+    response = batch({"If-None-Match": etag}, datasets="t/d,t/e")
+    assert response["statusCode"] == 304
+    assert response["headers"]["ETag"] == etag
+
+    # a dataset of the batch changed
+    upload_csv("t", "e", OTHER + "3,30\n")
+    s3_datasets.response_cache.clear()
+    response = batch({"If-None-Match": etag}, datasets="t/d,t/e")
+    assert response["statusCode"] == 200
+    assert response["headers"]["ETag"] != etag
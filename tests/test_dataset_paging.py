@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+import getS3Data
+
+# blank lines, CRLF and LF line ends, and a value spanning two lines
+CSV = (
+    "id,name\r\n"
+    "1,a\r\n"
+    "\r\n"
+    '2,"two\nlines"\r\n'
+    "3,c\n"
+    "\n"
+    "\n"
+    "4,d\n"
+    "5,e\n"
+    "6,f\n"
+    "\n"
+)
+
+
+def get(params):
+    event = {"queryStringParameters": {"theme": "t", "dataset": "d", **params}}
+    response = getS3Data.lambda_handler(event, None)
+    assert response["statusCode"] == 200, response["body"]
+    return json.loads(response["body"])
+
+
+@pytest.fixture(
+    params=[
+        {"index": False, "compress": False},
+        {"index": True, "compress": False},
+        {"index": True, "compress": True},
+        # the index has no gzip members, only the gzip stream of the uploader is stored
+        {"index": True, "compress": False, "compressed_only": True},
+    ],
+    ids=["streamed", "indexed", "indexed-gzip", "indexed-gzip-only"],
+)
+def dataset(request, s3, upload_csv, monkeypatch):
+    monkeypatch.setattr(getS3Data, "s3_client", s3)
+    upload_csv("t", "d", CSV, **request.param)
+
+
+def test_whole_response_has_no_blank_rows(dataset):
+    assert get({}) == [
+        ["id", "name"],
+        ["1", "a"],
+        ["2", "two\nlines"],
+        ["3", "c"],
+        ["4", "d"],
+        ["5", "e"],
+        ["6", "f"],
+    ]
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 4, 10])
+def test_pages_are_slices_of_the_whole_response(dataset, limit):
+    header, *rows = get({})
+    for offset in range(len(rows) + 2):
+        page = get({"offset": str(offset), "limit": str(limit)})
+        assert page["columns"] == header
+        assert page["rows"] == rows[offset : offset + limit]
+        assert (page["next_cursor"] is not None) == (offset + limit < len(rows))
+
+
+def test_cursors_walk_the_whole_response(dataset):
+    header, *rows = get({})
+    walked = []
+    params = {"limit": "2"}
+    while True:
+        page = get(params)
+        walked += page["rows"]
+        if page["next_cursor"] is None:
+            break
+        params = {"cursor": page["next_cursor"], "limit": "2"}
+    assert walked == rows
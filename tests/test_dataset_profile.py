@@ -0,0 +1,144 @@
+import json
+import datetime
+
+import pandas as pd
+import pytest
+
+import getS3DataStats
+import router
+from data_processor import normalize_frame
+from dataset_profile import build_profile, write_profile
+
+SHEET = pd.DataFrame(
+    {
+        "Année": ["2014", "2015", "2016", None],
+        "Taux": ["1,5", "2", None, "2"],
+        "Date": ["01/02/2020", "15/03/2021", "01/02/2020", None],
+        "Région": ["Rabat", "Fès", "Rabat", "Rabat"],
+        "Code": ["01234", "20000", None, None],
+    },
+    dtype=object,
+)
+
+
+def test_build_profile():
+    profile = build_profile(SHEET, normalize_frame(SHEET))
+    assert (profile["version"], profile["rows"]) == (1, 4)
+    annee, taux, date, region, code = profile["columns"]
+    assert annee == {
+        "name": "Année",
+        "typed_name": "annee",
+        "type": "integer",
+        "nulls": 1,
+        "distinct": 3,
+        "min": 2014,
+        "max": 2016,
+        "mean": 2015.0,
+    }
+    assert taux == {
+        "name": "Taux",
+        "typed_name": "taux",
+        "type": "number",
+        "nulls": 1,
+        "distinct": 2,
+        "min": 1.5,
+        "max": 2.0,
+        "mean": pytest.approx(5.5 / 3),
+    }
+    assert date == {
+        "name": "Date",
+        "typed_name": "date",
+        "type": "date",
+        "nulls": 1,
+        "distinct": 2,
+        "min": "2020-02-01",
+        "max": "2021-03-15",
+    }
+    assert region == {
+        "name": "Région",
+        "typed_name": "region",
+        "type": "string",
+        "nulls": 0,
+        "distinct": 2,
+        "top": [["Rabat", 3], ["Fès", 1]],
+    }
+    assert (code["type"], code["nulls"], code["top"]) == (
+        "string",
+        2,
+        [["01234", 1], ["20000", 1]],
+    )
+    # the profile is written as JSON
+    json.dumps(profile)
+
+
+def test_datetimes_and_long_values():
+    sheet = pd.DataFrame(
+        {
+            "quand": [datetime.datetime(2020, 1, 1, 8, 30), None],
+            "texte": ["x" * 500, None],
+        }
+    )
+    quand, texte = build_profile(sheet, normalize_frame(sheet))["columns"]
+    assert (quand["type"], quand["min"]) == ("datetime", "2020-01-01T08:30:00")
+    assert texte["top"] == [["x" * 100, 1]]
+
+
+@pytest.fixture
+def stats(s3, upload_csv, tmp_path, monkeypatch):
+    for module in [getS3DataStats, router]:
+        monkeypatch.setattr(module, "s3_client", s3)
+    csv_dir = tmp_path / "csv_data"
+    (csv_dir / "t").mkdir(parents=True)
+    write_profile(str(csv_dir / "t" / "d.csv"), SHEET, normalize_frame(SHEET))
+    upload_csv("t", "d", SHEET.to_csv(index=False))
+
+    def call(headers=None, dataset="d"):
+        # the legacy function and the route of the router
+        query = {"theme": "t", "dataset": dataset}
+        events = [
+            (getS3DataStats, {"queryStringParameters": query}),
+            (router, {"path": f"/stats/t/{dataset}"}),
+            (router, {"path": "/stats", "queryStringParameters": query}),
+        ]
+        responses = []
+        for module, event in events:
+            event["headers"] = headers
+            responses.append(module.lambda_handler(event, None))
+        return responses
+
+    return call
+
+
+def test_stats(stats):
+    responses = stats()
+    for response in responses:
+        assert response["statusCode"] == 200
+        profile = json.loads(response["body"])
+        assert [column["typed_name"] for column in profile["columns"]] == [
+            "annee",
+            "taux",
+            "date",
+            "region",
+            "code",
+        ]
+    # the profile is loaded once, then served from memory
+    assert [response["headers"]["X-Cache"] for response in responses] == [
+        "Miss",
+        "Hit",
+        "Hit",
+    ]
+
+
+def test_stats_not_modified(stats):
+    [etag] = {response["headers"]["ETag"] for response in stats()}
+    for response in stats({"If-None-Match": etag}):
+        assert response["statusCode"] == 304
+        assert response["headers"]["ETag"] == etag
+    for response in stats({"If-None-Match": '"other"'}):
+        assert response["statusCode"] == 200
+
+
+def test_stats_not_found(stats):
+    for response in stats(dataset="nope"):
+        assert response["statusCode"] == 404
+        assert json.loads(response["body"]) == "Profile not found"
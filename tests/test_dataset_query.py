@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+import getS3Data
+from dataset_query import QueryError, parse_query, select_rows
+
+CSV = (
+    "annee,region,valeur\n"
+    "2014,Rabat,1\n"
+    "2015,Fès,2\n"
+    "2016,Rabat,3\n"
+    "2017,Souss,4\n"
+    "2020,Rabat,10\n"
+)
+
+
+def test_parse_query():
+    assert parse_query(None) is None
+    assert parse_query({"theme": "t", "offset": "10"}) is None
+    assert parse_query(
+        {
+            "columns": "annee, region",
+            "filter.region": "Rabat",
+            "filter.annee": "2015..",
+            "filter.valeur": "1,3",
+        }
+    ) == {
+        "columns": ["annee", "region"],
+        "filters": [
+            ("region", "eq", "Rabat"),
+            ("annee", "range", ("2015", None)),
+            ("valeur", "in", ["1", "3"]),
+        ],
+    }
+
+
+def test_parameters_that_are_not_filters_are_ignored():
+    # cache busters and tracking parameters added by browsers, proxies and links
+    assert parse_query({"_": "1712345678", "utm_source": "x", "fbclid": "y"}) is None
+
+
+def test_numbers_compare_as_numbers():
+    header, *rows = [line.split(",") for line in CSV.splitlines()]
+    query = parse_query({"filter.valeur": "..3", "columns": "valeur"})
+    columns, selected = select_rows(header, iter(rows), query)
+    # "10" is not below "3", as it would be as text
+    assert (columns, list(selected)) == (["valeur"], [["1"], ["2"], ["3"]])
+
+    with pytest.raises(QueryError, match="unknown column: province"):
+        select_rows(header, iter(rows), parse_query({"filter.province": "x"}))
+
+
+@pytest.fixture
+def get(s3, upload_csv, monkeypatch):
+    monkeypatch.setattr(getS3Data, "s3_client", s3)
+    upload_csv("t", "d", CSV)
+
+    def get(params):
+        event = {"queryStringParameters": {"theme": "t", "dataset": "d", **params}}
+        response = getS3Data.lambda_handler(event, None)
+        return response["statusCode"], json.loads(response["body"])
+
+    return get
+
+
+def test_filtered_response(get):
+    params = {"filter.region": "Rabat", "filter.annee": "2015..2020"}
+    assert get(dict(params, columns="annee,valeur")) == (
+        200,
+        [["annee", "valeur"], ["2016", "3"], ["2020", "10"]],
+    )
+
+    status, page = get(dict(params, limit="1"))
+    assert (status, page["rows"]) == (200, [["2016", "Rabat", "3"]])
+    status, page = get(dict(params, cursor=page["next_cursor"], limit="1"))
+    assert (status, page["rows"], page["next_cursor"]) == (
+        200,
+        [["2020", "Rabat", "10"]],
+        None,
+    )
+
+
+def test_unknown_parameters_do_not_change_the_response(get):
+    _, whole = get({})
+    assert get({"_": "1712345678", "utm_campaign": "news"}) == (200, whole)
+
+
+def test_unknown_column_is_a_400(get):
+    assert get({"filter.province": "Rabat"}) == (400, "unknown column: province")
+    assert get({"columns": "annee,province"}) == (400, "unknown column: province")
@@ -0,0 +1,90 @@
+import os
+import time
+import signal
+import threading
+import multiprocessing
+
+import data_get_requests
+import mimic_data_gov_ma
+from crawl_frontier import Frontier
+from manifest import Manifest
+
+FRONTIER = "frontier.sqlite3"
+
+
+def test_requeue(tmp_path):
+    frontier = Frontier(str(tmp_path / FRONTIER))
+    for url in ["a", "b", "c"]:
+        frontier.add("download", url, "theme")
+    first = frontier.claim("worker-0")
+    frontier.claim("worker-0")
+    frontier.claim("worker-1")
+    frontier.done(first["id"])
+
+    assert frontier.requeue("worker-0", max_attempts=3) == (1, 0)
+    assert frontier.counts() == {"done": 1, "pending": 1, "running": 1}
+
+    # the same item handed out again and again is failed rather than requeued forever
+    assert frontier.claim("worker-0")["url"] == "b"
+    assert frontier.requeue("worker-0", max_attempts=2) == (0, 1)
+    assert frontier.counts() == {"done": 1, "failed": 1, "running": 1}
+
+    # a retried item gets all its attempts again
+    assert frontier.retry_failed() == 1
+    assert frontier.claim("worker-0")["url"] == "b"
+    [item] = [item for item in frontier.items("download", None) if item["url"] == "b"]
+    assert item["attempts"] == 1
+    assert frontier.requeue("worker-0", max_attempts=2) == (1, 0)
+    frontier.close()
+
+
+def test_crawl_with_spawned_workers(stub):
+    # the workers start from a fresh import, with the settings of this process
+    themes = mimic_data_gov_ma.crawl_sequential(workers=3)
+    _, files = mimic_data_gov_ma.summarize(themes)
+    assert len(files) == mimic_data_gov_ma.THEMES * mimic_data_gov_ma.DATASETS_PER_THEME
+
+    frontier = Frontier(FRONTIER)
+    assert set(frontier.counts()) == {"done"}
+    frontier.close()
+
+
+def test_items_of_a_killed_worker_are_requeued(stub, monkeypatch):
+    monkeypatch.setattr(mimic_data_gov_ma, "THEMES", 1)
+    monkeypatch.setattr(mimic_data_gov_ma, "DATASETS_PER_THEME", 6)
+    monkeypatch.setattr(mimic_data_gov_ma.StubHandler, "latency", 0.3)
+
+    frontier = Frontier(FRONTIER)
+    data_get_requests.seed_frontier(frontier)
+    thread = threading.Thread(
+        target=data_get_requests.run_workers, args=(2, FRONTIER), daemon=True
+    )
+    thread.start()
+
+    deadline = time.monotonic() + 60
+    running = []
+    while not running and time.monotonic() < deadline:
+        time.sleep(0.05)
+        running = list(frontier.items("dataset_page", status="running"))
+        running += list(frontier.items("download", status="running"))
+    [victim] = [
+        process
+        for process in multiprocessing.active_children()
+        if process.name == running[0]["worker"]
+    ]
+    os.kill(victim.pid, signal.SIGKILL)
+
+    thread.join(timeout=120)
+    assert not thread.is_alive()
+    assert set(frontier.counts()) == {"done"}
+    [item] = [
+        item
+        for item in frontier.items(running[0]["kind"])
+        if item["id"] == running[0]["id"]
+    ]
+    assert item["attempts"] == 2
+
+    themes = data_get_requests.merge_downloads(frontier, Manifest())
+    assert len(themes[0].datasets) == 6
+    assert len(os.listdir(os.path.join("data", "Theme0"))) == 6
+    frontier.close()
@@ -0,0 +1,127 @@
+import pytest
+
+import getS3Data
+import getS3DataAggregate
+import getS3DataBatch
+import getS3DataSearch
+import getS3DataStats
+import getS3DataTheme
+import lambda_function
+import router
+import s3_datasets
+
+CSV = "annee,region\n2014,Rabat\n2015,Fès\n2016,Rabat\n"
+
+
+@pytest.fixture
+def handlers(s3, upload_csv, monkeypatch):
+    for module in [getS3Data, lambda_function, router]:
+        monkeypatch.setattr(module, "s3_client", s3)
+    upload_csv("t", "d", CSV)
+
+    def call(params, headers=None):
+        # the same request to every handler serving the dataset endpoint
+        events = [
+            (
+                getS3Data,
+                {"queryStringParameters": dict(params, theme="t", dataset="d")},
+            ),
+            (
+                lambda_function,
+                {
+                    "pathParameters": {"themeName": "t", "datasetName": "d.csv"},
+                    "queryStringParameters": params,
+                },
+            ),
+            (router, {"path": "/data/t/d", "queryStringParameters": params}),
+            (
+                router,
+                {
+                    "path": "/prod/data",
+                    "requestContext": {"stage": "prod"},
+                    "queryStringParameters": dict(params, theme="t", dataset="d"),
+                },
+            ),
+        ]
+        responses = []
+        for module, event in events:
+            s3_datasets.response_cache.clear()
+            event["headers"] = headers
+            response = module.lambda_handler(event, None)
+            responses.append(response)
+        return responses
+
+    return call
+
+
+@pytest.mark.parametrize(
+    "params, headers",
+    [
+        ({}, None),
+        ({"offset": "1", "limit": "1"}, None),
+        ({"filter.region": "Rabat", "columns": "annee"}, None),
+        ({"format": "csv"}, {"Accept-Encoding": "gzip"}),
+        ({"format": "ndjson", "limit": "2"}, None),
+    ],
+)
+def test_every_handler_answers_the_same(handlers, params, headers):
+    first, *others = handlers(params, headers)
+    assert first["statusCode"] == 200
+    assert all(response == first for response in others)
+
+
+def test_not_modified(handlers):
+    [etag] = {response["headers"]["ETag"] for response in handlers({})}
+    for response in handlers({}, {"If-None-Match": etag}):
+        assert response["statusCode"] == 304
+
+
+def test_offloaded(handlers, monkeypatch):
+    monkeypatch.setattr(s3_datasets, "INLINE_MAX_BYTES", 10)
+    for response in handlers({"format": "csv"}):
+        assert response["statusCode"] == 303
+        assert response["headers"]["Cache-Control"] == "no-store"
+
+
+def test_errors(handlers):
+    for response in handlers({"limit": "x"}):
+        assert response["statusCode"] == 400
+    for response in handlers({"filter.province": "x"}):
+        assert response["statusCode"] == 400
+
+
+@pytest.mark.parametrize(
+    "module, route, params",
+    [
+        (getS3DataTheme, "/themes", {"theme": "t"}),
+        (getS3DataTheme, "/catalog", {}),
+        (getS3DataStats, "/stats", {"theme": "t", "dataset": "d"}),
+        (getS3DataSearch, "/search", {"q": "rabat"}),
+        (getS3DataSearch, "/search", {}),
+        (getS3DataBatch, "/batch", {"datasets": "t/d,t/nope"}),
+        (getS3DataBatch, "/batch", {"theme": "t", "format": "csv"}),
+        (
+            getS3DataAggregate,
+            "/aggregate",
+            {"theme": "t", "dataset": "d", "by": "region"},
+        ),
+        (getS3DataAggregate, "/aggregate", {"theme": "t", "dataset": "d", "by": "x"}),
+    ],
+)
+def test_legacy_functions_answer_as_the_router(
+    s3, upload_csv, monkeypatch, module, route, params
+):
+    for handler in [module, router]:
+        monkeypatch.setattr(handler, "s3_client", s3)
+    upload_csv("t", "d", CSV)
+
+    responses = []
+    for handler, event in [
+        (module, {"queryStringParameters": params}),
+        (router, {"path": route, "queryStringParameters": params}),
+    ]:
+        response = handler.lambda_handler(dict(event, headers=None), None)
+        # the second call is served from the memory of the warm container
+        response["headers"].pop("X-Cache", None)
+        responses.append(response)
+    assert responses[0] == responses[1]
@@ -0,0 +1,89 @@
+import os
+import time
+
+import pytest
+
+import data_get_requests
+import mimic_data_gov_ma
+from http_cache import HttpCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return HttpCache(str(tmp_path / "cache"), ttl=60, max_bytes=250)
+
+
+def age(cache, url, seconds):
+    # moves an entry back in time, for its TTL and for the eviction order
+    body_path, _ = cache._paths(url)
+    then = time.time() - seconds
+    os.utime(body_path, (then, then))
+
+
+def test_get_after_set(cache):
+    assert cache.get("a") is None
+    cache.set("a", b"page", 200)
+    assert cache.get("a") == (200, b"page")
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_expired_entries_are_missing(cache, monkeypatch):
+    cache.set("a", b"page")
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.get("a") is None
+    # stored again, it is fresh again
+    cache.set("a", b"page")
+    assert cache.get("a") == (200, b"page")
+
+
+def test_least_recently_used_entries_are_evicted(cache):
+    for n, url in enumerate(["a", "b"]):
+        cache.set(url, b"x" * 100)
+        age(cache, url, 100 - n * 10)
+    # a hit makes 'a' the most recently used
+    assert cache.get("a") is not None
+
+    cache.set("c", b"x" * 100)
+    assert cache.size() == 200
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+
+def test_disabled_cache_stores_nothing(cache):
+    cache.enabled = False
+    cache.set("a", b"page")
+    assert cache.get("a") is None
+    assert cache.size() == 0
+
+
+def test_dataset_page_is_fetched_and_parsed_once(stub, monkeypatch):
+    monkeypatch.setattr(data_get_requests, "http_cache", HttpCache("cache"))
+    paths = []
+    do_get = mimic_data_gov_ma.StubHandler.do_GET
+
+    def do_GET(handler):
+        paths.append(handler.path)
+        do_get(handler)
+
+    monkeypatch.setattr(mimic_data_gov_ma.StubHandler, "do_GET", do_GET)
+
+    url = f"{stub}/data/fr/dataset/theme0-ds1"
+    page_info = data_get_requests.get_dataset_page(url)
+    assert page_info["name"] == "theme0-ds1"
+    assert page_info["tags"] == ["tag-theme0-ds1", "stub"]
+    assert page_info["download_link"] == f"{stub}/download/theme0-ds1.csv"
+    assert page_info["resources"] == [
+        {
+            "name": "theme0-ds1",
+            "url": "/data/fr/dataset/theme0-ds1/resource/r1",
+            "format": "csv",
+            "download_link": f"{stub}/download/theme0-ds1.csv",
+        }
+    ]
+    assert paths == ["/data/fr/dataset/theme0-ds1"]
+
+    # the next run reads it from the cache
+    assert data_get_requests.get_dataset_page(url) == page_info
+    assert len(paths) == 1
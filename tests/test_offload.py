@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+import getS3Data
+import s3_datasets
+from dataset_formats import to_ndjson
+
+# short values: the JSON of the rows is more than twice the size of the CSV
+CSV = "a,b\n" + "".join(f"{n % 10},{n % 7}\n" for n in range(1000))
+
+
+@pytest.fixture
+def get(s3, upload_csv, monkeypatch):
+    monkeypatch.setattr(getS3Data, "s3_client", s3)
+    upload_csv("t", "d", CSV)
+
+    def get(**params):
+        event = {"queryStringParameters": {"theme": "t", "dataset": "d", **params}}
+        return getS3Data.lambda_handler(event, None)
+
+    return get
+
+
+def test_small_dataset_is_inline(get):
+    response = get()
+    assert response["statusCode"] == 200
+    assert len(json.loads(response["body"])) == 1001
+
+
+def test_large_object_is_offloaded(get, monkeypatch):
+    monkeypatch.setattr(s3_datasets, "INLINE_MAX_BYTES", 1000)
+
+    response = get()
+    assert response["statusCode"] == 200
+    assert response["headers"]["Cache-Control"] == "no-store"
+    download = json.loads(response["body"])
+    assert "/csv_data/t/d.csv.gz?" in download["url"]
+    assert download["content_encoding"] == "gzip"
+
+    # the CSV itself is asked for: the client is sent to it
+    response = get(format="csv")
+    assert response["statusCode"] == 303
+    location = response["headers"]["Location"]
+    assert location.split("?")[0] == download["url"].split("?")[0]
+
+
+def test_response_larger_than_its_object_is_offloaded(get, monkeypatch):
+    # the object fits, its JSON does not
+    monkeypatch.setattr(s3_datasets, "INLINE_MAX_BYTES", len(CSV) + 1)
+
+    response = get()
+    assert response["statusCode"] == 200
+    assert "url" in json.loads(response["body"])
+    assert "url" in json.loads(get(format="ndjson")["body"])
+    # the CSV is sent as it is stored
+    assert get(format="csv")["statusCode"] == 200
+    # nothing was cached for the offloaded response, a presigned URL expires
+    assert s3_datasets.response_cache.stats()["entries"] == 1
+
+
+def test_pages_are_not_offloaded(get, monkeypatch):
+    monkeypatch.setattr(s3_datasets, "INLINE_MAX_BYTES", 1000)
+    response = get(limit="500")
+    assert response["statusCode"] == 200
+    assert len(json.loads(response["body"])["rows"]) == 500
+
+
+def test_ndjson_stops_reading_once_too_large(get, monkeypatch):
+    read = []
+
+    def counted(*args):
+        for row in to_ndjson(*args):
+            read.append(row)
+            yield row
+
+    monkeypatch.setattr(s3_datasets, "to_ndjson", counted)
+    # the object fits, its NDJSON does not: each line is '{"a": "n", "b": "n"}\n', 21 bytes
+    monkeypatch.setattr(s3_datasets, "INLINE_MAX_BYTES", len(CSV) + 1)
+    assert "url" in json.loads(get(format="ndjson")["body"])
+    assert len(read) == (len(CSV) + 1) // 21 + 1 < 1000
+
+    # a page is never offloaded, it is read whole
+    read.clear()
+    response = get(format="ndjson", limit="500")
+    assert response["statusCode"] == 200
+    assert len(response["body"].splitlines()) == len(read) == 500
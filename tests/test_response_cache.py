@@ -0,0 +1,104 @@
+import time
+
+import pytest
+
+from response_cache import ResponseCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def source():
+    # an S3 object: its ETag, and the calls made to it
+    class Source:
+        etag = '"1"'
+        stats = 0
+        loads = 0
+
+        def stat(self):
+            self.stats += 1
+            return {"etag": self.etag}
+
+        def load(self, meta):
+            self.loads += 1
+            return f"built from {meta['etag']}", 10
+
+    return Source()
+
+
+def test_hit_within_the_ttl(clock, source):
+    cache = ResponseCache(max_bytes=100, ttl=30)
+    assert cache.get_or_load("a", source.stat, source.load) == ('built from "1"', False)
+    assert cache.get_or_load("a", source.stat, source.load) == ('built from "1"', True)
+    assert (source.stats, source.loads) == (1, 1)
+    assert cache.stats() == {
+        "hits": 1,
+        "misses": 1,
+        "revalidations": 0,
+        "evictions": 0,
+        "entries": 1,
+        "bytes": 10,
+    }
+
+
+def test_revalidated_after_the_ttl(clock, source):
+    cache = ResponseCache(max_bytes=100, ttl=30)
+    cache.get_or_load("a", source.stat, source.load)
+
+    # same ETag: only the object is checked, and the entry is fresh again
+    clock[0] += 31
+    assert cache.get_fresh("a") is None
+    assert cache.get_or_load("a", source.stat, source.load) == ('built from "1"', True)
+    assert (source.stats, source.loads) == (2, 1)
+    assert cache.get_fresh("a") == 'built from "1"'
+
+    # new ETag: rebuilt
+    source.etag = '"2"'
+    clock[0] += 31
+    assert cache.get_or_load("a", source.stat, source.load) == ('built from "2"', False)
+    assert (source.stats, source.loads) == (3, 2)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["revalidations"]) == (1, 2, 1)
+    assert (stats["entries"], stats["bytes"]) == (1, 10)
+
+
+def test_get_fresh_is_not_counted(clock, source):
+    cache = ResponseCache(max_bytes=100, ttl=30)
+    assert cache.get_fresh("a") is None
+    cache.get_or_load("a", source.stat, source.load)
+    assert cache.get_fresh("a") == 'built from "1"'
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (0, 1)
+
+
+def test_least_recently_used_entries_are_evicted(clock, source):
+    cache = ResponseCache(max_bytes=25, ttl=30)
+    cache.get_or_load("a", source.stat, source.load)
+    cache.get_or_load("b", source.stat, source.load)
+    # a hit makes 'a' the most recently used
+    cache.get_or_load("a", source.stat, source.load)
+
+    cache.get_or_load("c", source.stat, source.load)
+    assert list(cache.entries) == ["a", "c"]
+    stats = cache.stats()
+    assert (stats["evictions"], stats["bytes"]) == (1, 20)
+
+
+def test_entry_larger_than_the_budget_is_not_stored(clock, source):
+    cache = ResponseCache(max_bytes=25, ttl=30)
+    cache.get_or_load("a", source.stat, source.load)
+
+    value, hit = cache.get_or_load("b", source.stat, lambda meta: ("large", 30))
+    assert (value, hit) == ("large", False)
+    assert list(cache.entries) == ["a"]
+    assert cache.stats()["evictions"] == 0
+
+    # nor kept when a rebuild outgrows it
+    source.etag = '"2"'
+    clock[0] += 31
+    cache.get_or_load("a", source.stat, lambda meta: ("large", 30))
+    assert (len(cache.entries), cache.stats()["bytes"]) == (0, 0)
@@ -0,0 +1,189 @@
+import os
+import gzip
+import json
+import itertools
+
+import pytest
+
+import catalog
+from csv_index import write_index
+from dataset_query import QueryError
+from search_index import (
+    SearchIndex,
+    build_search_index,
+    parse_limit,
+    tag_key,
+    tokenize,
+    write_search_index,
+)
+
+ENTRIES = [
+    {
+        "Theme": "Agriculture",
+        "Name": "cheptel-bovin",
+        "Title": "Cheptel bovin par région",
+        "Tags": ["Élevage"],
+        "ColumnNames": ["Année", "Région", "Têtes"],
+    },
+    {
+        "Theme": "Agriculture",
+        "Name": "production-cereales",
+        "Title": "Production des céréales",
+        "Tags": ["Agriculture", "Céréales"],
+        "ColumnNames": ["Année", "Région", "Production", "Prix"],
+    },
+    {
+        "Theme": "Economie",
+        "Name": "indice-prix",
+        "Title": "Indice des prix",
+        "Tags": ["Économie"],
+        "ColumnNames": ["Mois", "Indice"],
+    },
+    {
+        "Theme": "Economie",
+        "Name": "statistiques",
+        "Title": "الإحصاءات الاقتصادية",
+        "Tags": ["اقتصاد"],
+        "ColumnNames": ["السنة"],
+    },
+]
+
+
+@pytest.fixture
+def index():
+    return SearchIndex(build_search_index(ENTRIES))
+
+
+def names(results):
+    return [result["Name"] for result in results]
+
+
+def test_tokenize():
+    assert tokenize("Économie et Région de l'Oriental") == [
+        "economie",
+        "region",
+        "oriental",
+    ]
+    assert tokenize("RÉGION") == tokenize("region")
+    assert tokenize(None) == tokenize("") == []
+    assert tag_key(" Élevage ") == "elevage"
+
+
+def test_tokenize_arabic():
+    # hamza and madda variants of alef, teh marbuta and alef maksura
+    assert tokenize("الإحصاءات") == tokenize("الاحصاءات")
+    assert tokenize("آفاق") == tokenize("افاق")
+    assert tokenize("مدرسة") == ["مدرسه"]
+    assert tokenize("مستشفى") == ["مستشفي"]
+    # harakat and tatweel
+    assert tokenize("مَدْرَسَةٌ") == ["مدرسه"]
+    assert tokenize("المـغرب") == ["المغرب"]
+    # stop words
+    assert tokenize("السكان في المغرب") == ["السكان", "المغرب"]
+
+
+def test_prefix_of_the_last_token(index):
+    assert names(index.search("chep")) == ["cheptel-bovin"]
+    assert names(index.search("econ")) == ["indice-prix"]
+    assert names(index.search("الاحصا")) == ["statistiques"]
+    # only the last token is a prefix
+    assert names(index.search("chep bovin")) == ["cheptel-bovin"]
+    assert index.search("bov chep") == index.search("chep") != []
+    assert index.search("zzz") == []
+
+
+def test_ranking(index):
+    # the name and title weigh more than the column headers
+    results = index.search("prix")
+    assert names(results) == ["indice-prix", "production-cereales"]
+    assert results[0]["Score"] == pytest.approx(3 * results[1]["Score"])
+
+    # every token matched first, then fewer
+    assert names(index.search("cheptel region")) == [
+        "cheptel-bovin",
+        "production-cereales",
+    ]
+    assert names(index.search("production annee")) == [
+        "production-cereales",
+        "cheptel-bovin",
+    ]
+
+    # the rarer a token, the more it counts
+    [cheptel] = index.search("cheptel")
+    [region, _] = index.search("region")
+    assert cheptel["Score"] > region["Score"]
+    assert region["Name"] == "cheptel-bovin"
+
+
+def test_filters_and_limit(index):
+    assert names(index.search(tag="élevage")) == ["cheptel-bovin"]
+    assert names(index.search(tag="ELEVAGE ")) == ["cheptel-bovin"]
+    assert names(index.search(theme="Economie")) == ["indice-prix", "statistiques"]
+    assert names(index.search("annee", tag="cereales")) == ["production-cereales"]
+    assert index.search("region", theme="Economie") == []
+    assert index.search(tag="Céréales", theme="Economie") == []
+    assert index.search(tag="unknown") == []
+    assert index.search(theme="Unknown") == []
+
+    assert names(index.search("annee", limit=1)) == ["cheptel-bovin"]
+    assert len(index.search(limit=3)) == 3
+    [result] = index.search("têtes")
+    assert dict(result, Score=None) == {
+        "Theme": "Agriculture",
+        "Name": "cheptel-bovin",
+        "Title": "Cheptel bovin par région",
+        "Tags": ["Élevage"],
+        "Score": None,
+    }
+
+
+def test_postings_round_trip(index):
+    data = gzip.compress(json.dumps(build_search_index(ENTRIES)).encode("utf-8"))
+    loaded = SearchIndex.loads(data)
+    assert loaded.search("region annee") == index.search("region annee")
+
+    raw = build_search_index(ENTRIES)
+    for token, (deltas, scores) in raw["postings"].items():
+        ids = list(itertools.accumulate(deltas))
+        assert len(ids) == len(scores)
+        assert ids == sorted(set(ids))
+        expected = [
+            doc_id
+            for doc_id, entry in enumerate(ENTRIES)
+            if token
+            in tokenize(entry["Name"].replace("-", " "))
+            + tokenize(entry["Title"])
+            + [t for tag in entry["Tags"] for t in tokenize(tag)]
+            + [t for column in entry["ColumnNames"] for t in tokenize(column)]
+        ]
+        assert ids == expected, token
+    assert list(itertools.accumulate(raw["tags"]["cereales"])) == [1]
+    assert list(itertools.accumulate(raw["postings"]["annee"][0])) == [0, 1]
+
+    with pytest.raises(ValueError):
+        SearchIndex(dict(raw, version=0))
+
+
+def test_write_search_index(tmp_path):
+    csv_dir = str(tmp_path / "csv_data")
+    os.makedirs(os.path.join(csv_dir, "t"))
+    path = os.path.join(csv_dir, "t", "d.csv")
+    with open(path, "w") as file:
+        file.write("Région,Têtes\nRabat,12\n")
+    write_index(path)
+    manifest = {"t/d.xlsx": {"metadata": {"title": "Cheptel", "tags": ["Élevage"]}}}
+    catalog.write_catalogs(csv_dir, {"t/d.xlsx": {"outputs": [path]}}, manifest)
+
+    with open(write_search_index(csv_dir), "rb") as file:
+        index = SearchIndex.loads(file.read())
+    # the column headers come from the row offset index
+    assert names(index.search("tetes")) == ["d"]
+    assert names(index.search("cheptel", tag="elevage", theme="t")) == ["d"]
+
+
+def test_parse_limit():
+    assert parse_limit({}) == 20
+    assert parse_limit({"limit": "5"}) == 5
+    for limit in ["x", "0", "101"]:
+        with pytest.raises(QueryError):
+            parse_limit({"limit": limit})
@@ -0,0 +1,147 @@
+import os
+import sys
+import json
+import hashlib
+import subprocess
+import tracemalloc
+
+import pytest
+import requests
+
+import data_get_requests
+import mimic_data_gov_ma
+
+SIZE = 1024 * 1024
+
+
+def large(size=SIZE):
+    return b"0123456789abcdef" * (size // 16)
+
+
+def test_streams_to_the_final_path(stub):
+    status, headers, sha256, size = data_get_requests.stream_download(
+        f"{stub}/large/{SIZE}", "file.csv"
+    )
+    assert (status, size) == (200, SIZE)
+    assert sha256 == hashlib.sha256(large()).hexdigest()
+    assert headers["ETag"]
+    with open("file.csv", "rb") as file:
+        assert file.read() == large()
+    assert os.listdir() == ["file.csv"]
+
+
+@pytest.fixture
+def remote_stub(stub):
+    # the stub in its own process, so that its payloads are not traced with the download
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            "import time, mimic_data_gov_ma as m\n"
+            "print(m.start_stub_server()[1], flush=True)\n"
+            "time.sleep(60)",
+        ],
+        cwd=os.path.dirname(os.path.abspath(mimic_data_gov_ma.__file__)),
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        yield process.stdout.readline().strip()
+    finally:
+        process.kill()
+        process.wait()
+
+
+def test_memory_stays_flat(remote_stub):
+    size = 64 * 1024 * 1024
+    tracemalloc.start()
+    try:
+        data_get_requests.stream_download(f"{remote_stub}/large/{size}", "file.csv")
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert os.path.getsize("file.csv") == size
+    assert peak < 1024 * 1024
+
+
+def test_resumes_truncated_responses(stub, monkeypatch):
+    monkeypatch.setattr(mimic_data_gov_ma.StubHandler, "truncate_after", SIZE * 2 // 5)
+    status, _, sha256, size = data_get_requests.stream_download(
+        f"{stub}/large/{SIZE}", "file.csv"
+    )
+    # the first transfer was cut, the rest came from ranged requests
+    assert (status, size) == (206, SIZE)
+    assert sha256 == hashlib.sha256(large()).hexdigest()
+    with open("file.csv", "rb") as file:
+        assert file.read() == large()
+    assert os.listdir() == ["file.csv"]
+
+
+def test_resumes_the_part_file_of_a_previous_run(stub, monkeypatch):
+    url = f"{stub}/large/{SIZE}"
+    monkeypatch.setattr(mimic_data_gov_ma.StubHandler, "truncate_after", SIZE // 10)
+    with pytest.raises(requests.ConnectionError):
+        data_get_requests.stream_download(url, "file.csv", attempts=2)
+    assert not os.path.exists("file.csv")
+    # what was received before each cut, except the chunk being read
+    assert 0 < os.path.getsize("file.csv.part") < SIZE // 5
+    with open("file.csv.part.json") as file:
+        assert json.load(file)["validator"]
+
+    monkeypatch.setattr(mimic_data_gov_ma.StubHandler, "truncate_after", None)
+    status, _, sha256, size = data_get_requests.stream_download(url, "file.csv")
+    assert (status, size) == (206, SIZE)
+    assert sha256 == hashlib.sha256(large()).hexdigest()
+    assert os.listdir() == ["file.csv"]
+
+
+def test_restarts_when_the_file_changed_upstream(stub):
+    with open("file.csv.part", "wb") as file:
+        file.write(b"x" * 1000)
+    with open("file.csv.part.json", "w") as file:
+        json.dump({"url": f"{stub}/large/{SIZE}", "validator": '"stale"'}, file)
+
+    # If-Range does not match: the whole file comes back and replaces the partial one
+    status, _, sha256, size = data_get_requests.stream_download(
+        f"{stub}/large/{SIZE}", "file.csv"
+    )
+    assert (status, size) == (200, SIZE)
+    assert sha256 == hashlib.sha256(large()).hexdigest()
+
+
+def test_restarts_after_416(stub):
+    # a partial file longer than the remote one, e.g. left by an earlier, larger version
+    with open("file.csv.part", "wb") as file:
+        file.write(b"x" * (SIZE + 1))
+
+    status, _, sha256, size = data_get_requests.stream_download(
+        f"{stub}/large/{SIZE}", "file.csv"
+    )
+    assert (status, size) == (200, SIZE)
+    assert sha256 == hashlib.sha256(large()).hexdigest()
+    assert os.listdir() == ["file.csv"]
+
+
+def test_checksum(stub):
+    url = f"{stub}/large/{SIZE}"
+    expected = hashlib.sha256(large()).hexdigest()
+    _, _, sha256, _ = data_get_requests.stream_download(
+        url, "good.csv", expected_sha256=expected.upper()
+    )
+    assert sha256 == expected
+
+    with pytest.raises(ValueError, match="checksum mismatch"):
+        data_get_requests.stream_download(url, "bad.csv", expected_sha256="0" * 64)
+    # neither the file nor a partial file to resume from are kept
+    assert sorted(os.listdir()) == ["good.csv"]
+
+
+def test_conditional_request(stub):
+    url = f"{stub}/download/file.csv"
+    _, headers, _, _ = data_get_requests.stream_download(url, "file.csv")
+    status, _, sha256, size = data_get_requests.stream_download(
+        url, "file.csv", {"If-None-Match": headers["ETag"]}
+    )
+    assert (status, sha256, size) == (304, None, None)
+    with open("file.csv", "rb") as file:
+        assert file.read() == mimic_data_gov_ma.PAYLOAD